@@ -1,12 +1,10 @@
-import sys, os
+import sys, os, time
 from pathlib import Path
 from PyQt5 import QtGui, QtWidgets
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen
 from PyQt5.QtCore import Qt, QCoreApplication, QRect, pyqtSignal,QTimer
 from PyQt5.QtCore import Qt, QLineF,QUrl
 from PyQt5.QtGui import QPainter, QPen
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-import cv2
 import numpy as np
 from util.QtFunc import *
 from util.xmlfile import *
@@ -15,21 +13,31 @@ from util.config import load_config, save_config
 from GUI.UI_Main import Ui_MainWindow
 from GUI.message import LabelInputDialog
 
+from util import startup_profile
+
 sys.path.append("smapro")
-from sampro.LabelQuick_TW import Anything_TW
-from sampro.LabelVideo_TW import AnythingVideo_TW, CONFIG_KEY_SAM_CHECKPOINT
+# 模型相关的重型依赖（torch、hydra、cv2 等）在首次使用时才导入，窗口可以先显示出来
+from sampro.model_paths import CONFIG_KEY_SAM_CHECKPOINT, split_checkpoint_variant
+from sampro.auto_propose import (
+    AUTO_PROPOSE_PRESETS,
+    CONFIG_KEY_AUTO_PROPOSE_ON_OPEN,
+    CONFIG_KEY_AUTO_PROPOSE_PRESET,
+    resolve_preset,
+)
 
 from PyQt5.QtCore import QThread, pyqtSignal, QTimer
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_SAM_CHECKPOINT_DIR = PROJECT_ROOT / "sampro" / "checkpoints"
+# 视频标注会话保存在帧目录下，标注结束或关闭程序时写入，可通过“恢复视频标注会话”继续
+VIDEO_SESSION_DIRNAME = ".sam2_session"
 
 class VideoProcessingThread(QThread):
     finished = pyqtSignal()  # 完成信号
     frame_ready = pyqtSignal(object)  # 添加新信号用于传递处理后的帧
     progress_changed = pyqtSignal(int, int)  # 当前帧，总帧数
 
-    def __init__(self, avt, video_path, output_dir, prompts, label_map, save_path):
+    def __init__(self, avt, video_path, output_dir, prompts, label_map, save_path, resume=False):
         super().__init__()
         self.AVT = avt
         self.video_path = video_path
@@ -37,65 +45,176 @@ class VideoProcessingThread(QThread):
         self.prompts = prompts or []
         self.label_map = label_map or {}
         self.save_path = save_path
+        # resume=True 时从 output_dir 下保存的会话继续跟踪，不再抽帧和添加提示点
+        self.resume = resume
+        self.session_ready = False
         self.xml_messages = []
         os.makedirs(self.output_dir, exist_ok=True)
         self.total_frames = 0
 
     def run(self):
+        self.AVT.stop_requested = False
         try:
             # 创建输出目录和mask子目录
             os.makedirs(self.output_dir, exist_ok=True)
             mask_dir = os.path.join(self.output_dir, "mask")
             os.makedirs(mask_dir, exist_ok=True)
 
-            # 提取视频帧
-            _, saved_count = self.AVT.extract_frames_from_video(self.video_path, self.output_dir, fps=2)
-            self.total_frames = saved_count
-            self.progress_changed.emit(0, self.total_frames)
-
-            self.AVT.set_video(self.output_dir)
-            self.AVT.inference(self.output_dir)
-            self.AVT.reset_object_prompts()
-
-            prompts_by_object = {}
-            for prompt in self.prompts:
-                obj_id = prompt.get("obj_id")
-                if obj_id is None:
-                    continue
-                prompts_by_object.setdefault(obj_id, []).append(prompt)
-
-            for obj_id, obj_prompts in prompts_by_object.items():
-                for prompt in obj_prompts:
-                    coords = prompt.get("coords")
-                    label = prompt.get("label")
-                    if coords is None or label is None:
-                        continue
-                    self.AVT.Set_Clicked(list(coords), label, obj_id=obj_id)
-                self.AVT.add_new_points_or_box(obj_id=obj_id)
+            if self.resume:
+                start_frame = self.load_session()
+            else:
+                start_frame = 0
+                self.start_session()
+            self.session_ready = True
 
             # 获取处理后的帧并发送信号
             def progress_callback(frame_idx, total_frames):
                 total = self.total_frames or total_frames or 0
                 self.progress_changed.emit(frame_idx + 1, total)
 
-            processed_frame, xml_messages = self.AVT.Draw_Mask_at_frame(
-                save_image_path=mask_dir,
-                save_path=self.save_path,
-                label_map=self.label_map,
-                progress_callback=progress_callback,
-            )  # 使用新的mask_dir路径
-            self.xml_messages = xml_messages
-            self.frame_ready.emit(processed_frame)  # 发送处理后的帧
+            if start_frame < self.total_frames:
+                processed_frame, xml_messages = self.AVT.Draw_Mask_at_frame(
+                    start_frame=start_frame,
+                    save_image_path=mask_dir,
+                    save_path=self.save_path,
+                    label_map=self.label_map,
+                    progress_callback=progress_callback,
+                )  # 使用新的mask_dir路径
+                self.xml_messages = xml_messages
+                self.frame_ready.emit(processed_frame)  # 发送处理后的帧
+            else:
+                print("会话中的所有帧均已跟踪完成")
 
         except Exception as e:
             print(f"处理出错: {str(e)}")
             import traceback
             traceback.print_exc()
+        self.save_session()
         self.finished.emit()
 
+    def start_session(self):
+        # 提取视频帧
+        _, saved_count = self.AVT.extract_frames_from_video(self.video_path, self.output_dir, fps=2)
+        self.total_frames = saved_count
+        self.progress_changed.emit(0, self.total_frames)
+
+        prompts_by_object = {}
+        for prompt in self.prompts:
+            obj_id = prompt.get("obj_id")
+            if obj_id is None:
+                continue
+            prompts_by_object.setdefault(obj_id, []).append(prompt)
+
+        self.AVT.set_video(self.output_dir)
+        self.AVT.inference(self.output_dir, num_objects=len(prompts_by_object))
+        self.AVT.reset_object_prompts()
+
+        for obj_id, obj_prompts in prompts_by_object.items():
+            for prompt in obj_prompts:
+                coords = prompt.get("coords")
+                label = prompt.get("label")
+                if coords is None or label is None:
+                    continue
+                self.AVT.Set_Clicked(list(coords), label, obj_id=obj_id)
+            self.AVT.add_new_points_or_box(obj_id=obj_id)
+
+    def load_session(self):
+        """恢复帧目录下保存的会话，返回继续跟踪的起始帧。"""
+        session_dir = os.path.join(self.output_dir, VIDEO_SESSION_DIRNAME)
+        extra = self.AVT.load_session(session_dir, video_dir=self.output_dir)
+        self.video_path = extra.get("video_path", self.video_path)
+        self.label_map = {int(obj_id): name for obj_id, name in extra.get("label_map", {}).items()}
+        if not self.save_path:
+            self.save_path = extra.get("save_path")
+        self.total_frames = self.AVT.inference_state["num_frames"]
+        start_frame = self.AVT.next_untracked_frame()
+        self.progress_changed.emit(start_frame, self.total_frames)
+        return start_frame
+
+    def save_session(self):
+        # 抽帧或加载失败时推理状态可能仍是上一个视频的，不能写到当前帧目录
+        if not self.session_ready or self.AVT.inference_state is None:
+            return
+        try:
+            self.AVT.save_session(
+                os.path.join(self.output_dir, VIDEO_SESSION_DIRNAME),
+                extra={
+                    "video_path": self.video_path,
+                    "label_map": {str(obj_id): name for obj_id, name in self.label_map.items()},
+                    "save_path": self.save_path,
+                },
+            )
+        except Exception as e:
+            print(f"保存视频会话出错: {str(e)}")
+
+
+class ProposalThread(QThread):
+    proposals_ready = pyqtSignal(str, object)  # 图片路径，候选框列表
+
+    def __init__(self, at, image_path, image, preset, existing_boxes):
+        super().__init__()
+        self.AT = at
+        self.image_path = image_path
+        self.image = image
+        self.preset = preset
+        self.existing_boxes = existing_boxes
+        # 在主线程中取当前图像特征的快照，切换图片后也不会用错特征
+        self.image_predictor = at.Current_Embedding()
+
+    def run(self):
+        proposals = []
+        try:
+            start = time.perf_counter()
+            proposals = self.AT.Auto_Propose(
+                self.image,
+                preset=self.preset,
+                existing_boxes=self.existing_boxes,
+                image_predictor=self.image_predictor,
+            )
+            print(f"已生成 {len(proposals)} 个候选框（{self.preset}），用时 {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"生成候选框出错: {str(e)}")
+            import traceback
+            traceback.print_exc()
+        self.proposals_ready.emit(self.image_path, proposals)
+
+
+class ModelLoadThread(QThread):
+    progress_changed = pyqtSignal(int, int, str)  # 当前步骤，总步骤数，说明
+    models_ready = pyqtSignal(object, object)  # Anything_TW，AnythingVideo_TW
+    load_failed = pyqtSignal(str)
+
+    def run(self):
+        total_steps = 3
+        try:
+            self.progress_changed.emit(0, total_steps, "导入模型代码")
+            from sampro.LabelQuick_TW import Anything_TW
+            from sampro.LabelVideo_TW import AnythingVideo_TW
+            startup_profile.mark("导入模型代码")
+
+            self.progress_changed.emit(1, total_steps, "加载图片模型")
+            at = Anything_TW()
+            startup_profile.mark("加载图片模型")
+
+            self.progress_changed.emit(2, total_steps, "加载视频模型")
+            avt = AnythingVideo_TW()
+            startup_profile.mark("加载视频模型")
+        except FileNotFoundError as exc:
+            self.load_failed.emit(str(exc))
+            return
+        except Exception as exc:
+            import traceback
+            traceback.print_exc()
+            self.load_failed.emit(f"加载 SAM 模型失败：{exc}")
+            return
+        self.progress_changed.emit(total_steps, total_steps, "完成")
+        self.models_ready.emit(at, avt)
+
 
 class MainFunc(QMainWindow):
     my_signal = pyqtSignal()
+    # Anything_TW 在后台线程中算完完整分辨率特征并重新解码了当前点击
+    full_embedding_ready = pyqtSignal()
 
     def __init__(self):
         super(MainFunc, self).__init__()
@@ -136,6 +255,25 @@ class MainFunc(QMainWindow):
 
         self.AT = None
         self.AVT = None
+        self.worker_thread = None
+        self.full_embedding_ready.connect(self.show_refined_mask)
+        # 模型在后台线程中加载，加载期间用状态栏进度条提示
+        self.model_load_thread = None
+        self.model_load_show_dialog = True
+        self.model_load_notify = False
+        self.model_load_progress = QtWidgets.QProgressBar()
+        self.model_load_progress.setMaximumWidth(240)
+        self.model_load_progress.setTextVisible(True)
+        self.model_load_progress.hide()
+        self.ui.statusbar.addPermanentWidget(self.model_load_progress)
+
+        # 自动候选框
+        self.auto_propose_enabled = bool(self.app_config.get(CONFIG_KEY_AUTO_PROPOSE_ON_OPEN, False))
+        self.auto_propose_preset = resolve_preset(self.app_config.get(CONFIG_KEY_AUTO_PROPOSE_PRESET))
+        self.proposals = []
+        self.proposal_index = 0
+        self.proposal_thread = None
+        self.proposal_pending = False
 
         self.timer_camera = QTimer()
 
@@ -156,6 +294,10 @@ class MainFunc(QMainWindow):
         self.ui.menuFile.addSeparator()
         self.ui.menuFile.addAction(self.action_select_sam_checkpoint)
         self.update_checkpoint_action_status()
+        self.setup_auto_propose_menu()
+        self.setup_roi_menu()
+        self.setup_tiled_view_menu()
+        self.setup_video_session_action()
 
         self.annotation_format = None
         self.on_annotation_format_changed("YOLO")
@@ -185,7 +327,8 @@ class MainFunc(QMainWindow):
         self.total_frames = 0
         self.current_frame = 0
 
-        self.ensure_sam_models_ready()
+        # 等窗口显示后再开始加载模型
+        QTimer.singleShot(0, self.start_model_loading)
 
     def Change_Enable(self,method="",state=False):
         if method=="ShowVideo":
@@ -214,29 +357,66 @@ class MainFunc(QMainWindow):
         self.AVT = None
 
     def ensure_sam_models_ready(self, *, show_dialog=True):
+        """模型已加载时返回 True；否则在后台开始（或继续）加载并返回 False。"""
         if self.AT is not None and self.AVT is not None:
             return True
 
-        try:
-            self.AT = Anything_TW()
-            self.AVT = AnythingVideo_TW()
-            self.sam_checkpoint_path = getattr(self.AVT, "sam2_checkpoint", self.sam_checkpoint_path)
-            self.app_config[CONFIG_KEY_SAM_CHECKPOINT] = self.sam_checkpoint_path
-            save_config(self.app_config)
-            self.update_checkpoint_action_status()
-            return True
-        except FileNotFoundError as exc:
-            self.reset_sam_models()
-            if show_dialog:
-                self.show_checkpoint_error(str(exc))
-            self.update_checkpoint_action_status()
-            return False
-        except Exception as exc:
-            self.reset_sam_models()
-            if show_dialog:
-                self.show_checkpoint_error(f"加载 SAM 模型失败：{exc}")
-            self.update_checkpoint_action_status()
-            return False
+        self.start_model_loading(show_dialog=show_dialog)
+        self.ui.statusbar.showMessage("SAM 模型正在后台加载，请稍候…", 3000)
+        return False
+
+    def start_model_loading(self, *, show_dialog=True, notify=False):
+        if self.model_load_thread is not None and self.model_load_thread.isRunning():
+            self.model_load_show_dialog = self.model_load_show_dialog or show_dialog
+            self.model_load_notify = self.model_load_notify or notify
+            return
+
+        self.model_load_show_dialog = show_dialog
+        self.model_load_notify = notify
+        self.model_load_thread = ModelLoadThread()
+        self.model_load_thread.progress_changed.connect(self.on_model_load_progress)
+        self.model_load_thread.models_ready.connect(self.on_models_ready)
+        self.model_load_thread.load_failed.connect(self.on_model_load_failed)
+        self.action_select_sam_checkpoint.setEnabled(False)
+        self.model_load_progress.setRange(0, 1)
+        self.model_load_progress.setValue(0)
+        self.model_load_progress.show()
+        self.model_load_thread.start()
+
+    def on_model_load_progress(self, step, total, text):
+        self.model_load_progress.setRange(0, total)
+        self.model_load_progress.setValue(step)
+        self.model_load_progress.setFormat(f"SAM 模型：{text} %v/%m")
+
+    def on_models_ready(self, at, avt):
+        self.AT = at
+        self.AVT = avt
+        # 回调在后台线程中触发，通过信号回到主线程刷新界面
+        self.AT.on_full_embedding_ready = self.full_embedding_ready.emit
+        self.AT.Set_Roi_Mode(self.action_roi_mode.isChecked())
+        self.model_load_progress.hide()
+        self.action_select_sam_checkpoint.setEnabled(True)
+        checkpoint_path = getattr(self.AVT, "sam2_checkpoint", self.sam_checkpoint_path)
+        if split_checkpoint_variant(Path(self.sam_checkpoint_path or ""))[1] is None:
+            # 自动选用的权重变体不写入配置，下次启动时仍从原始权重路径查找变体
+            checkpoint_path = str(split_checkpoint_variant(Path(checkpoint_path))[0])
+        self.sam_checkpoint_path = checkpoint_path
+        self.app_config[CONFIG_KEY_SAM_CHECKPOINT] = self.sam_checkpoint_path
+        save_config(self.app_config)
+        self.update_checkpoint_action_status()
+        self.ui.statusbar.showMessage("SAM 模型加载完成", 3000)
+        startup_profile.report()
+        if self.model_load_notify:
+            QtWidgets.QMessageBox.information(self, "模型已更新", "SAM 模型路径已更新。")
+
+    def on_model_load_failed(self, message):
+        self.reset_sam_models()
+        self.model_load_progress.hide()
+        self.action_select_sam_checkpoint.setEnabled(True)
+        self.update_checkpoint_action_status()
+        self.ui.statusbar.clearMessage()
+        if self.model_load_show_dialog:
+            self.show_checkpoint_error(message)
 
     def show_checkpoint_error(self, message):
         QtWidgets.QMessageBox.critical(
@@ -269,9 +449,317 @@ class MainFunc(QMainWindow):
         save_config(self.app_config)
         self.update_checkpoint_action_status()
         self.reset_sam_models()
+        self.start_model_loading(notify=True)
+
+    def setup_auto_propose_menu(self):
+        menu = self.ui.menubar.addMenu("Auto Propose")
+
+        self.action_auto_propose_on_open = QtWidgets.QAction("打开图片时自动生成候选框", self)
+        self.action_auto_propose_on_open.setCheckable(True)
+        self.action_auto_propose_on_open.setChecked(self.auto_propose_enabled)
+        self.action_auto_propose_on_open.toggled.connect(self.on_auto_propose_toggled)
+        menu.addAction(self.action_auto_propose_on_open)
+
+        action_run = QtWidgets.QAction("为当前图片生成候选框", self)
+        action_run.triggered.connect(lambda: self.start_auto_propose(force=True))
+        menu.addAction(action_run)
+
+        preset_menu = menu.addMenu("速度预设")
+        self.auto_propose_preset_group = QtWidgets.QActionGroup(self)
+        self.auto_propose_preset_group.setExclusive(True)
+        for preset, params in AUTO_PROPOSE_PRESETS.items():
+            action = QtWidgets.QAction(preset, self)
+            action.setCheckable(True)
+            action.setChecked(preset == self.auto_propose_preset)
+            action.setToolTip(", ".join(f"{k}={v}" for k, v in params.items()))
+            action.triggered.connect(lambda checked, preset=preset: self.on_auto_propose_preset_changed(preset))
+            self.auto_propose_preset_group.addAction(action)
+            preset_menu.addAction(action)
+        preset_menu.setToolTipsVisible(True)
+
+        menu.addSeparator()
+        action_accept_all = QtWidgets.QAction("接受全部候选框", self)
+        action_accept_all.triggered.connect(self.accept_all_proposals)
+        menu.addAction(action_accept_all)
+        action_clear = QtWidgets.QAction("清除候选框", self)
+        action_clear.triggered.connect(self.clear_proposals)
+        menu.addAction(action_clear)
+
+        hint = QtWidgets.QAction("A 接受 / R 拒绝 / N 下一个候选框", self)
+        hint.setEnabled(False)
+        menu.addAction(hint)
+
+    def setup_roi_menu(self):
+        menu = self.ui.menubar.addMenu("ROI")
+        # 松开鼠标时区分点击与拖动框选
+        self.roi_press = None
+        self.roi_release_event = None
+
+        self.action_roi_mode = QtWidgets.QAction("ROI 放大标注（小目标）", self)
+        self.action_roi_mode.setCheckable(True)
+        self.action_roi_mode.toggled.connect(self.on_roi_mode_toggled)
+        menu.addAction(self.action_roi_mode)
+
+        hint = QtWidgets.QAction("点击小目标或拖动框选区域，在原图分辨率上分割", self)
+        hint.setEnabled(False)
+        menu.addAction(hint)
+
+    def setup_tiled_view_menu(self):
+        menu = self.ui.menubar.addMenu("View")
+        self.tiled_viewer = None
+        action = QtWidgets.QAction("分块查看原图（超大图）", self)
+        action.triggered.connect(self.open_tiled_viewer)
+        menu.addAction(action)
+        # 超出主画布解码能力的图片（PIL/OpenCV 的像素上限）不经过主画布和模型，直接分块打开
+        action = QtWidgets.QAction("打开超大图片（分块查看）", self)
+        action.triggered.connect(self.open_large_image)
+        menu.addAction(action)
+
+    def open_tiled_viewer(self):
+        from util.tile_pyramid import read_image_size
+
+        if not self.img_path or self.is_video_mode:
+            upWindowsh("请先打开图片")
+            return
+        # 主界面的标注是显示尺寸下的坐标，分块查看窗口使用原图坐标
+        native_w, native_h = read_image_size(self.img_path)
+        scale_x = native_w / (self.img_width or native_w)
+        scale_y = native_h / (self.img_height or native_h)
+        labels = [
+            dict(label, bndbox=[
+                label["bndbox"][0] * scale_x, label["bndbox"][1] * scale_y,
+                label["bndbox"][2] * scale_x, label["bndbox"][3] * scale_y,
+            ])
+            for label in self.labels
+        ]
+        self.show_tiled_viewer(self.img_path, labels, self.on_tiled_labels_saved)
+
+    def open_large_image(self):
+        from util.tile_pyramid import read_image_size
+
+        image_path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "选择超大图片", "", "Image Files (*.jpg *.jpeg *.png *.tif *.tiff *.bmp)"
+        )
+        if not image_path:
+            return
+        try:
+            native_w, native_h = read_image_size(image_path)
+        except OSError as e:
+            upWindowsh(f"无法读取图片：{e}")
+            return
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        labels = self.load_native_labels(image_name, native_w, native_h)
+        self.show_tiled_viewer(
+            image_path,
+            labels,
+            lambda labels, size: self.on_large_image_labels_saved(image_path, image_name, labels, size),
+        )
 
-        if self.ensure_sam_models_ready():
-            QtWidgets.QMessageBox.information(self, "模型已更新", "SAM 模型路径已更新。")
+    def show_tiled_viewer(self, image_path, labels, on_saved):
+        from GUI.tiled_viewer import TiledViewerWindow
+
+        if self.tiled_viewer is not None:
+            self.tiled_viewer.close()
+            self.tiled_viewer = None
+        try:
+            self.tiled_viewer = TiledViewerWindow(image_path, labels, self)
+        except OSError as e:
+            upWindowsh(f"无法读取图片：{e}")
+            return
+        self.tiled_viewer.labels_saved.connect(on_saved)
+        self.tiled_viewer.show()
+
+    def load_native_labels(self, image_name, width, height):
+        """读取保存路径中该图片已有的标注，换算为原图尺寸下的坐标。"""
+        if not self.save_path:
+            return []
+        base_path = Path(self.save_path) / image_name
+        formats = ["YOLO", "XML"] if self.annotation_format == "YOLO" else ["XML", "YOLO"]
+        for fmt in formats:
+            if fmt == "YOLO":
+                labels, _, _ = load_yolo_labels(base_path.with_suffix(".txt"), width, height)
+                if labels:
+                    return labels
+                continue
+            xml_path = base_path.with_suffix(".xml")
+            if not xml_path.exists():
+                continue
+            labels = get_labels(str(xml_path))
+            xml_w, xml_h = label_size(str(xml_path))
+            if xml_w and xml_h and (xml_w, xml_h) != (width, height):
+                scale_x, scale_y = width / xml_w, height / xml_h
+                for label in labels:
+                    box = label["bndbox"]
+                    label["bndbox"] = [
+                        round(box[0] * scale_x), round(box[1] * scale_y),
+                        round(box[2] * scale_x), round(box[3] * scale_y),
+                    ]
+            return labels
+        return []
+
+    def on_large_image_labels_saved(self, image_path, image_name, labels, size):
+        if not self.save_path:
+            upWindowsh("请选择保存路径")
+            return
+        self.save_annotation_files(image_path, image_name, size, labels)
+        if image_name == self.image_name and not self.is_video_mode:
+            self.Exists_Labels_And_Boxs()
+
+    def on_tiled_labels_saved(self, labels, size):
+        if not self.save_path:
+            upWindowsh("请选择保存路径")
+            return
+        # 以原图尺寸保存，重新加载时换算回显示尺寸
+        self.save_annotation_files(self.image_path, self.image_name, size, labels)
+        self.Exists_Labels_And_Boxs()
+
+    def on_roi_mode_toggled(self, checked):
+        if self.AT is not None:
+            self.AT.Set_Roi_Mode(checked)
+            # 切换时清除了未保存的目标
+            if self.img_path and not self.is_video_mode and getattr(self, "image", None) is not None:
+                self.Show_Exists()
+
+    def roi_mouse_release_event(self, event):
+        self.ui.label_4.mouseReleaseEvent = self.roi_release_event
+        if self.roi_press is None or self.AT is None:
+            return
+        x0, y0 = self.roi_press
+        x1, y1 = event.x(), event.y()
+        self.roi_press = None
+        try:
+            image = self.image.copy()
+            if abs(x1 - x0) > 5 and abs(y1 - y0) > 5:
+                self.AT.Create_Roi_Box_Mask(self._normalized_box(x0, y0, x1, y1))
+            else:
+                self.AT.Set_Clicked([x0, y0], self.method)
+                self.AT.Create_Mask()
+            image = self.AT.Draw_Mask(self.AT.mask, image)
+            self.show_click_image(image)
+
+            self.save = False
+        except Exception as e:
+            print(f"Error in roi_mouse_release_event: {str(e)}")
+
+    def on_auto_propose_toggled(self, checked):
+        self.auto_propose_enabled = checked
+        self.app_config[CONFIG_KEY_AUTO_PROPOSE_ON_OPEN] = checked
+        save_config(self.app_config)
+        if checked:
+            self.start_auto_propose()
+
+    def on_auto_propose_preset_changed(self, preset):
+        self.auto_propose_preset = resolve_preset(preset)
+        self.app_config[CONFIG_KEY_AUTO_PROPOSE_PRESET] = self.auto_propose_preset
+        save_config(self.app_config)
+
+    def start_auto_propose(self, force=False):
+        if not (self.auto_propose_enabled or force):
+            return
+        if self.is_video_mode or self.image is None or not self.img_path or self.AT is None:
+            return
+
+        self.proposals = []
+        self.proposal_index = 0
+        if self.proposal_thread is not None and self.proposal_thread.isRunning():
+            # 同一时刻只运行一个任务，结束后再为最新的图片生成
+            self.proposal_pending = True
+            return
+
+        self.proposal_pending = False
+        self.proposal_thread = ProposalThread(
+            self.AT,
+            self.img_path,
+            self.image.copy(),
+            self.auto_propose_preset,
+            self.clicked_save + self.paint_save,
+        )
+        self.proposal_thread.proposals_ready.connect(self.on_proposals_ready, Qt.QueuedConnection)
+        self.proposal_thread.start()
+
+    def on_proposals_ready(self, image_path, proposals):
+        if self.proposal_thread is not None:
+            self.proposal_thread.deleteLater()
+            self.proposal_thread = None
+        if self.proposal_pending:
+            self.start_auto_propose(force=True)
+            return
+        if image_path != self.img_path or self.is_video_mode:
+            return
+
+        self.proposals = list(proposals)
+        self.proposal_index = 0
+        if not self.clicked_event and not self.paint_event:
+            self.Show_Exists()
+
+    def clear_proposals(self):
+        self.proposals = []
+        self.proposal_index = 0
+        if self.img_path and not self.clicked_event and not self.paint_event:
+            self.Show_Exists()
+
+    def _draw_proposals(self, image):
+        import cv2
+        for idx, proposal in enumerate(self.proposals):
+            x1, y1, x2, y2 = proposal.xyxy
+            current = idx == self.proposal_index
+            color = (0, 255, 255) if current else (0, 200, 200)
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2 if current else 1)
+            if current:
+                cv2.putText(image, f"{idx + 1}/{len(self.proposals)}", (x1, max(y1 - 5, 12)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        return image
+
+    def handle_proposal_key(self, key):
+        if not self.proposals:
+            return False
+
+        if key == Qt.Key_A:
+            proposal = self.proposals[self.proposal_index]
+            self.dialog = LabelInputDialog(self)
+            self.dialog.show()
+            self.dialog.confirmed.connect(lambda text, proposal=proposal: self.accept_proposals(text, [proposal]))
+        elif key == Qt.Key_R:
+            del self.proposals[self.proposal_index]
+            self.proposal_index = min(self.proposal_index, max(len(self.proposals) - 1, 0))
+            self.Show_Exists()
+        elif key == Qt.Key_N:
+            self.proposal_index = (self.proposal_index + 1) % len(self.proposals)
+            self.Show_Exists()
+        else:
+            return False
+        return True
+
+    def accept_all_proposals(self):
+        if not self.proposals:
+            upWindowsh("当前没有候选框")
+            return
+        self.dialog = LabelInputDialog(self)
+        self.dialog.show()
+        self.dialog.confirmed.connect(lambda text: self.accept_proposals(text, list(self.proposals)))
+
+    def accept_proposals(self, text, proposals):
+        if not self.save_path:
+            upWindowsh("请选择保存路径")
+            return
+
+        size = [self.img_width, self.img_height, 3]
+        for proposal in proposals:
+            if proposal not in self.proposals:
+                continue
+            x, y, w, h = proposal.box
+            self.ui.listWidget.addItem(text)
+            result, file_path, size = xml_message(self.save_path, self.image_name, self.img_width,
+                                                  self.img_height, text, x, y, w, h)
+            self.labels.append(result)
+            box = self._normalized_box(x, y, x + w, y + h)
+            self.clicked_save.append(box)
+            self.label_boxes_by_row.append(box)
+            self.proposals.remove(proposal)
+        self.save_annotation_files(self.image_path, self.image_name, size, self.labels)
+
+        self.proposal_index = min(self.proposal_index, max(len(self.proposals) - 1, 0))
+        self.Show_Exists()
 
     def clear_label_list(self):
         self.ui.listWidget.clear()
@@ -392,6 +880,7 @@ class MainFunc(QMainWindow):
             self.ui.currentImageLabel.setText("")
 
     def show_path_image(self):
+        import cv2
         if not self.ensure_sam_models_ready():
             return
         if self.image_files:
@@ -407,6 +896,8 @@ class MainFunc(QMainWindow):
                 upWindowsh("无法加载图片")
                 return
 
+            # ROI 放大标注在缩放前的原图上裁剪
+            source_image = self.image
             if target_width and target_height:
                 if (self.image.shape[1], self.image.shape[0]) != (target_width, target_height):
                     self.image = cv2.resize(
@@ -417,10 +908,13 @@ class MainFunc(QMainWindow):
             else:
                 self.img_height, self.img_width = self.image.shape[:2]
 
-            self.AT.Set_Image(self.image.copy())
+            self.AT.Set_Image(self.image.copy(), source_image=source_image)
+            self.proposals = []
+            self.proposal_index = 0
             self.show_qt()
             self.Exists_Labels_And_Boxs()
             self.ui.currentImageLabel.setText(f"{os.path.basename(self.image_path)}")
+            self.start_auto_propose()
         else:
             self.ui.currentImageLabel.setText("")
 
@@ -460,6 +954,18 @@ class MainFunc(QMainWindow):
                     continue
                 self.labels = get_labels(str(xml_path))
                 self.list_labels, list_box = list_label(str(xml_path))
+                # 分块查看窗口按原图尺寸保存，换算到当前显示尺寸
+                xml_w, xml_h = label_size(str(xml_path))
+                if xml_w and xml_h and (xml_w, xml_h) != (self.img_width, self.img_height):
+                    scale_x = self.img_width / xml_w
+                    scale_y = self.img_height / xml_h
+                    list_box = [
+                        [round(box[0] * scale_x), round(box[1] * scale_y),
+                         round(box[2] * scale_x), round(box[3] * scale_y)]
+                        for box in list_box
+                    ]
+                    for label, box in zip(self.labels, list_box):
+                        label['bndbox'] = box
                 normalized_boxes = [self._normalized_box(box[0], box[1], box[2], box[3]) for box in list_box]
                 self.paint_save = normalized_boxes.copy()
                 for label, box in zip(self.list_labels, normalized_boxes):
@@ -469,6 +975,7 @@ class MainFunc(QMainWindow):
                 return
 
     def _set_label_pixmap_from_array(self, image_array):
+        import cv2
         if image_array is None:
             return
 
@@ -552,29 +1059,53 @@ class MainFunc(QMainWindow):
                         "label": self.method,
                     })
 
+                if self.AT.roi_mode and not self.is_video_mode:
+                    # ROI 模式：松开鼠标时再判断是点击还是拖动框选
+                    self.roi_press = (x, y)
+                    if self.ui.label_4.mouseReleaseEvent != self.roi_mouse_release_event:
+                        self.roi_release_event = self.ui.label_4.mouseReleaseEvent
+                    self.ui.label_4.mouseReleaseEvent = self.roi_mouse_release_event
+                    return
+
                 image = self.image.copy()
                 self.AT.Set_Clicked([x, y], self.method)
                 self.AT.Create_Mask()
                 image = self.AT.Draw_Mask(self.AT.mask, image)
-
-                h,w,channels=image.shape
-                bytes_per_line = channels * w
-                q_image = QImage(image.data, w, h, bytes_per_line, QImage.Format_RGB888).rgbSwapped()
-
-                Qt_Gui = QtGui.QPixmap(q_image)
-                self.ui.label_3.setFixedSize(self.img_width, self.img_height)
-                self.ui.label_3.setPixmap(Qt_Gui)
+                self.show_click_image(image)
 
                 self.save = False
         except Exception as e:
             print(f"Error in mouse_press_event: {str(e)}")
 
+    def show_click_image(self, image):
+        h,w,channels=image.shape
+        bytes_per_line = channels * w
+        q_image = QImage(image.data, w, h, bytes_per_line, QImage.Format_RGB888).rgbSwapped()
+
+        Qt_Gui = QtGui.QPixmap(q_image)
+        self.ui.label_3.setFixedSize(self.img_width, self.img_height)
+        self.ui.label_3.setPixmap(Qt_Gui)
+
+    # 预览特征给出的 mask 已用完整分辨率特征重新解码，刷新显示
+    def show_refined_mask(self):
+        if self.AT is None or not self.clicked_event or not self.AT.coords or self.AT.mask is None:
+            return
+        try:
+            image = self.AT.Draw_Mask(self.AT.mask, self.image.copy())
+            self.show_click_image(image)
+        except Exception as e:
+            print(f"Error in show_refined_mask: {str(e)}")
+
 # ########################################################################################################################
 # 重写QWidget类的keyPressEvent方法
     def keyPressEvent(self, event):
         if not self.ensure_sam_models_ready():
             return
         if self.img_path:
+            if not self.clicked_event and not self.paint_event and not self.is_video_mode:
+                if self.handle_proposal_key(event.key()):
+                    return
+
             if self.clicked_event and not self.paint_event:
                 image = self.AT.Key_Event(event.key())
 
@@ -722,11 +1253,12 @@ class MainFunc(QMainWindow):
 
     # 显示已存在框
     def Show_Exists(self):
+        import cv2
         if self.image is None:
             return
 
         image = self.image.copy()
-        if self.clicked_save == [] and self.paint_save == []:
+        if self.clicked_save == [] and self.paint_save == [] and not self.proposals:
             self.show_qt()
         else:
             if self.clicked_save:
@@ -735,6 +1267,8 @@ class MainFunc(QMainWindow):
             if self.paint_save:
                 for i in self.paint_save:
                     image = cv2.rectangle(image, (i[0], i[1]), (i[2], i[3]), (0, 0, 255), 2)
+            if self.proposals:
+                image = self._draw_proposals(image)
 
             self._set_label_pixmap_from_array(image)
 
@@ -804,6 +1338,7 @@ class MainFunc(QMainWindow):
 # ##################################################################################################
     # 获取视频
     def get_video(self):
+        import cv2
         self.clear_label_list()  # 清空listWidget
         self.image_files = None
         self.img_path = None
@@ -840,6 +1375,7 @@ class MainFunc(QMainWindow):
 
 
     def OpenFrame(self):
+        import cv2
         if not self.sld_video_pressed:  # 只在未拖动时更新
             ret, image = self.cap.read()
             if ret:
@@ -913,6 +1449,7 @@ class MainFunc(QMainWindow):
     
     def moveSlider(self, position):
         """处理滑块移动"""
+        import cv2
         if self.cap and self.total_frames > 0:
             # 设置视频帧位置
             self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
@@ -963,12 +1500,19 @@ class MainFunc(QMainWindow):
         self.timer_camera.start(33)
 
     def clean_up(self):
+        worker = self.worker_thread
+        if worker is not None and worker.isRunning():
+            # 视频标注进行中：在当前帧结束传播，线程保存会话后退出，已跟踪帧的标注照常写出
+            self.AVT.stop_requested = True
+            worker.wait()
+            self.on_video_processing_complete()
         file_path = 'GUI/history.txt'
         if os.path.exists(file_path):
             os.remove(file_path)
 
     def Btn_Replay(self):
         """重新播放视频"""
+        import cv2
         if hasattr(self, 'video_path'):
             # 重新打开视频文件
             self.cap = cv2.VideoCapture(self.video_path)
@@ -991,6 +1535,7 @@ class MainFunc(QMainWindow):
             upWindowsh("请先选择视频和保存路径")
 
     def video_marking(self):
+        import cv2
         if not self.ensure_sam_models_ready():
             return
         self.directory = None
@@ -1002,6 +1547,7 @@ class MainFunc(QMainWindow):
         self.clear_label_list()
         if self.video_path and self.output_dir:
             self.is_video_mode = True
+            self.proposals = []
             self.video_prompt_queue = {}
             self.video_object_labels = {}
             self.pending_video_prompts = []
@@ -1060,11 +1606,17 @@ class MainFunc(QMainWindow):
 
 
     def on_video_processing_complete(self):
+        worker = self.worker_thread
+        if worker is None:
+            return
+        self.worker_thread = None
         self.ui.progressBar.hide()
         self.ui.progressBar.setValue(0)
         self.ui.progressBar.setRange(0, 100)
-        self.worker_thread.deleteLater()
-        self.xml_messages = self.worker_thread.xml_messages
+        worker.deleteLater()
+        self.xml_messages = worker.xml_messages
+        if not self.save_path:
+            self.save_path = worker.save_path  # 恢复的会话沿用保存会话时的标注路径
         # print(self.xml_messages)
 
         frame_annotations = {}
@@ -1144,6 +1696,55 @@ class MainFunc(QMainWindow):
                 txt_path.unlink()
                             
 
+    def start_video_worker(self, worker):
+        self.worker_thread = worker
+        self.worker_thread.progress_changed.connect(
+            self.on_video_progress_changed,
+            Qt.QueuedConnection,
+        )
+        self.worker_thread.finished.connect(
+            self.on_video_processing_complete,
+            Qt.QueuedConnection,
+        )
+
+        self.ui.progressBar.show()
+        self.ui.progressBar.setValue(0)
+        self.ui.progressBar.setRange(0, 0)
+        self.worker_thread.start()
+
+    def setup_video_session_action(self):
+        self.action_resume_video_session = QtWidgets.QAction("恢复视频标注会话", self)
+        self.action_resume_video_session.triggered.connect(self.resume_video_session)
+        self.ui.menuFile.addAction(self.action_resume_video_session)
+
+    def resume_video_session(self):
+        if not self.ensure_sam_models_ready():
+            return
+        if self.worker_thread is not None and self.worker_thread.isRunning():
+            upWindowsh("视频标注进行中，请稍后再试")
+            return
+        output_dir = QtWidgets.QFileDialog.getExistingDirectory(self, "选择视频帧所在文件夹")
+        if not output_dir:
+            return
+        session_dir = os.path.join(output_dir, VIDEO_SESSION_DIRNAME)
+        if not os.path.isfile(os.path.join(session_dir, "session.json")):
+            upWindowsh("该文件夹中没有可恢复的视频标注会话")
+            return
+
+        self.output_dir = output_dir
+        self.is_video_mode = True
+        self.ui.pushButton_start_marking.setEnabled(False)
+        self.ui.listWidget.addItem(f"恢复视频标注会话: {session_dir}")
+        self.start_video_worker(VideoProcessingThread(
+            self.AVT,
+            None,
+            self.output_dir,
+            None,
+            None,
+            self.save_path,
+            resume=True,
+        ))
+
     def Btn_Start_Marking(self):
         if not self.ensure_sam_models_ready():
             return
@@ -1176,27 +1777,14 @@ class MainFunc(QMainWindow):
                 return
 
             # 创建并启动工作线程
-            self.worker_thread = VideoProcessingThread(
+            self.start_video_worker(VideoProcessingThread(
                 self.AVT,
                 self.video_path,
                 self.output_dir,
                 prompts,
                 label_map,
                 self.save_path,
-            )
-            self.worker_thread.progress_changed.connect(
-                self.on_video_progress_changed,
-                Qt.QueuedConnection,
-            )
-            self.worker_thread.finished.connect(
-                self.on_video_processing_complete,
-                Qt.QueuedConnection,
-            )
-
-            self.ui.progressBar.show()
-            self.ui.progressBar.setValue(0)
-            self.ui.progressBar.setRange(0, 0)
-            self.worker_thread.start()
+            ))
 
         else:
             upWindowsh("请先选择视频和保存路径")
@@ -0,0 +1,428 @@
+"""Tiled viewer for gigapixel images.
+
+The main window decodes the whole image and shows it scaled to fit the screen,
+which is slow for very large images and hides small objects. This window shows
+the image through a :class:`util.tile_pyramid.TilePyramid`: the pyramid is built
+once in the background, and at each zoom level only the visible tiles of the
+matching level are decoded, in a thread pool, into an LRU cache bounded by a
+memory budget. Boxes are drawn and stored in native image coordinates.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from GUI.message import LabelInputDialog
+from util.config import load_config
+from util.tile_pyramid import TileCache, TilePyramid
+
+CONFIG_KEY_TILE_CACHE_MB = "tile_cache_mb"
+DEFAULT_TILE_CACHE_MB = 256
+# Up to how many screen pixels per native pixel the view can zoom in.
+MAX_ZOOM = 8.0
+ZOOM_STEP = 1.25
+MIN_BOX_SIZE = 2
+
+TileKey = Tuple[int, int, int]
+
+
+def _qimage_size(image: QtGui.QImage) -> int:
+    return image.bytesPerLine() * image.height()
+
+
+class PyramidBuildThread(QtCore.QThread):
+    """Builds the missing levels of a pyramid, coarsest first."""
+
+    level_ready = QtCore.pyqtSignal(int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, pyramid: TilePyramid) -> None:
+        super().__init__()
+        self.pyramid = pyramid
+
+    def run(self) -> None:
+        try:
+            self.pyramid.build(self.level_ready.emit)
+        except Exception as exc:  # noqa: BLE001 - reported in the window
+            self.failed.emit(str(exc))
+
+
+class TileSignals(QtCore.QObject):
+    # (level, col, row) and the decoded QImage, or None when the tile was skipped
+    tile_loaded = QtCore.pyqtSignal(object, object)
+
+
+class TileLoader(QtCore.QRunnable):
+    """Decodes one tile off the GUI thread."""
+
+    def __init__(self, pyramid: TilePyramid, key: TileKey, wanted, signals: TileSignals) -> None:
+        super().__init__()
+        self.pyramid = pyramid
+        self.key = key
+        self.wanted = wanted
+        self.signals = signals
+
+    def run(self) -> None:
+        # The view moved on since the request was queued: skip the decode.
+        if self.key not in self.wanted():
+            self.signals.tile_loaded.emit(self.key, None)
+            return
+        tile = self.pyramid.read_tile(*self.key)
+        if tile is None:
+            self.signals.tile_loaded.emit(self.key, None)
+            return
+        rgb = np.ascontiguousarray(tile[:, :, ::-1])
+        height, width = rgb.shape[:2]
+        image = QtGui.QImage(rgb.data, width, height, 3 * width, QtGui.QImage.Format_RGB888)
+        # copy() detaches the QImage from the numpy buffer
+        self.signals.tile_loaded.emit(self.key, image.copy())
+
+
+class TiledImageItem(QtWidgets.QGraphicsObject):
+    """Scene item of the whole image in native pixel coordinates, painted tile by tile."""
+
+    def __init__(self, pyramid: TilePyramid, cache: TileCache) -> None:
+        super().__init__()
+        self.pyramid = pyramid
+        self.cache = cache
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, min(4, QtCore.QThread.idealThreadCount())))
+        self.signals = TileSignals()
+        self.signals.tile_loaded.connect(self.on_tile_loaded)
+        self.pending = set()
+        self.wanted = frozenset()
+        self.level = pyramid.level_count - 1
+
+    def boundingRect(self) -> QtCore.QRectF:
+        return QtCore.QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def tile_rect(self, key: TileKey) -> QtCore.QRectF:
+        x0, y0, x1, y1 = self.pyramid.tile_rect(*key)
+        return QtCore.QRectF(x0, y0, x1 - x0, y1 - y0)
+
+    def set_viewport(self, rect: QtCore.QRectF, scale: float) -> None:
+        """Request the tiles of the level matching ``scale`` that intersect ``rect``."""
+        self.level = self.pyramid.level_for_scale(scale)
+        rect = rect.intersected(self.boundingRect())
+        if rect.isEmpty():
+            self.wanted = frozenset()
+            return
+        # The coarsest level (a single tile or a few) is always kept as the fallback
+        # painted under tiles that are still loading.
+        keys = [
+            (level, col, row)
+            for level in sorted({self.level, self.pyramid.level_count - 1}, reverse=True)
+            for col, row in self.pyramid.tiles_in_rect(
+                level, rect.left(), rect.top(), rect.right(), rect.bottom()
+            )
+        ]
+        self.wanted = frozenset(keys)
+        for key in keys:
+            self.request(key)
+
+    def request(self, key: TileKey) -> None:
+        if key in self.pending or key in self.cache or key[0] not in self.pyramid.ready_levels:
+            return
+        self.pending.add(key)
+        self.pool.start(TileLoader(self.pyramid, key, lambda: self.wanted, self.signals))
+
+    def on_tile_loaded(self, key: TileKey, image: Optional[QtGui.QImage]) -> None:
+        self.pending.discard(key)
+        if image is not None:
+            self.cache.put(key, image)
+            self.update(self.tile_rect(key))
+
+    def on_level_ready(self, level: int) -> None:
+        # Tiles of this level could not be requested before it was written.
+        for key in self.wanted:
+            if key[0] == level:
+                self.request(key)
+        self.update()
+
+    def paint(self, painter: QtGui.QPainter, option, widget=None) -> None:
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level_for_scale(scale)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, scale < 1.0)
+        for col, row in self.pyramid.tiles_in_rect(
+            level, exposed.left(), exposed.top(), exposed.right(), exposed.bottom()
+        ):
+            key = (level, col, row)
+            target = self.tile_rect(key)
+            image = self.cache.get(key)
+            if image is not None:
+                painter.drawImage(target, image)
+                continue
+            if key in self.wanted:
+                self.request(key)
+            self.paint_fallback(painter, key, target)
+
+    def paint_fallback(self, painter: QtGui.QPainter, key: TileKey, target: QtCore.QRectF) -> None:
+        """Fill a missing tile with the matching part of the nearest cached coarser tile."""
+        level, col, row = key
+        for coarse_level in range(level + 1, self.pyramid.level_count):
+            shift = coarse_level - level
+            coarse_key = (coarse_level, col >> shift, row >> shift)
+            image = self.cache.get(coarse_key)
+            if image is None:
+                continue
+            coarse_rect = self.tile_rect(coarse_key)
+            sx = image.width() / coarse_rect.width()
+            sy = image.height() / coarse_rect.height()
+            source = QtCore.QRectF(
+                (target.left() - coarse_rect.left()) * sx,
+                (target.top() - coarse_rect.top()) * sy,
+                target.width() * sx,
+                target.height() * sy,
+            )
+            painter.drawImage(target, image, source)
+            return
+        painter.fillRect(target, QtGui.QColor("#303030"))
+
+
+class TiledImageView(QtWidgets.QGraphicsView):
+    """Zoom with the wheel under the cursor, pan by dragging, draw boxes in box mode."""
+
+    box_drawn = QtCore.pyqtSignal(QtCore.QRectF)
+    viewport_changed = QtCore.pyqtSignal()
+    cursor_moved = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, scene: QtWidgets.QGraphicsScene, parent: Optional[QtWidgets.QWidget] = None) -> None:
+        super().__init__(scene, parent)
+        self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
+        self.setResizeAnchor(QtWidgets.QGraphicsView.AnchorViewCenter)
+        self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
+        self.setBackgroundBrush(QtGui.QColor("#202020"))
+        self.setMouseTracking(True)
+        self.box_mode = False
+        self.box_start: Optional[QtCore.QPointF] = None
+        self.rubber_band: Optional[QtWidgets.QGraphicsRectItem] = None
+
+    def current_scale(self) -> float:
+        return self.transform().m11()
+
+    def visible_scene_rect(self) -> QtCore.QRectF:
+        return self.mapToScene(self.viewport().rect()).boundingRect()
+
+    def fit_scale(self) -> float:
+        rect = self.sceneRect()
+        if rect.isEmpty():
+            return 1.0
+        viewport = self.viewport().rect()
+        return min(viewport.width() / rect.width(), viewport.height() / rect.height())
+
+    def fit(self) -> None:
+        self.fitInView(self.sceneRect(), QtCore.Qt.KeepAspectRatio)
+        self.viewport_changed.emit()
+
+    def set_zoom(self, scale: float) -> None:
+        scale = min(max(scale, self.fit_scale() * 0.5), MAX_ZOOM)
+        factor = scale / self.current_scale()
+        self.scale(factor, factor)
+        self.viewport_changed.emit()
+
+    def set_box_mode(self, enabled: bool) -> None:
+        self.box_mode = enabled
+        self.setDragMode(
+            QtWidgets.QGraphicsView.NoDrag if enabled else QtWidgets.QGraphicsView.ScrollHandDrag
+        )
+        self.viewport().setCursor(QtCore.Qt.CrossCursor if enabled else QtCore.Qt.OpenHandCursor)
+
+    def clamp_to_scene(self, point: QtCore.QPointF) -> QtCore.QPointF:
+        rect = self.sceneRect()
+        return QtCore.QPointF(
+            min(max(point.x(), rect.left()), rect.right()),
+            min(max(point.y(), rect.top()), rect.bottom()),
+        )
+
+    def wheelEvent(self, event: QtGui.QWheelEvent) -> None:  # type: ignore[override]
+        steps = event.angleDelta().y() / 120.0
+        if steps:
+            self.set_zoom(self.current_scale() * ZOOM_STEP ** steps)
+
+    def scrollContentsBy(self, dx: int, dy: int) -> None:  # type: ignore[override]
+        super().scrollContentsBy(dx, dy)
+        self.viewport_changed.emit()
+
+    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:  # type: ignore[override]
+        super().resizeEvent(event)
+        self.viewport_changed.emit()
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:  # type: ignore[override]
+        if self.box_mode and event.button() == QtCore.Qt.LeftButton:
+            self.box_start = self.clamp_to_scene(self.mapToScene(event.pos()))
+            pen = QtGui.QPen(QtGui.QColor("#00ff00"), 2)
+            pen.setCosmetic(True)
+            self.rubber_band = self.scene().addRect(QtCore.QRectF(self.box_start, self.box_start), pen)
+            return
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent) -> None:  # type: ignore[override]
+        point = self.mapToScene(event.pos())
+        self.cursor_moved.emit(int(point.x()), int(point.y()))
+        if self.box_start is not None and self.rubber_band is not None:
+            end = self.clamp_to_scene(point)
+            self.rubber_band.setRect(QtCore.QRectF(self.box_start, end).normalized())
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event: QtGui.QMouseEvent) -> None:  # type: ignore[override]
+        if self.box_start is not None and event.button() == QtCore.Qt.LeftButton:
+            rect = self.rubber_band.rect()
+            self.scene().removeItem(self.rubber_band)
+            self.box_start = None
+            self.rubber_band = None
+            if rect.width() >= MIN_BOX_SIZE and rect.height() >= MIN_BOX_SIZE:
+                self.box_drawn.emit(rect)
+            return
+        super().mouseReleaseEvent(event)
+
+
+class TiledViewerWindow(QtWidgets.QMainWindow):
+    """Zoomable view of one image with box annotation at native resolution.
+
+    ``labels`` use the label dicts of ``util.xmlfile`` in native coordinates;
+    ``labels_saved`` sends all of them back with the native ``[width, height, 3]``.
+    """
+
+    labels_saved = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, image_path: str, labels: List[dict], parent: Optional[QtWidgets.QWidget] = None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle(f"分块查看 - {image_path}")
+        self.resize(1280, 860)
+        self.image_path = image_path
+        self.labels = [dict(label) for label in labels]
+        self.label_items: List[List[QtWidgets.QGraphicsItem]] = []
+        self.pending_box: Optional[QtCore.QRectF] = None
+        self.dialog = None
+
+        config = load_config()
+        budget_mb = config.get(CONFIG_KEY_TILE_CACHE_MB, DEFAULT_TILE_CACHE_MB)
+        self.cache = TileCache(int(budget_mb) * 2**20, size_of=_qimage_size)
+
+        self.scene = QtWidgets.QGraphicsScene(self)
+        self.view = TiledImageView(self.scene, self)
+        self.setCentralWidget(self.view)
+        self.view.viewport_changed.connect(self.on_viewport_changed)
+        self.view.cursor_moved.connect(self.on_cursor_moved)
+        self.view.box_drawn.connect(self.on_box_drawn)
+        self.status_label = QtWidgets.QLabel("")
+        self.statusBar().addPermanentWidget(self.status_label)
+        self._build_toolbar()
+
+        self.item: Optional[TiledImageItem] = None
+        # reads only the image header; raises OSError for files Pillow cannot open
+        self.pyramid = TilePyramid(image_path)
+        self.build_thread = PyramidBuildThread(self.pyramid)
+        self.build_thread.level_ready.connect(self.on_level_ready)
+        self.build_thread.failed.connect(self.on_build_failed)
+        self.show_pyramid()
+        if not self.pyramid.is_built():
+            self.statusBar().showMessage("正在生成分块缓存，首次打开大图需要一些时间……")
+            self.build_thread.start()
+
+    def _build_toolbar(self) -> None:
+        toolbar = self.addToolBar("视图")
+        self.action_fit = toolbar.addAction("适应窗口")
+        self.action_fit.triggered.connect(self.view.fit)
+        self.action_native = toolbar.addAction("1:1 原始尺寸")
+        self.action_native.triggered.connect(lambda: self.view.set_zoom(1.0))
+        toolbar.addSeparator()
+        self.action_box = toolbar.addAction("框选标注")
+        self.action_box.setCheckable(True)
+        self.action_box.toggled.connect(self.view.set_box_mode)
+        self.action_undo = toolbar.addAction("撤销上一个框")
+        self.action_undo.triggered.connect(self.undo_last_label)
+        self.action_save = toolbar.addAction("保存")
+        self.action_save.triggered.connect(self.save_labels)
+        self.action_save.setShortcut(QtGui.QKeySequence("S"))
+
+    # ------------------------------------------------------------- pyramid ---
+    def show_pyramid(self) -> None:
+        """Add the image item; tiles that are not built yet are painted as placeholders."""
+        self.item = TiledImageItem(self.pyramid, self.cache)
+        self.scene.addItem(self.item)
+        self.scene.setSceneRect(self.item.boundingRect())
+        for label in self.labels:
+            self.label_items.append(self.add_label_items(label))
+        # the viewport has its final size once the window is shown
+        QtCore.QTimer.singleShot(0, self.view.fit)
+
+    def on_level_ready(self, level: int) -> None:
+        self.item.on_level_ready(level)
+        if self.pyramid.is_built():
+            self.statusBar().showMessage("分块缓存已生成", 3000)
+
+    def on_build_failed(self, message: str) -> None:
+        self.statusBar().clearMessage()
+        QtWidgets.QMessageBox.warning(self, "分块查看", f"无法生成分块缓存：{message}")
+
+    def on_viewport_changed(self) -> None:
+        if self.item is None:
+            return
+        scale = self.view.current_scale()
+        self.item.set_viewport(self.view.visible_scene_rect(), scale)
+        self.status_label.setText(f"缩放 {scale * 100:.1f}%  层级 {self.item.level}")
+
+    def on_cursor_moved(self, x: int, y: int) -> None:
+        if self.item is not None and 0 <= x < self.pyramid.width and 0 <= y < self.pyramid.height:
+            self.statusBar().showMessage(f"原图坐标 ({x}, {y})")
+
+    # -------------------------------------------------------------- labels ---
+    def add_label_items(self, label: dict) -> List[QtWidgets.QGraphicsItem]:
+        x_min, y_min, x_max, y_max = label["bndbox"][:4]
+        pen = QtGui.QPen(QtGui.QColor("#ff3030"), 2)
+        pen.setCosmetic(True)
+        rect_item = self.scene.addRect(QtCore.QRectF(x_min, y_min, x_max - x_min, y_max - y_min), pen)
+        text_item = self.scene.addSimpleText(label["name"])
+        text_item.setBrush(QtGui.QColor("#ff3030"))
+        text_item.setPos(x_min, y_min)
+        # keep the name readable at any zoom level
+        text_item.setFlag(QtWidgets.QGraphicsItem.ItemIgnoresTransformations)
+        return [rect_item, text_item]
+
+    def on_box_drawn(self, rect: QtCore.QRectF) -> None:
+        self.pending_box = rect
+        self.dialog = LabelInputDialog(self)
+        self.dialog.show()
+        self.dialog.confirmed.connect(self.on_label_confirmed)
+
+    def on_label_confirmed(self, text: str) -> None:
+        if self.pending_box is None:
+            return
+        rect, self.pending_box = self.pending_box, None
+        label = {
+            "name": text,
+            "pose": "Unspecified",
+            "truncated": 0,
+            "difficult": 0,
+            "bndbox": [
+                int(round(rect.left())),
+                int(round(rect.top())),
+                int(round(rect.right())),
+                int(round(rect.bottom())),
+            ],
+        }
+        self.labels.append(label)
+        self.label_items.append(self.add_label_items(label))
+
+    def undo_last_label(self) -> None:
+        if not self.labels:
+            return
+        self.labels.pop()
+        for item in self.label_items.pop():
+            self.scene.removeItem(item)
+
+    def save_labels(self) -> None:
+        self.labels_saved.emit(list(self.labels), [self.pyramid.width, self.pyramid.height, 3])
+        self.statusBar().showMessage("已保存", 3000)
+
+    def closeEvent(self, event: QtGui.QCloseEvent) -> None:  # type: ignore[override]
+        self.item.wanted = frozenset()
+        self.item.pool.clear()
+        # an unfinished pyramid build keeps running: its tiles are reused next time
+        self.cache.clear()
+        super().closeEvent(event)
@@ -1,10 +1,24 @@
 import sys
+
+from util import startup_profile
+
+# --profile-startup：打印各启动阶段和模块导入的耗时
+if "--profile-startup" in sys.argv:
+    sys.argv.remove("--profile-startup")
+    startup_profile.enable()
+
 from PyQt5.QtWidgets import QApplication
 
+startup_profile.mark("导入 PyQt5")
 from GUI.main import (MainFunc)
 
+startup_profile.mark("导入界面代码")
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    startup_profile.mark("创建 QApplication")
     main = MainFunc()
+    startup_profile.mark("构建主窗口")
     main.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    startup_profile.mark("显示窗口")
+    sys.exit(app.exec_())
@@ -1,22 +1,47 @@
+import copy
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
 import numpy as np
 from sampro.device import resolve_device
-from sampro.sam2.build_sam import build_sam2
+from sampro.sam2.build_sam import build_sam2, resize_sam2_model
 from sampro.sam2.sam2_image_predictor import SAM2ImagePredictor
-from sampro.LabelVideo_TW import resolve_checkpoint_path
+from sampro.model_paths import (
+    CONFIG_KEY_DECODER_BACKEND,
+    CONFIG_KEY_ENCODER_BACKEND,
+    resolve_checkpoint_path,
+    resolve_decoder_onnx_path,
+    resolve_encoder_onnx_path,
+    resolve_image_size,
+    resolve_preview_image_size,
+    resolve_snapshot_dir,
+)
+from sampro.auto_propose import build_mask_generator, propose_objects, resolve_preset
+from util.config import load_config
 
 SAMPRO_ROOT = Path(__file__).resolve().parent
+# ROI 放大标注：点击小目标或拖动框选区域时，只在原始分辨率的裁剪区域上编码和解码。
+# roi_size 为裁剪区域的最小边长（原图像素），roi_cache_size 为缓存的裁剪区域特征个数
+CONFIG_KEY_ROI_SIZE = "roi_size"
+CONFIG_KEY_ROI_CACHE_SIZE = "roi_cache_size"
+DEFAULT_ROI_SIZE = 1024
+DEFAULT_ROI_CACHE_SIZE = 8
+# 裁剪区域在提示外接框四周各留出的比例，以及裁剪位置对齐的步长（便于复用缓存）
+ROI_MARGIN = 0.25
+ROI_ALIGN = 32
 
 class Anything_TW():
     def __init__(self):
-        checkpoint_path = resolve_checkpoint_path()
+        self.device = resolve_device()
+        # 同目录下有转换好的半精度/int8 权重变体时优先使用
+        checkpoint_path = resolve_checkpoint_path(self.device)
 
         self.sam2_checkpoint = str(checkpoint_path)
         self.model_cfg = os.getenv("SAM2_MODEL_CONFIG", "configs/sam2.1/sam2.1_hiera_l.yaml")
-        self.device = resolve_device()
         #全局变量
         self.coords = []
         self.methods = []
@@ -40,13 +65,157 @@ class Anything_TW():
         self.w = None
         self.h = None
 
-        self.sam2_model = build_sam2(self.model_cfg, self.sam2_checkpoint, device=self.device)
-        self.predictor = SAM2ImagePredictor(self.sam2_model)
+        # 配置了较低的输入分辨率时用于快速预览
+        image_size = resolve_image_size()
+        self.sam2_model = build_sam2(
+            self.model_cfg,
+            self.sam2_checkpoint,
+            device=self.device,
+            snapshot_dir=resolve_snapshot_dir(),
+            image_size=image_size,
+        )
+        # 图像编码和逐次点击的解码都可以分别交给 ONNX Runtime
+        self.predictor = SAM2ImagePredictor(
+            self.sam2_model,
+            image_encoder=self.Load_Onnx_Encoder(checkpoint_path, self.sam2_model, image_size),
+        )
+        self.onnx_decoders = {
+            "full": self.Load_Onnx_Decoder(checkpoint_path, self.sam2_model, image_size)
+        }
+
+        # 由粗到精：打开图片时先用低分辨率的预览特征响应点击，完整特征在后台计算，
+        # 就绪后自动替换并重新解码当前点击；预览模型与完整模型共用同一份权重
+        self.preview_predictor = None
+        self.full_embedding_future = None
+        preview_size = resolve_preview_image_size(self.device)
+        if preview_size is not None and preview_size < self.sam2_model.image_size:
+            preview_model = resize_sam2_model(self.sam2_model, preview_size)
+            self.preview_predictor = SAM2ImagePredictor(
+                preview_model,
+                image_encoder=self.Load_Onnx_Encoder(checkpoint_path, preview_model, preview_size),
+            )
+            self.onnx_decoders["preview"] = self.Load_Onnx_Decoder(
+                checkpoint_path, preview_model, preview_size
+            )
+            self.full_embedding_executor = ThreadPoolExecutor(max_workers=1)
+        # 当前响应点击的特征级别："preview" 或 "full"
+        self.embedding_level = "full"
+        # 每次点击由哪一级特征给出结果，与 self.coords 一一对应
+        self.click_levels = []
+        self.image_generation = 0
+        # 点击、保存与后台替换特征互斥
+        self.lock = threading.RLock()
+        # 完整特征就绪并重新解码了当前点击后调用（在后台线程中），GUI 据此刷新显示
+        self.on_full_embedding_ready = None
+
+        # ROI 放大标注的状态，裁剪区域的特征按 LRU 缓存（切换图片时清空）
+        config = load_config()
+        self.roi_mode = False
+        self.roi_size = int(config.get(CONFIG_KEY_ROI_SIZE, DEFAULT_ROI_SIZE))
+        self.roi_cache_size = int(config.get(CONFIG_KEY_ROI_CACHE_SIZE, DEFAULT_ROI_CACHE_SIZE))
+        self.roi_cache = OrderedDict()
+        self.roi_predictor = None
+        self.source_image = None
+        self.source_scale = np.ones(2)
+        self.Reset_Roi_State()
+        # 每个速度预设对应一个 AMG，与交互预测器共用同一个模型
+        self.proposal_generators = {}
+
+    #加载 ONNX 解码器，不可用时返回 None（使用 PyTorch 解码）
+    def Load_Onnx_Decoder(self, checkpoint_path, model, image_size=None):
+        backend = load_config().get(CONFIG_KEY_DECODER_BACKEND, "auto")
+        if backend == "torch":
+            return None
+        if backend == "auto" and not str(self.device).startswith("cpu"):
+            # GPU 上 PyTorch 解码已经很快，且不需要把图像特征拷回内存
+            return None
+        onnx_path = resolve_decoder_onnx_path(checkpoint_path, self.device, image_size)
+        if onnx_path is None:
+            if backend == "onnx":
+                print("未找到 ONNX 解码器，请先运行 sampro/tools/export_onnx_decoder.py，暂时使用 PyTorch 解码")
+            return None
+        try:
+            from sampro.sam2.utils.onnx import OnnxPromptDecoder
+
+            decoder = OnnxPromptDecoder(str(onnx_path))
+        except ImportError:
+            print("未安装 onnxruntime，使用 PyTorch 解码")
+            return None
+        except Exception as e:
+            print(f"加载 ONNX 解码器失败：{e}，使用 PyTorch 解码")
+            return None
+        if decoder.image_embedding_size != model.sam_image_embedding_size:
+            print(f"ONNX 解码器与模型输入分辨率 {model.image_size} 不符，使用 PyTorch 解码")
+            return None
+        print(f"使用 ONNX Runtime 解码：{onnx_path}")
+        return decoder
+
+    #加载 ONNX 图像编码器，不可用时返回 None（使用 PyTorch 编码）
+    def Load_Onnx_Encoder(self, checkpoint_path, model, image_size=None):
+        backend = load_config().get(CONFIG_KEY_ENCODER_BACKEND, "auto")
+        if backend == "torch":
+            return None
+        if backend == "auto" and not str(self.device).startswith("cpu"):
+            return None
+        onnx_path = resolve_encoder_onnx_path(checkpoint_path, self.device, image_size)
+        if onnx_path is None:
+            if backend == "onnx":
+                print("未找到 ONNX 图像编码器，请先运行 sampro/tools/export_onnx_encoder.py，暂时使用 PyTorch 编码")
+            return None
+        try:
+            from sampro.sam2.utils.onnx import OnnxImageEncoder
 
-    #设置图像
-    def Set_Image(self, image):
-        self.predictor.set_image(image)
+            encoder = OnnxImageEncoder(str(onnx_path))
+        except ImportError:
+            print("未安装 onnxruntime，使用 PyTorch 编码")
+            return None
+        except Exception as e:
+            print(f"加载 ONNX 图像编码器失败：{e}，使用 PyTorch 编码")
+            return None
+        if encoder.image_size != model.image_size:
+            print(f"ONNX 图像编码器与模型输入分辨率 {model.image_size} 不符，使用 PyTorch 编码")
+            return None
+        print(f"使用 ONNX Runtime 编码图像：{onnx_path}")
+        return encoder
 
+    #用当前图像特征预测 mask，参数与 SAM2ImagePredictor.predict 相同；level 缺省为当前特征级别
+    def Predict(self, level=None, **kwargs):
+        level = level or self.embedding_level
+        predictor = {
+            "full": self.predictor,
+            "preview": self.preview_predictor,
+            "roi": self.roi_predictor,
+        }[level]
+        # ROI 的裁剪区域以完整分辨率编码
+        decoder = self.onnx_decoders.get("preview" if level == "preview" else "full")
+        if decoder is not None:
+            return decoder.predict(predictor, **kwargs)
+        return predictor.predict(**kwargs)
+
+    #设置图像；source_image 为缩放前的原图，ROI 放大标注在原图上裁剪，缺省时使用 image
+    def Set_Image(self, image, source_image=None):
+        with self.lock:
+            self.image_generation += 1
+            self.source_image = image if source_image is None else source_image
+            self.source_scale = np.array(
+                [self.source_image.shape[1] / image.shape[1], self.source_image.shape[0] / image.shape[0]]
+            )
+            self.roi_cache.clear()
+            if self.preview_predictor is None:
+                self.predictor.set_image(image)
+            else:
+                # 先算预览特征以便立即响应点击，完整特征交给后台线程
+                if self.full_embedding_future is not None:
+                    self.full_embedding_future.cancel()
+                self.preview_predictor.set_image(image)
+                self.embedding_level = "preview"
+                self.full_embedding_future = self.full_embedding_executor.submit(
+                    self.Encode_Full_Image, image.copy(), self.image_generation
+                )
+            self.Reset_Image_State(image)
+
+    #重置图像与交互状态
+    def Reset_Image_State(self, image):
         #初始图像
         self.image = image.copy()
         #画了点的图像
@@ -63,7 +232,98 @@ class Anything_TW():
         self.logits = None
         self.scores = None
         self.mask = None
+        self.click_levels = []
+        self.Reset_Roi_State()
+
+    #后台计算完整分辨率的图像特征，完成后替换预览特征并用它重新解码当前点击
+    def Encode_Full_Image(self, image, generation):
+        try:
+            # 在副本上计算，切换前仍可用旧特征，Current_Embedding 的快照也不受影响
+            predictor = copy.copy(self.predictor)
+            predictor.set_image(image)
+        except Exception as e:
+            print(f"计算完整分辨率图像特征失败：{e}")
+            raise
+        with self.lock:
+            if generation != self.image_generation:
+                # 已切换到其他图片
+                return predictor
+            self.predictor = predictor
+            self.embedding_level = "full"
+            refined = self.Refine_Mask()
+        if refined and self.on_full_embedding_ready is not None:
+            self.on_full_embedding_ready()
+        return predictor
+
+    #等待当前图片的完整特征；后台计算失败时在当前线程重新计算，保存的 mask 不会退回预览特征
+    def Wait_Full_Embedding(self):
+        future = self.full_embedding_future
+        if future is None:
+            return
+        try:
+            future.result()
+            return
+        except Exception as e:
+            print(f"后台计算完整分辨率图像特征失败（{e}），在当前线程重新计算")
+        with self.lock:
+            if future is not self.full_embedding_future:
+                return
+            predictor = copy.copy(self.predictor)
+            predictor.set_image(self.image)
+            self.predictor = predictor
+            self.embedding_level = "full"
+            self.full_embedding_future = None
+
+    #用完整特征按原顺序重新解码当前的点击，返回是否重新解码
+    def Refine_Mask(self):
+        with self.lock:
+            if self.embedding_level != "full" or "preview" not in self.click_levels:
+                return False
+            self.option = False
+            for i in range(1, len(self.coords) + 1):
+                self.Decode_Clicks(self.coords[:i], self.methods[:i])
+            self.click_levels = ["full"] * len(self.coords)
+            return True
+
+    #当前图像特征的快照，后台线程使用时不受随后 Set_Image 的影响
+    def Current_Embedding(self):
+        # 由粗到精时返回完整特征的 Future，由 Auto_Propose 在后台线程中等待
+        if self.full_embedding_future is not None:
+            return self.full_embedding_future
+        return copy.copy(self.predictor)
+
+    #自动生成候选框
+    def Auto_Propose(self, image=None, preset=None, existing_boxes=None, image_predictor=None):
+        """对整张图运行 AMG，返回过滤后的候选框列表（见 `sampro.auto_propose.Proposal`）。
 
+        image 缺省时使用当前图片并复用 Set_Image 计算的特征；传入其他图片时，
+        只有同时传入该图片对应的 image_predictor（`Current_Embedding` 的返回值）才会复用特征。
+        """
+        if image is None:
+            image = self.image
+            if image_predictor is None:
+                image_predictor = self.Current_Embedding()
+        if isinstance(image_predictor, Future):
+            try:
+                image_predictor = image_predictor.result()
+            except Exception:
+                # 完整特征没有算出来，由 AMG 自行编码
+                image_predictor = None
+
+        preset = resolve_preset(preset)
+        generator = self.proposal_generators.get(preset)
+        if generator is None:
+            generator = build_mask_generator(self.sam2_model, preset)
+            # 裁剪区域的编码与交互预测使用同一个图像编码器
+            generator.predictor.image_encoder = self.predictor.image_encoder
+            self.proposal_generators[preset] = generator
+
+        return propose_objects(
+            generator,
+            image,
+            image_predictor=image_predictor,
+            existing_boxes=existing_boxes,
+        )
 
     #设置点击
     def Set_Clicked(self, clicked, method):
@@ -73,6 +333,10 @@ class Anything_TW():
     #键盘点击事件
     def Key_Event(self, key):
         if key == 83:
+            # 保存的 mask 总是由完整分辨率的特征给出
+            if "preview" in self.click_levels:
+                self.Wait_Full_Embedding()
+                self.Refine_Mask()
             self.image_save = self.Draw_Mask(self.mask, self.image_save)
 
             self.image_dot = self.image.copy()
@@ -80,9 +344,11 @@ class Anything_TW():
 
             self.coords = []
             self.methods = []
+            self.click_levels = []
             self.option = False
             self.logits = None
             self.scores = None
+            self.Reset_Roi_State()
 
 
         elif key == 81:
@@ -91,9 +357,11 @@ class Anything_TW():
 
             self.coords = []
             self.methods = []
+            self.click_levels = []
             self.option = False
             self.logits = None
             self.scores = None
+            self.Reset_Roi_State()
 
         #键盘的backspace键
         elif key == 16777219:
@@ -104,9 +372,11 @@ class Anything_TW():
 
             self.coords = []
             self.methods = []
+            self.click_levels = []
             self.option = False
             self.logits = None
             self.scores = None
+            self.Reset_Roi_State()
 
         return self.image_mask
             
@@ -114,6 +384,9 @@ class Anything_TW():
     
     #显示点
     def Draw_Point(self, image,label):
+        if self.clicked_x is None:
+            # ROI 模式下只框选了区域，没有点击
+            return
         if label == 1:
             cv2.circle(image, (self.clicked_x, self.clicked_y), 5, (255, 0, 0), -1) 
         elif label == 0:
@@ -121,33 +394,147 @@ class Anything_TW():
             
     #创建Mask
     def Create_Mask(self):
-        self.coords.append([self.clicked_x, self.clicked_y])
-        self.methods.append(self.method)
-        
-        if self.option == False:
-            input_point = np.array(self.coords)
-            input_method = np.array(self.methods)
+        with self.lock:
+            self.coords.append([self.clicked_x, self.clicked_y])
+            self.methods.append(self.method)
+            if self.roi_mode:
+                self.Decode_Roi()
+                return
+            self.Decode_Clicks(self.coords, self.methods)
+            self.click_levels.append(self.embedding_level)
+
+    #按点击序列预测 mask：第一次点击输出三个候选，之后以上一次最好的结果作为 mask 输入
+    def Decode_Clicks(self, coords, methods, level=None, box=None):
+        prompts = {}
+        if len(coords) > 0:
+            prompts["point_coords"] = np.array(coords)
+            prompts["point_labels"] = np.array(methods)
+        if box is not None:
+            prompts["box"] = box
 
-            self.masks, self.scores, self.logits = self.predictor.predict(
-                point_coords = input_point,
-                point_labels = input_method,
-                multimask_output = True,
+        if self.option == False:
+            self.masks, self.scores, self.logits = self.Predict(
+                level,
+                # 只有框时一个 mask 就足够明确
+                multimask_output = box is None,
+                **prompts,
             )
             self.option = True
 
         else:
-            input_point = np.array(self.coords)
-            input_method = np.array(self.methods)
             mask_input = self.logits[np.argmax(self.scores), :, :]  # Choose the model's best mask
 
-            self.masks, self.scores, self.logits  = self.predictor.predict(
-                point_coords = input_point,
-                point_labels = input_method,
+            self.masks, self.scores, self.logits  = self.Predict(
+                level,
                 mask_input = mask_input[None, :, :],
                 multimask_output = False,
+                **prompts,
             )
 
         self.mask = self.masks[-1] 
+
+    #切换 ROI 放大标注，当前未保存的目标会被清除
+    def Set_Roi_Mode(self, enabled):
+        with self.lock:
+            if enabled == self.roi_mode:
+                return
+            self.roi_mode = enabled
+            if self.coords or self.roi_box is not None:
+                self.Key_Event(81)
+
+    def Reset_Roi_State(self):
+        # 当前目标的 ROI：框选的区域（显示坐标）与裁剪区域（原图坐标）
+        self.roi_box = None
+        self.roi_crop = None
+        self.roi_predictor = None
+        # 由原图分辨率的 mask 换算出的外接框（显示坐标 x, y, w, h）
+        self.mask_box = None
+
+    #ROI 模式下框选区域，box 为显示坐标 [x0, y0, x1, y1]
+    def Create_Roi_Box_Mask(self, box):
+        with self.lock:
+            self.roi_box = list(box)
+            self.clicked_x = self.clicked_y = None
+            self.Decode_Roi()
+
+    #ROI 模式：在原图分辨率的裁剪区域上编码并解码当前目标的点击和框，再映射回显示图像
+    def Decode_Roi(self):
+        scale = self.source_scale
+        points = np.array(self.coords, dtype=np.float64).reshape(-1, 2) * scale
+        box = None if self.roi_box is None else np.array(self.roi_box, dtype=np.float64) * np.tile(scale, 2)
+        crop = self.Roi_Crop(points, box)
+        if crop != self.roi_crop:
+            # 裁剪区域变化后，按原顺序在新区域上重新解码全部点击
+            self.roi_crop = crop
+            self.roi_predictor = self.Roi_Embedding(crop)
+            self.option = False
+            steps = range(1, len(points) + 1)
+        else:
+            steps = [len(points)]
+        offset = np.array(crop[:2], dtype=np.float64)
+        crop_box = None if box is None else box - np.tile(offset, 2)
+        for i in steps or [0]:
+            self.Decode_Clicks(points[:i] - offset, self.methods[:i], "roi", crop_box)
+        self.click_levels = ["roi"] * len(self.coords)
+        self.mask = self.Roi_To_Display(self.mask)
+
+    #根据原图坐标下的提示计算正方形裁剪区域 (x0, y0, x1, y1)，提示仍在当前区域内时沿用当前区域
+    def Roi_Crop(self, points, box):
+        height, width = self.source_image.shape[:2]
+        corners = points if box is None else np.concatenate([points, box.reshape(2, 2)])
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        if self.roi_crop is not None:
+            x0, y0, x1, y1 = self.roi_crop
+            if low[0] >= x0 and low[1] >= y0 and high[0] <= x1 and high[1] <= y1:
+                return self.roi_crop
+        side = max(self.roi_size, *((high - low) * (1 + 2 * ROI_MARGIN)))
+        crop_w, crop_h = int(min(side, width)), int(min(side, height))
+        center = (low + high) / 2
+        x0 = int(np.clip((center[0] - crop_w / 2) // ROI_ALIGN * ROI_ALIGN, 0, width - crop_w))
+        y0 = int(np.clip((center[1] - crop_h / 2) // ROI_ALIGN * ROI_ALIGN, 0, height - crop_h))
+        return (x0, y0, x0 + crop_w, y0 + crop_h)
+
+    #裁剪区域的图像特征，按 LRU 缓存
+    def Roi_Embedding(self, crop):
+        predictor = self.roi_cache.get(crop)
+        if predictor is not None:
+            self.roi_cache.move_to_end(crop)
+            return predictor
+        x0, y0, x1, y1 = crop
+        predictor = copy.copy(self.predictor)
+        predictor.set_image(np.ascontiguousarray(self.source_image[y0:y1, x0:x1]))
+        self.roi_cache[crop] = predictor
+        while len(self.roi_cache) > self.roi_cache_size:
+            self.roi_cache.popitem(last=False)
+        return predictor
+
+    #把裁剪区域上的 mask 映射为显示图像上的 mask，并换算原图分辨率下的外接框
+    def Roi_To_Display(self, crop_mask):
+        x0, y0, x1, y1 = self.roi_crop
+        scale_x, scale_y = self.source_scale
+        height, width = self.image.shape[:2]
+        mask = np.zeros((height, width), dtype=bool)
+        ys, xs = np.nonzero(crop_mask)
+        if len(xs) == 0:
+            self.mask_box = None
+            return mask
+
+        box_x0 = int(np.clip(np.floor((x0 + xs.min()) / scale_x), 0, width - 1))
+        box_y0 = int(np.clip(np.floor((y0 + ys.min()) / scale_y), 0, height - 1))
+        box_x1 = int(np.clip(np.ceil((x0 + xs.max() + 1) / scale_x), box_x0 + 1, width))
+        box_y1 = int(np.clip(np.ceil((y0 + ys.max() + 1) / scale_y), box_y0 + 1, height))
+        self.mask_box = (box_x0, box_y0, box_x1 - box_x0, box_y1 - box_y0)
+
+        dx0, dy0 = int(round(x0 / scale_x)), int(round(y0 / scale_y))
+        dx1, dy1 = min(int(round(x1 / scale_x)), width), min(int(round(y1 / scale_y)), height)
+        region = cv2.resize(
+            crop_mask.astype(np.float32), (max(dx1 - dx0, 1), max(dy1 - dy0, 1)), interpolation=cv2.INTER_AREA
+        )
+        mask[dy0:dy0 + region.shape[0], dx0:dx0 + region.shape[1]] = region[: height - dy0, : width - dx0] >= 0.5
+        if not mask.any():
+            # 目标在显示图像上不足一个像素时，用外接框表示
+            mask[box_y0:box_y1, box_x0:box_x1] = True
+        return mask
     
     #画Mask
     def Draw_Mask(self, mask, image):
@@ -180,8 +567,11 @@ class Anything_TW():
                 max_area = area
                 max_contour = contour
                 
-        # 使用矩形框绘制最大轮廓
-        self.x, self.y, self.w, self.h = cv2.boundingRect(max_contour)
+        # 使用矩形框绘制最大轮廓；ROI 模式下使用原图分辨率的 mask 换算出的外接框
+        if self.mask_box is not None:
+            self.x, self.y, self.w, self.h = self.mask_box
+        else:
+            self.x, self.y, self.w, self.h = cv2.boundingRect(max_contour)
         cv2.rectangle(img, (self.x, self.y), (self.x + self.w, self.y + self.h), (0, 255, 0), 2)
         # 在原图上绘制边缘线
         cv2.drawContours(img, contours, -1, (0, 255, 0), 2)
@@ -1,4 +1,5 @@
 import os
+import time
 from collections import defaultdict
 from pathlib import Path
 
@@ -8,63 +9,103 @@ import torch
 from PIL import Image
 
 from sampro.device import resolve_device
+from sampro.keyframe_tracking import (
+    DEFAULT_FLOW_IOU_THRESHOLD,
+    INTERPOLATION_METHODS,
+    box_iou,
+    box_to_mask,
+    flow_consistency_iou,
+    interpolate_box,
+    load_flow_frame,
+    mask_to_box,
+)
+from sampro.memory_policy import (
+    fallback_plan,
+    is_out_of_memory_error,
+    plan_video_memory,
+)
+from sampro.model_paths import resolve_checkpoint_path, resolve_snapshot_dir
 from sampro.sam2.build_sam import build_sam2_video_predictor
 from util.config import load_config
 from util.xmlfile import xml_message
 
-SAMPRO_ROOT = Path(__file__).resolve().parent
-DEFAULT_CHECKPOINT_FILENAME = "sam2.1_hiera_large.pt"
-CONFIG_KEY_SAM_CHECKPOINT = "sam_checkpoint_path"
+CONFIG_KEY_VIDEO_MEMORY_RETENTION = "video_memory_retention"
+# 每个会话按设备解析（见 memory_policy.resolve_memory_retention）：CUDA 上且跟踪状态
+# 留在显存时把注意力窗口外的非条件帧输出移到内存，否则直接丢弃，长视频的占用都保持平稳
+DEFAULT_VIDEO_MEMORY_RETENTION = "auto"
+# 显存/内存预算（MB），缺省时按当前空闲量自动检测
+CONFIG_KEY_VIDEO_DEVICE_BUDGET_MB = "video_device_memory_budget_mb"
+CONFIG_KEY_VIDEO_HOST_BUDGET_MB = "video_host_memory_budget_mb"
+# 取值 true/false 强制开启或关闭，"auto" 或缺省时由内存策略自动选择
+CONFIG_KEY_VIDEO_MEMORY_MODES = {
+    "offload_video_to_cpu": "video_offload_video_to_cpu",
+    "offload_state_to_cpu": "video_offload_state_to_cpu",
+    "async_loading_frames": "video_async_loading_frames",
+    "lazy_loading_frames": "video_lazy_loading_frames",
+}
+# 目标连续多少帧判定为不存在后暂停跟踪（缺省不暂停），以及暂停期间每隔多少帧复查一次
+CONFIG_KEY_VIDEO_ABSENT_PATIENCE = "video_absent_patience"
+CONFIG_KEY_VIDEO_ABSENT_RECHECK_INTERVAL = "video_absent_recheck_interval"
+DEFAULT_VIDEO_ABSENT_RECHECK_INTERVAL = 10
+# 每隔多少帧运行一次 SAM2（1 为逐帧跟踪），中间帧的框按 linear / spline 插值；
+# 光流一致性 IoU 低于阈值的关键帧区间会对中间帧重新运行 SAM2
+CONFIG_KEY_VIDEO_KEYFRAME_INTERVAL = "video_keyframe_interval"
+CONFIG_KEY_VIDEO_KEYFRAME_INTERPOLATION = "video_keyframe_interpolation"
+CONFIG_KEY_VIDEO_KEYFRAME_FLOW_IOU = "video_keyframe_flow_iou_threshold"
+
+
+def mask_iou(mask_a, mask_b):
+    """计算两个二值 mask 的 IoU，两者均为空时视为完全一致。"""
+    mask_a = np.asarray(mask_a, dtype=bool)
+    mask_b = np.asarray(mask_b, dtype=bool)
+    union = np.logical_or(mask_a, mask_b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(mask_a, mask_b).sum() / union)
 
 
-def resolve_checkpoint_path() -> Path:
-    """Resolve the path to the SAM checkpoint with helpful error messages."""
-
-    config = load_config()
-    configured_path = config.get(CONFIG_KEY_SAM_CHECKPOINT)
-    env_override = os.getenv("SAM2_CHECKPOINT")
-
-    if configured_path:
-        checkpoint_path = Path(configured_path)
-    elif env_override:
-        checkpoint_path = Path(env_override)
-    else:
-        checkpoint_path = SAMPRO_ROOT / "checkpoints" / DEFAULT_CHECKPOINT_FILENAME
-
-    checkpoint_path = checkpoint_path.expanduser()
-    if checkpoint_path.is_dir():
-        checkpoint_path = checkpoint_path / DEFAULT_CHECKPOINT_FILENAME
-
-    try:
-        checkpoint_path = checkpoint_path.resolve()
-    except FileNotFoundError:
-        checkpoint_path = checkpoint_path.absolute()
-
-    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
-
-    if not checkpoint_path.exists():
-        hint_directory = checkpoint_path.parent
-        raise FileNotFoundError(
-            "未找到 SAM 模型权重文件："
-            f"{checkpoint_path}.\n\n"
-            "请将模型文件复制到该位置，"
-            "或在界面中通过“File -> 选择 SAM 模型文件”重新选择权重。\n"
-            f"当前默认目录：{hint_directory}"
-        )
-
-    return checkpoint_path
-
 class AnythingVideo_TW():
     def __init__(self):
         # SAM2 模型配置
-        checkpoint_path = resolve_checkpoint_path()
+        self.device = resolve_device()
+        # 同目录下有转换好的半精度/int8 权重变体时优先使用
+        checkpoint_path = resolve_checkpoint_path(self.device)
 
         self.sam2_checkpoint = str(checkpoint_path)
         self.model_cfg = os.getenv("SAM2_MODEL_CONFIG", "configs/sam2.1/sam2.1_hiera_l.yaml")
-        self.device = resolve_device()
         self.video_path = ""
         self.output_path = ""
-        self.predictor = build_sam2_video_predictor(self.model_cfg, self.sam2_checkpoint, self.device)
+        self.predictor = build_sam2_video_predictor(
+            self.model_cfg,
+            self.sam2_checkpoint,
+            self.device,
+            # 修正点所在帧作为条件帧保存，重新传播时不会被记忆推理覆盖
+            hydra_overrides_extra=["++model.add_all_frames_to_correct_as_cond=true"],
+            snapshot_dir=resolve_snapshot_dir(),
+        )
+        config = load_config()
+        self.memory_retention = config.get(
+            CONFIG_KEY_VIDEO_MEMORY_RETENTION, DEFAULT_VIDEO_MEMORY_RETENTION
+        )
+        self.device_budget_mb = config.get(CONFIG_KEY_VIDEO_DEVICE_BUDGET_MB)
+        self.host_budget_mb = config.get(CONFIG_KEY_VIDEO_HOST_BUDGET_MB)
+        self.memory_mode_overrides = {
+            mode: config[key] for mode, key in CONFIG_KEY_VIDEO_MEMORY_MODES.items() if key in config
+        }
+        self.memory_plan = None
+        # 由界面线程置位以提前结束传播（如关闭窗口时），已跟踪的帧仍会保存
+        self.stop_requested = False
+        self.absent_patience = config.get(CONFIG_KEY_VIDEO_ABSENT_PATIENCE)
+        self.absent_recheck_interval = config.get(
+            CONFIG_KEY_VIDEO_ABSENT_RECHECK_INTERVAL, DEFAULT_VIDEO_ABSENT_RECHECK_INTERVAL
+        )
+        self.keyframe_interval = max(1, int(config.get(CONFIG_KEY_VIDEO_KEYFRAME_INTERVAL, 1)))
+        self.keyframe_interpolation = config.get(CONFIG_KEY_VIDEO_KEYFRAME_INTERPOLATION, "linear")
+        if self.keyframe_interpolation not in INTERPOLATION_METHODS:
+            self.keyframe_interpolation = "linear"
+        self.keyframe_flow_iou_threshold = config.get(
+            CONFIG_KEY_VIDEO_KEYFRAME_FLOW_IOU, DEFAULT_FLOW_IOU_THRESHOLD
+        )
 
         # 全局变量
         self.object_prompts = defaultdict(lambda: {"points": [], "labels": []})
@@ -104,10 +145,119 @@ class AnythingVideo_TW():
         self.frame = frame
         return frame
 
-    def inference(self, video_dir):
-        self.inference_state = self.predictor.init_state(video_path=video_dir)
+    def plan_memory(self, video_dir, num_objects=1):
+        """根据帧数、分辨率和目标数选择 init_state 的 offload / 异步加载模式。"""
+        frame_names = [
+            p for p in os.listdir(video_dir)
+            if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
+        ]
+        video_width, video_height = 0, 0
+        if frame_names:
+            with Image.open(os.path.join(video_dir, frame_names[0])) as first_frame:
+                video_width, video_height = first_frame.size
+
+        return plan_video_memory(
+            self.predictor,
+            num_frames=len(frame_names),
+            video_height=video_height,
+            video_width=video_width,
+            num_objects=max(1, num_objects),
+            memory_retention=self.memory_retention,
+            device_budget_mb=self.device_budget_mb,
+            host_budget_mb=self.host_budget_mb,
+            overrides=self.memory_mode_overrides,
+        )
+
+    def inference(self, video_dir, num_objects=1):
+        self.memory_plan = self.plan_memory(video_dir, num_objects)
+        print(f"视频内存策略: {self.memory_plan.describe()}")
+        try:
+            self.inference_state = self.predictor.init_state(
+                video_path=video_dir,
+                **self.memory_plan.init_state_kwargs(),
+            )
+        except Exception as exc:
+            if not is_out_of_memory_error(exc):
+                raise
+            # 估算不足时退回到最保守的模式，而不是直接崩溃
+            self.inference_state = None
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            self.memory_plan = fallback_plan(self.memory_plan)
+            print(f"加载视频时内存不足，改用: {self.memory_plan.describe()}")
+            self.inference_state = self.predictor.init_state(
+                video_path=video_dir,
+                **self.memory_plan.init_state_kwargs(),
+            )
         self.predictor.reset_state(self.inference_state)
 
+    def get_memory_stats(self):
+        """返回每个目标在记忆库中保留的帧数与字节数。"""
+        if self.inference_state is None:
+            return {}
+        return self.predictor.get_memory_retention_stats(self.inference_state)
+
+    def save_session(self, session_dir, half_precision=False, extra=None):
+        """保存当前视频推理会话（提示点、条件帧输出、记忆特征与已跟踪帧信息）。
+
+        Args:
+            half_precision: 为 True 时记忆特征与 mask logits 以 float16 保存，文件约减半。
+            extra: 额外需要随会话保存的信息（需可 JSON 序列化），恢复时原样返回。
+        """
+        if self.inference_state is None:
+            raise RuntimeError("尚未初始化视频推理状态，无法保存会话")
+        meta = {
+            "object_prompts": {
+                str(obj_id): {
+                    "points": np.asarray(prompts["points"], dtype=np.float32).tolist(),
+                    "labels": np.asarray(prompts["labels"], dtype=np.int32).tolist(),
+                }
+                for obj_id, prompts in self.object_prompts.items()
+            },
+            "last_obj_id": self.last_obj_id,
+            "extra": extra or {},
+        }
+        self.predictor.save_inference_state(
+            self.inference_state, session_dir, half_precision=half_precision, extra_meta=meta
+        )
+        print(f"视频会话已保存到: {session_dir}")
+
+    def load_session(self, session_dir, video_dir=None):
+        """恢复 `save_session` 保存的会话，记忆特征按需从磁盘映射读取，无需重新传播。
+
+        Args:
+            video_dir: 帧目录已移动时指定新的位置，缺省使用会话中记录的路径。
+
+        Returns:
+            保存会话时传入的 extra 信息。
+        """
+        self.inference_state = self.predictor.load_inference_state(
+            session_dir, video_path=video_dir
+        )
+        self.video_path = self.inference_state["video_path"]
+        meta = self.inference_state["session_meta"]
+        self.object_prompts.clear()
+        for obj_id, prompts in meta.get("object_prompts", {}).items():
+            self.object_prompts[int(obj_id)] = {
+                "points": prompts["points"],
+                "labels": prompts["labels"],
+            }
+        self.last_obj_id = meta.get("last_obj_id")
+        self.video_segments = {}
+        print(f"已恢复视频会话: {session_dir}，已跟踪到第 {self.next_untracked_frame()} 帧")
+        return meta.get("extra", {})
+
+    def next_untracked_frame(self):
+        """返回所有目标都尚未跟踪到的第一帧，恢复会话后可从该帧继续传播。"""
+        if self.inference_state is None:
+            return 0
+        frames_tracked = self.inference_state["frames_tracked_per_obj"]
+        if not frames_tracked:
+            return 0
+        return min(
+            max(tracked, default=-1) + 1 for tracked in frames_tracked.values()
+        )
+
     def extract_frames_from_video(self, video_path, output_dir, fps=24):
         """
         从视频中提取帧并保存为图片
@@ -213,8 +363,7 @@ class AnythingVideo_TW():
         elif label == 0:
             cv2.circle(image, (self.clicked_x, self.clicked_y), 5, (0, 0, 255), -1)  # 红色点
 
-    def add_new_points_or_box(self, obj_id=None):
-        ann_frame_idx = 0  # 当前帧的索引
+    def add_new_points_or_box(self, obj_id=None, ann_frame_idx=0):
         if obj_id is None:
             obj_id = self.last_obj_id or 1
 
@@ -235,6 +384,86 @@ class AnythingVideo_TW():
         self.option = True
         
 
+    def correct_at_frame(
+        self,
+        frame_idx,
+        obj_id,
+        points,
+        labels,
+        iou_threshold=0.95,
+        patience=3,
+        progress_callback=None,
+    ):
+        """
+        在已传播的视频上对某一帧添加修正点，并只重新计算受影响的帧
+        Args:
+            frame_idx (int): 修正点所在帧序号
+            obj_id (int): 被修正的目标
+            points, labels: 修正点坐标 [[x, y], ...] 与正负标签
+            iou_threshold (float): 新旧 mask 的 IoU 达到该值视为已收敛
+            patience (int): 连续收敛多少帧后停止传播，其后的帧沿用之前的结果
+        Returns:
+            list: 重新计算过的帧序号（需要更新标注的帧）
+        """
+        obj_idx = self.inference_state["obj_id_to_idx"].get(obj_id)
+        frames_tracked = (
+            self.inference_state["frames_tracked_per_obj"][obj_idx] if obj_idx is not None else {}
+        )
+        # 已跟踪过的帧只沿原跟踪方向受影响，新帧则向前、向后都需要传播
+        if frame_idx in frames_tracked:
+            directions = [frames_tracked[frame_idx]["reverse"]]
+        else:
+            directions = [False, True]
+
+        # evict 策略下该帧的输出及其之前的记忆帧可能已被丢弃，先重新跟踪恢复，
+        # 否则修正点在缺少记忆的情况下解码，收敛判断也与原结果不可比
+        restored_frames = self.predictor.restore_frame_context(
+            self.inference_state, frame_idx, obj_id
+        )
+        if restored_frames:
+            print(f"修正第 {frame_idx} 帧: 重新跟踪 {len(restored_frames)} 帧以恢复记忆")
+
+        _, self.out_obj_ids, self.out_mask_logits = self.predictor.add_new_points_or_box(
+            inference_state=self.inference_state,
+            frame_idx=frame_idx,
+            obj_id=obj_id,
+            points=np.array(points),
+            labels=np.array(labels),
+        )
+
+        recomputed_frames = set()
+        for reverse in directions:
+            converged_frames = 0
+            for out_frame_idx, _, out_mask_logits in self.predictor.propagate_in_video(
+                self.inference_state,
+                start_frame_idx=frame_idx,
+                reverse=reverse,
+                obj_ids=[obj_id],
+            ):
+                new_mask = (out_mask_logits[0] > 0.0).cpu().numpy()
+                frame_segments = self.video_segments.setdefault(out_frame_idx, {})
+                prev_mask = frame_segments.get(obj_id)
+                frame_segments[obj_id] = new_mask
+                recomputed_frames.add(out_frame_idx)
+
+                if progress_callback:
+                    progress_callback(out_frame_idx, self.inference_state["num_frames"])
+
+                if (
+                    out_frame_idx != frame_idx
+                    and prev_mask is not None
+                    and mask_iou(prev_mask, new_mask) >= iou_threshold
+                ):
+                    converged_frames += 1
+                else:
+                    converged_frames = 0
+                if converged_frames >= patience:
+                    break
+
+        recomputed_frames = sorted(recomputed_frames)
+        print(f"修正第 {frame_idx} 帧: 重新计算 {len(recomputed_frames)} 帧")
+        return recomputed_frames
+
     # def Draw_Mask(self, mask, frame,obj_id=None):
     #     # 转换 mask 为 NumPy 数组
     #     mask = mask.cpu().numpy() if isinstance(mask, torch.Tensor) else mask
@@ -400,6 +629,185 @@ class AnythingVideo_TW():
 
 
 
+    def _frame_paths(self):
+        frame_names = [
+            p for p in os.listdir(self.video_path)
+            if os.path.splitext(p)[-1].lower() in [".jpg", ".jpeg"]
+        ]
+        frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+        return [os.path.join(self.video_path, name) for name in frame_names]
+
+    def _collect_video_segments(self, keyframe_interval=1, start_frame_idx=None):
+        """传播并把每帧每个目标的 mask 写入 `self.video_segments`。
+
+        keyframe_interval > 1 时只在关键帧运行 SAM2；相邻关键帧之间若目标出现/消失，
+        或光流一致性检查未通过，则对中间帧重新运行 SAM2（加密），否则按框插值。
+        start_frame_idx 缺省从最早的条件帧开始，恢复会话时传入 `next_untracked_frame()` 继续传播；
+        `self.stop_requested` 置位后在当前帧结束传播。
+
+        Returns:
+            dict: 关键帧、加密帧与插值帧的数量，均按“目标×帧”计（每个目标在一帧上的结果计 1）
+        """
+        propagate_kwargs = {
+            "start_frame_idx": start_frame_idx,
+            "absent_patience": self.absent_patience,
+            "absent_recheck_interval": self.absent_recheck_interval,
+        }
+        stats = {"keyframes": 0, "densified_frames": 0, "interpolated_frames": 0}
+        self.video_segments = {}
+
+        def _store(out_frame_idx, out_obj_ids, out_mask_logits):
+            segments = self.video_segments.setdefault(out_frame_idx, {})
+            for i, out_obj_id in enumerate(out_obj_ids):
+                segments[out_obj_id] = (out_mask_logits[i] > 0.0).cpu().numpy()
+
+        if keyframe_interval <= 1:
+            for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(
+                self.inference_state, **propagate_kwargs
+            ):
+                _store(out_frame_idx, out_obj_ids, out_mask_logits)
+                stats["keyframes"] += len(out_obj_ids)
+                if self.stop_requested:
+                    break
+            return stats
+
+        frame_paths = self._frame_paths()
+        flow_frames = {}
+
+        def _flow_frame(frame_idx):
+            if frame_idx not in flow_frames:
+                flow_frames[frame_idx] = load_flow_frame(frame_paths[frame_idx])
+            return flow_frames[frame_idx]
+
+        def _densify(first_key, next_key, obj_ids):
+            # 中间帧逐帧跟踪；其输出只用于生成标注，之后随关键帧的记忆窗口一起淘汰，
+            # 因此这里不做淘汰，避免误删关键帧跟踪仍需要的记忆
+            if next_key - first_key < 2:
+                return
+            for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(
+                self.inference_state,
+                start_frame_idx=first_key + 1,
+                max_frame_num_to_track=next_key - first_key - 2,
+                obj_ids=obj_ids,
+                memory_retention="all",
+            ):
+                _store(out_frame_idx, out_obj_ids, out_mask_logits)
+                stats["densified_frames"] += len(out_obj_ids)
+
+        keyframes = []
+        all_obj_ids = list(self.inference_state["obj_ids"])
+        for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(
+            self.inference_state, frame_stride=keyframe_interval, **propagate_kwargs
+        ):
+            _store(out_frame_idx, out_obj_ids, out_mask_logits)
+            stats["keyframes"] += len(out_obj_ids)
+            if keyframes:
+                prev_key = keyframes[-1]
+                gray_frames = [_flow_frame(t) for t in range(prev_key, out_frame_idx + 1)]
+                to_densify = []
+                for obj_id in out_obj_ids:
+                    mask_a = self.video_segments[prev_key][obj_id]
+                    mask_b = self.video_segments[out_frame_idx][obj_id]
+                    if mask_a.any() != mask_b.any():
+                        to_densify.append(obj_id)  # 目标在区间内出现或消失
+                    elif mask_a.any() and flow_consistency_iou(
+                        mask_a, mask_b, gray_frames
+                    ) < self.keyframe_flow_iou_threshold:
+                        to_densify.append(obj_id)
+                if to_densify:
+                    _densify(prev_key, out_frame_idx, to_densify)
+            for t in [t for t in flow_frames if t < out_frame_idx]:
+                del flow_frames[t]
+            keyframes.append(out_frame_idx)
+            if self.stop_requested:
+                break
+
+        if keyframes and keyframes[-1] < len(frame_paths) - 1 and not self.stop_requested:
+            # 最后一个关键帧之后不足一个间隔的帧直接逐帧跟踪
+            _densify(keyframes[-1], len(frame_paths), all_obj_ids)
+
+        # 其余中间帧按关键帧的框插值
+        height = self.inference_state["video_height"]
+        width = self.inference_state["video_width"]
+        key_boxes = {
+            t: {obj_id: mask_to_box(mask) for obj_id, mask in self.video_segments[t].items()}
+            for t in keyframes
+        }
+        for k, (first_key, next_key) in enumerate(zip(keyframes[:-1], keyframes[1:])):
+            before = key_boxes[keyframes[k - 1]] if k > 0 else {}
+            after = key_boxes[keyframes[k + 2]] if k + 2 < len(keyframes) else {}
+            for obj_id in all_obj_ids:
+                box_a = key_boxes[first_key].get(obj_id)
+                box_b = key_boxes[next_key].get(obj_id)
+                for t in range(first_key + 1, next_key):
+                    segments = self.video_segments.setdefault(t, {})
+                    if obj_id in segments:
+                        continue
+                    box = None
+                    if box_a is not None and box_b is not None:
+                        box = interpolate_box(
+                            box_a,
+                            box_b,
+                            (t - first_key) / (next_key - first_key),
+                            box_before=before.get(obj_id),
+                            box_after=after.get(obj_id),
+                            method=self.keyframe_interpolation,
+                        )
+                    segments[obj_id] = box_to_mask(box, height, width)
+                    stats["interpolated_frames"] += 1
+        return stats
+
+    def _clear_propagation_results(self):
+        """清除传播得到的非条件帧输出，保留提示点与条件帧，便于以不同设置重新传播。"""
+        for obj_idx, obj_output_dict in self.inference_state["output_dict_per_obj"].items():
+            obj_output_dict["non_cond_frame_outputs"].clear()
+            frames_tracked = self.inference_state["frames_tracked_per_obj"][obj_idx]
+            for t in [t for t in frames_tracked if t not in obj_output_dict["cond_frame_outputs"]]:
+                del frames_tracked[t]
+        self.video_segments = {}
+
+    def benchmark_keyframe_intervals(self, intervals=(2, 4, 8)):
+        """比较不同关键帧间隔的耗时与框一致性（以逐帧跟踪的框为基准），需先添加提示点。
+
+        Returns:
+            list[dict]: 每个间隔的耗时、加速比、SAM2 运行与插值的“目标×帧”数以及框 IoU 的均值与最小值
+        """
+        results = []
+        reference_boxes = None
+        reference_seconds = None
+        for interval in sorted({1, *intervals}):
+            self._clear_propagation_results()
+            start = time.perf_counter()
+            stats = self._collect_video_segments(interval)
+            seconds = time.perf_counter() - start
+            boxes = {
+                t: {obj_id: mask_to_box(mask) for obj_id, mask in segments.items()}
+                for t, segments in self.video_segments.items()
+            }
+            if reference_boxes is None:
+                reference_boxes, reference_seconds = boxes, seconds
+            ious = [
+                box_iou(ref_box, boxes.get(t, {}).get(obj_id))
+                for t, ref in reference_boxes.items()
+                for obj_id, ref_box in ref.items()
+            ]
+            result = {
+                "interval": interval,
+                "seconds": seconds,
+                "speedup": reference_seconds / seconds if seconds > 0 else float("inf"),
+                "sam_object_frames": stats["keyframes"] + stats["densified_frames"],
+                "interpolated_object_frames": stats["interpolated_frames"],
+                "mean_box_iou": float(np.mean(ious)) if ious else 1.0,
+                "min_box_iou": float(np.min(ious)) if ious else 1.0,
+            }
+            results.append(result)
+            print(
+                f"关键帧间隔 {interval}: 耗时 {seconds:.2f}s，加速 {result['speedup']:.2f}x，"
+                f"框 IoU 均值 {result['mean_box_iou']:.3f} / 最低 {result['min_box_iou']:.3f}"
+            )
+        self._clear_propagation_results()
+        return results
+
     def Draw_Mask_at_frame(
         self,
         start_frame=0,
@@ -408,24 +816,44 @@ class AnythingVideo_TW():
         save_path=None,
         label_map=None,
         progress_callback=None,
+        keyframe_interval=None,
     ):
         """
         遍历所有帧并绘制轮廓
         Args:
-            start_frame (int): 起始帧序号
+            start_frame (int): 起始帧序号，大于 0 时从该帧继续传播（恢复会话时使用）
             return_frames (bool): 是否返回处理后的帧列表
             save_path (str): 保存路径
             label_map (dict): 每个 obj_id 对应的标签名称
+            keyframe_interval (int): 每隔多少帧运行一次 SAM2，缺省使用配置值（默认 1，即逐帧）
         Returns:
             tuple: (processed_frames, result, file_path, size) - processed_frames 在 return_frames=False 时为 None
         """
         # 1. 收集所有帧的分割结果
-        self.video_segments = {}
-        for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(self.inference_state):
-            self.video_segments[out_frame_idx] = {
-                out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy()
-                for i, out_obj_id in enumerate(out_obj_ids)
-            }
+        if keyframe_interval is None:
+            keyframe_interval = self.keyframe_interval
+        keyframe_stats = self._collect_video_segments(
+            keyframe_interval, start_frame_idx=start_frame or None
+        )
+        if keyframe_interval > 1:
+            print(
+                f"关键帧间隔 {keyframe_interval}（按目标×帧计）: SAM2 关键帧 {keyframe_stats['keyframes']}，"
+                f"加密 {keyframe_stats['densified_frames']}，"
+                f"插值 {keyframe_stats['interpolated_frames']}"
+            )
+        elif self.absent_patience is not None:
+            frames_tracked = self.inference_state["frames_tracked_per_obj"]
+            for obj_idx, obj_id in self.inference_state["obj_idx_to_id"].items():
+                num_suspended = sum(
+                    1 for t in self.video_segments if t not in frames_tracked[obj_idx]
+                )
+                if num_suspended:
+                    print(f"目标 {obj_id} 离开画面，暂停跟踪 {num_suspended} 帧")
+        for obj_id, stats in self.get_memory_stats().items():
+            print(
+                f"目标 {obj_id} 记忆库占用: {stats['retained_bytes'] / 1024 ** 2:.1f} MB "
+                f"({stats['num_cond_frames']} 条件帧, {stats['num_non_cond_frames']} 非条件帧)"
+            )
 
         # 2. 获取所有帧的名称
         frame_names = [
@@ -444,6 +872,8 @@ class AnythingVideo_TW():
         total_frames = len(frame_names)
 
         for frame_idx in range(start_frame, total_frames):
+            if self.stop_requested and frame_idx not in self.video_segments:
+                break  # 传播已提前结束，之后的帧留待恢复会话时继续
             frame_path = os.path.join(self.video_path, frame_names[frame_idx])
             frame = cv2.imread(frame_path)
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -452,6 +882,9 @@ class AnythingVideo_TW():
 
             if frame_idx in self.video_segments:
                 for out_obj_id, out_mask in self.video_segments[frame_idx].items():
+                    if not out_mask.any():
+                        # 目标不在画面中（或已暂停跟踪），该帧不生成标注
+                        continue
                     # 检查 Draw_Mask 的返回值
                     result = self.Draw_Mask(out_mask, frame.copy(), out_obj_id)
                     if isinstance(result, tuple) and len(result) == 5:
@@ -0,0 +1,215 @@
+"""自动候选框：用 SAM2AutomaticMaskGenerator 为整张图生成 mask，再转换为待确认的候选框。
+
+既可在 GUI 中打开图片后于后台线程运行，也可作为命令行工具批量处理目录：
+
+    python -m sampro.auto_propose <图片目录> --preset fast --output proposals.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sampro.sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+
+Box = Tuple[int, int, int, int]
+
+CONFIG_KEY_AUTO_PROPOSE_ON_OPEN = "auto_propose_on_open"
+CONFIG_KEY_AUTO_PROPOSE_PRESET = "auto_propose_preset"
+
+# 速度预设：网格点数决定解码器调用次数，crop_n_layers 决定图像编码次数
+AUTO_PROPOSE_PRESETS: Dict[str, Dict[str, Any]] = {
+    "fast": {"points_per_side": 16, "points_per_batch": 64, "crop_n_layers": 0},
+    "balanced": {"points_per_side": 32, "points_per_batch": 64, "crop_n_layers": 0},
+    "accurate": {
+        "points_per_side": 32,
+        "points_per_batch": 64,
+        "crop_n_layers": 1,
+        "crop_batch_size": 4,
+    },
+}
+DEFAULT_AUTO_PROPOSE_PRESET = "fast"
+
+# 候选框过滤阈值：面积按占整图的比例计算
+DEFAULT_MIN_AREA_RATIO = 0.001
+DEFAULT_MAX_AREA_RATIO = 0.9
+DEFAULT_MIN_STABILITY = 0.9
+DEFAULT_MAX_PROPOSALS = 50
+# 与已有标注框 IoU 超过该值的候选框视为重复，不再提示
+DEFAULT_EXISTING_IOU_THRESHOLD = 0.7
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+@dataclass
+class Proposal:
+    """一个待确认的候选框，box 为 (x, y, w, h)，与 `Anything_TW` 的取框格式一致。"""
+
+    box: Box
+    area: int
+    predicted_iou: float
+    stability_score: float
+
+    @property
+    def xyxy(self) -> List[int]:
+        x, y, w, h = self.box
+        return [x, y, x + w, y + h]
+
+
+def resolve_preset(preset: Optional[str]) -> str:
+    """返回有效的预设名称，未知或缺省时使用默认预设。"""
+    if preset in AUTO_PROPOSE_PRESETS:
+        return preset
+    if preset:
+        print(f"未知的候选框预设 {preset}，使用 {DEFAULT_AUTO_PROPOSE_PRESET}")
+    return DEFAULT_AUTO_PROPOSE_PRESET
+
+
+def build_mask_generator(model, preset: Optional[str] = None, **overrides) -> SAM2AutomaticMaskGenerator:
+    """按预设构建 AMG，overrides 中的参数会覆盖预设值。"""
+    # 延迟导入：GUI 启动时只需要本模块的预设和配置键，不必加载 torch
+    from sampro.sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+
+    kwargs = dict(AUTO_PROPOSE_PRESETS[resolve_preset(preset)])
+    kwargs.update(overrides)
+    # 只需要框和分数，使用 RLE 输出避免为每个 mask 解码整图
+    kwargs.setdefault("output_mode", "uncompressed_rle")
+    return SAM2AutomaticMaskGenerator(model, **kwargs)
+
+
+def _xywh_iou(box_a: Sequence[float], box_b: Sequence[float]) -> float:
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return 0.0 if union <= 0 else inter / union
+
+
+def masks_to_proposals(
+    annotations: List[Dict[str, Any]],
+    image_shape: Tuple[int, ...],
+    min_area_ratio: float = DEFAULT_MIN_AREA_RATIO,
+    max_area_ratio: float = DEFAULT_MAX_AREA_RATIO,
+    min_stability: float = DEFAULT_MIN_STABILITY,
+    max_proposals: Optional[int] = DEFAULT_MAX_PROPOSALS,
+    existing_boxes: Optional[Sequence[Sequence[int]]] = None,
+    existing_iou_threshold: float = DEFAULT_EXISTING_IOU_THRESHOLD,
+) -> List[Proposal]:
+    """把 AMG 的输出转换为候选框，按面积、稳定性过滤，并去掉与已有标注重复的框。
+
+    Args:
+        annotations: `SAM2AutomaticMaskGenerator.generate` 的返回值。
+        image_shape: 原图形状 (H, W, ...)，用于计算面积比例。
+        existing_boxes: 已有标注框 [x1, y1, x2, y2]。
+
+    Returns:
+        按 predicted_iou * stability_score 从高到低排序的候选框列表。
+    """
+    height, width = image_shape[:2]
+    image_area = float(height * width)
+    existing = [
+        (b[0], b[1], b[2] - b[0], b[3] - b[1]) for b in (existing_boxes or [])
+    ]
+
+    proposals = []
+    for ann in annotations:
+        area = int(ann["area"])
+        if not min_area_ratio * image_area <= area <= max_area_ratio * image_area:
+            continue
+        if ann["stability_score"] < min_stability:
+            continue
+        box = tuple(int(round(v)) for v in ann["bbox"])
+        if box[2] <= 0 or box[3] <= 0:
+            continue
+        if any(_xywh_iou(box, other) > existing_iou_threshold for other in existing):
+            continue
+        proposals.append(
+            Proposal(
+                box=box,
+                area=area,
+                predicted_iou=float(ann["predicted_iou"]),
+                stability_score=float(ann["stability_score"]),
+            )
+        )
+
+    proposals.sort(key=lambda p: p.predicted_iou * p.stability_score, reverse=True)
+    if max_proposals is not None:
+        proposals = proposals[:max_proposals]
+    return proposals
+
+
+def propose_objects(
+    generator: SAM2AutomaticMaskGenerator,
+    image: np.ndarray,
+    image_predictor=None,
+    **filter_kwargs,
+) -> List[Proposal]:
+    """对单张图片运行 AMG 并返回过滤后的候选框。
+
+    image_predictor 已对同一张图片调用过 set_image 时，复用其图像特征，跳过编码器。
+    """
+    annotations = generator.generate(image, image_predictor=image_predictor)
+    return masks_to_proposals(annotations, image.shape, **filter_kwargs)
+
+
+def _list_images(image_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(image_dir, name)
+        for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令行模式：批量生成候选框并写入 JSON（键为图片文件名）。"""
+    parser = argparse.ArgumentParser(description="使用 SAM2 自动生成候选框")
+    parser.add_argument("image_dir", help="图片目录")
+    parser.add_argument("--output", default="proposals.json", help="输出 JSON 文件路径")
+    parser.add_argument(
+        "--preset", default=DEFAULT_AUTO_PROPOSE_PRESET, choices=sorted(AUTO_PROPOSE_PRESETS)
+    )
+    parser.add_argument("--min-area-ratio", type=float, default=DEFAULT_MIN_AREA_RATIO)
+    parser.add_argument("--max-area-ratio", type=float, default=DEFAULT_MAX_AREA_RATIO)
+    parser.add_argument("--min-stability", type=float, default=DEFAULT_MIN_STABILITY)
+    parser.add_argument("--max-proposals", type=int, default=DEFAULT_MAX_PROPOSALS)
+    args = parser.parse_args(argv)
+
+    import cv2
+
+    from sampro.LabelQuick_TW import Anything_TW
+
+    at = Anything_TW()
+    generator = build_mask_generator(at.sam2_model, args.preset)
+    results = {}
+    for image_path in _list_images(args.image_dir):
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"无法读取图片: {image_path}")
+            continue
+        start = time.perf_counter()
+        proposals = propose_objects(
+            generator,
+            image,
+            min_area_ratio=args.min_area_ratio,
+            max_area_ratio=args.max_area_ratio,
+            min_stability=args.min_stability,
+            max_proposals=args.max_proposals,
+        )
+        print(f"{os.path.basename(image_path)}: {len(proposals)} 个候选框，用时 {time.perf_counter() - start:.2f}s")
+        results[os.path.basename(image_path)] = [asdict(p) for p in proposals]
+
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, ensure_ascii=False, indent=2)
+    print(f"候选框已保存至 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
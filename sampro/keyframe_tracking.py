@@ -0,0 +1,118 @@
+"""关键帧跟踪辅助函数：框的插值，以及判断关键帧之间是否需要加密的光流一致性检查。"""
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+# 光流检查前把帧缩放到该宽度，只用于判断运动是否平滑，不需要高分辨率
+FLOW_FRAME_WIDTH = 160
+# 光流传递后的 mask 与 SAM 结果的 IoU 低于该值时，对两关键帧之间的帧重新运行 SAM
+DEFAULT_FLOW_IOU_THRESHOLD = 0.6
+INTERPOLATION_METHODS = ("linear", "spline")
+
+
+def mask_to_box(mask) -> Optional[Box]:
+    """返回 mask 最大轮廓的外接矩形 (x, y, w, h)，与 `Draw_Mask` 的取框方式一致；空 mask 返回 None。"""
+    mask = np.asarray(mask).squeeze().astype(np.uint8)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    max_contour = max(contours, key=cv2.contourArea)
+    return tuple(int(v) for v in cv2.boundingRect(max_contour))
+
+
+def box_to_mask(box: Optional[Box], height: int, width: int) -> np.ndarray:
+    """把框填充为 (1, H, W) 的布尔 mask，格式与 `video_segments` 中的 mask 相同。"""
+    mask = np.zeros((1, height, width), dtype=bool)
+    if box is not None:
+        x, y, w, h = box
+        mask[0, max(y, 0) : y + h, max(x, 0) : x + w] = True
+    return mask
+
+
+def box_iou(box_a: Optional[Box], box_b: Optional[Box]) -> float:
+    """计算两个 (x, y, w, h) 框的 IoU，两者均为空时视为完全一致。"""
+    if box_a is None or box_b is None:
+        return 1.0 if box_a is None and box_b is None else 0.0
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return 1.0 if union == 0 else inter / union
+
+
+def interpolate_box(
+    box_a: Box,
+    box_b: Box,
+    alpha: float,
+    box_before: Optional[Box] = None,
+    box_after: Optional[Box] = None,
+    method: str = "linear",
+) -> Box:
+    """在关键帧框 box_a（alpha=0）与 box_b（alpha=1）之间插值。
+
+    method="spline" 时使用 Catmull-Rom 样条，并参考前后相邻关键帧的框
+    （box_before / box_after），缺失时退化为端点本身。
+    """
+    a = np.asarray(box_a, dtype=np.float64)
+    b = np.asarray(box_b, dtype=np.float64)
+    if method == "spline":
+        p0 = a if box_before is None else np.asarray(box_before, dtype=np.float64)
+        p3 = b if box_after is None else np.asarray(box_after, dtype=np.float64)
+        t = alpha
+        value = 0.5 * (
+            2 * a
+            + (b - p0) * t
+            + (2 * p0 - 5 * a + 4 * b - p3) * t ** 2
+            + (3 * a - p0 - 3 * b + p3) * t ** 3
+        )
+    else:
+        value = a + (b - a) * alpha
+    x, y, w, h = np.round(value).astype(int)
+    return int(x), int(y), max(int(w), 0), max(int(h), 0)
+
+
+def load_flow_frame(frame_path: str, width: int = FLOW_FRAME_WIDTH) -> np.ndarray:
+    """读取帧并缩放为光流检查用的小尺寸灰度图。"""
+    frame = cv2.imread(frame_path, cv2.IMREAD_GRAYSCALE)
+    if frame is None:
+        raise FileNotFoundError(f"无法读取帧: {frame_path}")
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def warp_mask_along_flow(mask, gray_frames: Sequence[np.ndarray]) -> np.ndarray:
+    """沿相邻帧之间的光流把第一帧的 mask 逐帧传递到最后一帧（均为小尺寸）。"""
+    height, width = gray_frames[0].shape
+    warped = cv2.resize(
+        np.asarray(mask).squeeze().astype(np.float32), (width, height), interpolation=cv2.INTER_AREA
+    )
+    grid_x, grid_y = np.meshgrid(
+        np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32)
+    )
+    for prev_gray, next_gray in zip(gray_frames[:-1], gray_frames[1:]):
+        # 反向光流：next 帧每个像素在 prev 帧中的位置
+        flow = cv2.calcOpticalFlowFarneback(next_gray, prev_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        warped = cv2.remap(
+            warped, grid_x + flow[..., 0], grid_y + flow[..., 1], cv2.INTER_LINEAR
+        )
+    return warped > 0.5
+
+
+def flow_consistency_iou(mask_a, mask_b, gray_frames: List[np.ndarray]) -> float:
+    """关键帧 a 的 mask 经光流传递到关键帧 b 后，与 b 上 SAM 结果的 IoU。"""
+    warped = warp_mask_along_flow(mask_a, gray_frames)
+    height, width = warped.shape
+    target = cv2.resize(
+        np.asarray(mask_b).squeeze().astype(np.float32), (width, height), interpolation=cv2.INTER_AREA
+    ) > 0.5
+    union = np.logical_or(warped, target).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(warped, target).sum() / union)
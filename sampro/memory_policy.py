@@ -0,0 +1,281 @@
+"""视频推理内存策略：估算占用并自动选择 offload / 异步加载模式。"""
+from __future__ import annotations
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import torch
+
+# 帧数超过该值时异步加载，避免等待全部帧解码后才开始交互
+ASYNC_LOADING_MIN_FRAMES = 64
+# 自动检测到的可用内存只使用其中的一部分，给模型权重与临时张量留出余量
+AUTO_BUDGET_FRACTION = 0.8
+
+_MB = 1024 ** 2
+
+
+@dataclass
+class VideoMemoryPlan:
+    """一次 `init_state` 所使用的内存模式及其估算依据。"""
+
+    offload_video_to_cpu: bool
+    offload_state_to_cpu: bool
+    async_loading_frames: bool
+    lazy_loading_frames: bool
+    video_bytes: int
+    state_bytes: int
+    device_budget_bytes: Optional[int]
+    host_budget_bytes: Optional[int]
+    # 传播时非条件帧输出的保留策略（"auto" 已按设备与 offload_state_to_cpu 解析）
+    memory_retention: str = "all"
+
+    def init_state_kwargs(self) -> Dict[str, bool]:
+        return {
+            "offload_video_to_cpu": self.offload_video_to_cpu,
+            "offload_state_to_cpu": self.offload_state_to_cpu,
+            "async_loading_frames": self.async_loading_frames,
+            "lazy_loading_frames": self.lazy_loading_frames,
+            "memory_retention": self.memory_retention,
+        }
+
+    def describe(self) -> str:
+        def _fmt(num_bytes):
+            return "未知" if num_bytes is None else f"{num_bytes / _MB:.0f} MB"
+
+        modes = ", ".join(f"{k}={v}" for k, v in self.init_state_kwargs().items())
+        return (
+            f"视频帧约 {_fmt(self.video_bytes)}，跟踪状态约 {_fmt(self.state_bytes)}；"
+            f"设备预算 {_fmt(self.device_budget_bytes)}，内存预算 {_fmt(self.host_budget_bytes)}；"
+            f"{modes}"
+        )
+
+
+def fallback_plan(plan: VideoMemoryPlan) -> VideoMemoryPlan:
+    """出现 OOM 后使用的最保守模式：全部放在 CPU，且按需加载视频帧。
+
+    跟踪状态在 CPU 上时 "offload" 无处可移，改为 "evict"，否则内存随帧数增长。
+    """
+    return VideoMemoryPlan(
+        offload_video_to_cpu=True,
+        offload_state_to_cpu=True,
+        async_loading_frames=False,
+        lazy_loading_frames=True,
+        video_bytes=plan.video_bytes,
+        state_bytes=plan.state_bytes,
+        device_budget_bytes=plan.device_budget_bytes,
+        host_budget_bytes=plan.host_budget_bytes,
+        memory_retention="evict" if plan.memory_retention == "offload" else plan.memory_retention,
+    )
+
+
+def is_out_of_memory_error(exc: BaseException) -> bool:
+    """判断异常是否由显存或内存不足引起。"""
+    if isinstance(exc, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    message = str(exc).lower()
+    return isinstance(exc, RuntimeError) and (
+        "out of memory" in message or "can't allocate memory" in message
+    )
+
+
+def available_device_memory(device: str) -> Optional[int]:
+    """返回计算设备当前的空闲显存（字节），CPU 设备返回 None。"""
+    if not str(device).startswith("cuda"):
+        return None
+    try:
+        free_bytes, _ = torch.cuda.mem_get_info(torch.device(device))
+    except Exception:  # pragma: no cover - 仅用于防御性兜底
+        return None
+    return int(free_bytes)
+
+
+def available_host_memory() -> Optional[int]:
+    """返回系统当前可用内存（字节），无法获取时返回 None。"""
+    try:
+        import psutil
+
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+
+    if sys.platform == "win32":
+        import ctypes
+
+        class _MemoryStatusEx(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = _MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(_MemoryStatusEx)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return int(status.ullAvailPhys)
+        return None
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_video_bytes(predictor, num_frames: int) -> int:
+    """估算视频帧张量（float32，缩放到模型输入尺寸）的总占用。"""
+    image_size = predictor.image_size
+    return num_frames * 3 * image_size * image_size * 4
+
+
+def estimate_state_bytes(
+    predictor,
+    num_frames: int,
+    video_height: int,
+    video_width: int,
+    num_objects: int,
+    memory_retention: str = "all",
+) -> int:
+    """估算跟踪状态（记忆特征、低分辨率 mask、目标指针）以及单帧输出 mask 的占用。
+
+    "evict" 与 "offload" 只计算留在跟踪状态所在设备上的注意力窗口；"offload" 移出的
+    帧在内存中的占用按 "all" 估算。
+    """
+    image_size = predictor.image_size
+    feat_size = image_size // predictor.backbone_stride
+    mask_size = image_size // 4
+    per_frame_bytes = (
+        predictor.mem_dim * feat_size * feat_size * 2  # maskmem_features (bf16)
+        + mask_size * mask_size * 4  # pred_masks (float32)
+        + predictor.hidden_dim * 4  # obj_ptr
+    )
+    tracked_frames = num_frames
+    if memory_retention in ("evict", "offload"):
+        # 只保留注意力窗口内以及条件帧附近的非条件帧
+        horizon = predictor._get_memory_retention_horizon()
+        tracked_frames = min(num_frames, 4 * horizon + 2)
+    output_bytes = num_objects * video_height * video_width * 4
+    return num_objects * tracked_frames * per_frame_bytes + output_bytes
+
+
+def _resolve_mode(value: Any) -> Optional[bool]:
+    """配置项取值为 true/false 时强制使用，"auto" 或缺省时返回 None 表示自动选择。"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return None
+
+
+def resolve_memory_retention(memory_retention: str, on_cuda: bool, offload_state: bool) -> str:
+    """把 "auto" 解析为具体的保留策略。
+
+    "offload" 把窗口外的帧从计算设备移到 CPU，只在 CUDA 上且跟踪状态留在显存时有效；
+    CPU 推理或 offload_state_to_cpu 时它什么也不移动，全部帧都会保留，因此改用 "evict"
+    （修正已淘汰的帧时 `correct_at_frame` 会先重新跟踪恢复记忆）。
+    """
+    if memory_retention != "auto":
+        return memory_retention
+    return "offload" if on_cuda and not offload_state else "evict"
+
+
+def plan_video_memory(
+    predictor,
+    num_frames: int,
+    video_height: int,
+    video_width: int,
+    num_objects: int = 1,
+    memory_retention: str = "all",
+    device_budget_mb: Optional[float] = None,
+    host_budget_mb: Optional[float] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+) -> VideoMemoryPlan:
+    """根据帧数、分辨率与目标数估算占用，在预算内选择 offload 与异步加载模式。
+
+    Args:
+        predictor: SAM2VideoPredictor 实例，用于读取模型输入尺寸与记忆维度。
+        memory_retention: "all"、"offload"、"evict" 或 "auto"（见 `resolve_memory_retention`）。
+        device_budget_mb / host_budget_mb: 显存与内存预算，缺省时按当前空闲量自动检测。
+        overrides: 强制指定的模式，键为 `init_state` 的参数名，值为 True/False/"auto"。
+
+    Returns:
+        VideoMemoryPlan
+    """
+    device = str(predictor.device)
+    on_cuda = device.startswith("cuda")
+    if device_budget_mb is not None:
+        device_budget = int(device_budget_mb * _MB)
+    else:
+        free_bytes = available_device_memory(device)
+        device_budget = None if free_bytes is None else int(free_bytes * AUTO_BUDGET_FRACTION)
+    if host_budget_mb is not None:
+        host_budget = int(host_budget_mb * _MB)
+    else:
+        free_bytes = available_host_memory()
+        host_budget = None if free_bytes is None else int(free_bytes * AUTO_BUDGET_FRACTION)
+
+    video_bytes = estimate_video_bytes(predictor, num_frames)
+    # 跟踪状态留在显存时按 CUDA 上的解析结果估算，否则按 CPU 上的解析结果
+    retention = resolve_memory_retention(memory_retention, on_cuda, offload_state=False)
+    state_bytes = estimate_state_bytes(
+        predictor, num_frames, video_height, video_width, num_objects, retention
+    )
+
+    # CPU 推理时视频帧与状态本来就在内存中，offload 没有意义
+    offload_video = False
+    offload_state = False
+    if on_cuda and device_budget is not None:
+        offload_video = video_bytes + state_bytes > device_budget
+        offload_state = state_bytes + (0 if offload_video else video_bytes) > device_budget
+    if offload_state:
+        retention = resolve_memory_retention(memory_retention, on_cuda, offload_state=True)
+        state_bytes = estimate_state_bytes(
+            predictor, num_frames, video_height, video_width, num_objects, retention
+        )
+
+    # 状态在内存中时 "offload" 不移动任何帧，与 "all" 一样保留全部帧；状态在显存中时
+    # "offload" 把窗口外的帧移到内存，内存中的占用同样是全部帧
+    host_state_bytes = 0
+    if offload_state or not on_cuda:
+        host_state_bytes = state_bytes
+    if retention == "offload":
+        host_state_bytes = estimate_state_bytes(
+            predictor, num_frames, video_height, video_width, num_objects, "all"
+        )
+    if offload_state or not on_cuda:
+        state_bytes = host_state_bytes
+
+    # 视频帧放在内存中（CPU 推理或 offload）且超出内存预算时，改为按需加载
+    frames_on_host = offload_video or not on_cuda
+    host_bytes = (video_bytes if frames_on_host else 0) + host_state_bytes
+    lazy_loading = frames_on_host and host_budget is not None and host_bytes > host_budget
+    async_loading = not lazy_loading and num_frames >= ASYNC_LOADING_MIN_FRAMES
+
+    plan = VideoMemoryPlan(
+        offload_video_to_cpu=offload_video,
+        offload_state_to_cpu=offload_state,
+        async_loading_frames=async_loading,
+        lazy_loading_frames=lazy_loading,
+        video_bytes=video_bytes,
+        state_bytes=state_bytes,
+        device_budget_bytes=device_budget,
+        host_budget_bytes=host_budget,
+    )
+    for key, value in (overrides or {}).items():
+        forced = _resolve_mode(value)
+        if forced is not None and hasattr(plan, key):
+            setattr(plan, key, forced)
+    # 强制指定 offload_state_to_cpu 后重新解析
+    plan.memory_retention = resolve_memory_retention(
+        memory_retention, on_cuda, plan.offload_state_to_cpu
+    )
+    if plan.lazy_loading_frames:
+        # 按需加载与异步加载互斥
+        plan.async_loading_frames = False
+    return plan
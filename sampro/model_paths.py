@@ -0,0 +1,220 @@
+"""SAM 模型文件路径的解析：权重文件（及其半精度/int8 变体）与模型快照目录，以及模型输入分辨率。
+
+只依赖标准库和配置文件，GUI 启动时可以直接导入，不会加载 torch。
+"""
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from util.config import CONFIG_DIR, load_config
+
+SAMPRO_ROOT = Path(__file__).resolve().parent
+DEFAULT_CHECKPOINT_FILENAME = "sam2.1_hiera_large.pt"
+CONFIG_KEY_SAM_CHECKPOINT = "sam_checkpoint_path"
+# 权重变体由 sampro/tools/convert_checkpoint.py 生成，与原始权重放在同一目录，命名为
+# <原文件名>.<变体>.pt；取值 "auto"（缺省）按设备自动选择，"fp32" 只用原始权重，
+# 或指定某个变体
+CONFIG_KEY_SAM_CHECKPOINT_VARIANT = "sam_checkpoint_variant"
+CHECKPOINT_VARIANTS = ("int8", "fp16", "bf16")
+# 逐次点击的提示编码+mask 解码后端："auto"（缺省，CPU 上找到 ONNX 解码器且装有
+# onnxruntime 时使用 ONNX Runtime）、"torch" 或 "onnx"；decoder_onnx_path 可指定 ONNX 文件
+CONFIG_KEY_DECODER_BACKEND = "decoder_backend"
+CONFIG_KEY_DECODER_ONNX_PATH = "decoder_onnx_path"
+# 图像编码器后端，取值与解码器相同："auto"（缺省，CPU 上找到 ONNX 编码器且装有
+# onnxruntime 时使用 ONNX Runtime）、"torch" 或 "onnx"；encoder_onnx_path 可指定 ONNX 文件
+CONFIG_KEY_ENCODER_BACKEND = "encoder_backend"
+CONFIG_KEY_ENCODER_ONNX_PATH = "encoder_onnx_path"
+# 交互标注的模型输入分辨率：缺省使用配置文件中的 1024；设为 512 或 768 等 32 的倍数时
+# 以较低分辨率运行图像编码器，CPU 上预览更快，但细小目标和边缘精度会下降
+CONFIG_KEY_SAM_IMAGE_SIZE = "sam_image_size"
+# 由粗到精的交互分割：打开图片时先以该分辨率快速编码并响应点击，完整分辨率的特征在
+# 后台计算，完成后自动替换；"auto"（缺省）在 CPU 上使用 512、GPU 上关闭，设为 false 关闭
+CONFIG_KEY_SAM_PREVIEW_IMAGE_SIZE = "sam_preview_image_size"
+DEFAULT_PREVIEW_IMAGE_SIZE = 512
+# 模型快照缓存目录：首次加载后保存解析后的配置与 fp32 权重，之后启动直接内存映射加载，
+# 跳过 Hydra 配置解析、随机初始化和权重拷贝；每种配置各占一份 fp32 权重的磁盘空间，
+# 因此缺省关闭，设为 true 使用默认目录，或设为目录路径
+CONFIG_KEY_MODEL_SNAPSHOT_DIR = "model_snapshot_dir"
+DEFAULT_MODEL_SNAPSHOT_DIR = CONFIG_DIR / "model_snapshots"
+
+
+def split_checkpoint_variant(checkpoint_path: Path) -> Tuple[Path, Optional[str]]:
+    """把 `xxx.fp16.pt` 拆成原始权重路径 `xxx.pt` 和变体名称，原始权重的变体为 None。"""
+    checkpoint_path = Path(checkpoint_path)
+    stem = Path(checkpoint_path.stem)
+    variant = stem.suffix[1:]
+    if variant in CHECKPOINT_VARIANTS:
+        return checkpoint_path.with_name(stem.stem + checkpoint_path.suffix), variant
+    return checkpoint_path, None
+
+
+def checkpoint_variant_path(checkpoint_path: Path, variant: str) -> Path:
+    checkpoint_path = Path(checkpoint_path)
+    return checkpoint_path.with_name(f"{checkpoint_path.stem}.{variant}{checkpoint_path.suffix}")
+
+
+def _variant_preference(device) -> List[str]:
+    """按优先级返回要查找的权重变体。
+
+    自动模式下只使用半精度存储的变体（加载时升回 fp32，结果几乎不变）。int8 变体的
+    mask 精度明显下降，且构建更慢、内存峰值也不更低，因此需要显式配置才会使用；它只能在
+    CPU 上运行，在其他设备上忽略该配置。
+    """
+    setting = (
+        load_config().get(CONFIG_KEY_SAM_CHECKPOINT_VARIANT)
+        or os.getenv("SAM2_CHECKPOINT_VARIANT")
+        or "auto"
+    )
+    if setting == "fp32":
+        return []
+    if setting == "int8" and device is not None and not str(device).startswith("cpu"):
+        print(f"int8 权重变体只能在 CPU 上运行，{device} 上使用原始权重")
+        return []
+    if setting in CHECKPOINT_VARIANTS:
+        return [setting]
+    if setting != "auto":
+        print(f"未知的权重变体 {setting}，按 auto 处理")
+    return ["fp16", "bf16"]
+
+
+def resolve_checkpoint_path(device=None) -> Path:
+    """Resolve the path to the SAM checkpoint with helpful error messages.
+
+    When the configured checkpoint is an original (fp32) checkpoint, a converted
+    variant next to it is used instead, following `_variant_preference` for `device`.
+    """
+
+    config = load_config()
+    configured_path = config.get(CONFIG_KEY_SAM_CHECKPOINT)
+    env_override = os.getenv("SAM2_CHECKPOINT")
+
+    if configured_path:
+        checkpoint_path = Path(configured_path)
+    elif env_override:
+        checkpoint_path = Path(env_override)
+    else:
+        checkpoint_path = SAMPRO_ROOT / "checkpoints" / DEFAULT_CHECKPOINT_FILENAME
+
+    checkpoint_path = checkpoint_path.expanduser()
+    if checkpoint_path.is_dir():
+        checkpoint_path = checkpoint_path / DEFAULT_CHECKPOINT_FILENAME
+
+    try:
+        checkpoint_path = checkpoint_path.resolve()
+    except FileNotFoundError:
+        checkpoint_path = checkpoint_path.absolute()
+
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+
+    base_path, variant = split_checkpoint_variant(checkpoint_path)
+    if variant is None:
+        for candidate in _variant_preference(device):
+            variant_path = checkpoint_variant_path(base_path, candidate)
+            if variant_path.exists():
+                print(f"使用 {candidate} 权重变体：{variant_path}")
+                return variant_path
+
+    if not checkpoint_path.exists():
+        hint_directory = checkpoint_path.parent
+        raise FileNotFoundError(
+            "未找到 SAM 模型权重文件："
+            f"{checkpoint_path}.\n\n"
+            "请将模型文件复制到该位置，"
+            "或在界面中通过“File -> 选择 SAM 模型文件”重新选择权重。\n"
+            f"当前默认目录：{hint_directory}"
+        )
+
+    return checkpoint_path
+
+
+def _resolve_onnx_path(
+    checkpoint_path: Path, device, part: str, config_key: str, image_size: Optional[int]
+) -> Optional[Path]:
+    configured = load_config().get(config_key)
+    if configured:
+        onnx_path = Path(configured).expanduser()
+        return onnx_path if onnx_path.exists() else None
+
+    base_path, _ = split_checkpoint_variant(Path(checkpoint_path))
+    if image_size is not None:
+        # 以较低输入分辨率导出的模型命名为 <原文件名>.<part>.<分辨率>[.int8].onnx
+        part = f"{part}.{image_size}"
+    candidates = [part]
+    if "int8" in _variant_preference(device):
+        candidates.insert(0, f"{part}.int8")
+    for candidate in candidates:
+        onnx_path = base_path.with_name(f"{base_path.stem}.{candidate}.onnx")
+        if onnx_path.exists():
+            return onnx_path
+    return None
+
+
+def resolve_decoder_onnx_path(
+    checkpoint_path: Path, device=None, image_size: Optional[int] = None
+) -> Optional[Path]:
+    """查找与权重配套的 ONNX 提示编码器+mask 解码器（sampro/tools/export_onnx_decoder.py 导出）。
+
+    优先使用配置项 decoder_onnx_path；否则在原始权重旁查找 <原文件名>.decoder.onnx，
+    权重变体配置为 int8 时优先查找 <原文件名>.decoder.int8.onnx，都不存在时返回 None。
+    image_size 为降低后的模型输入分辨率时，查找按该分辨率导出的模型。
+    """
+    return _resolve_onnx_path(
+        checkpoint_path, device, "decoder", CONFIG_KEY_DECODER_ONNX_PATH, image_size
+    )
+
+
+def resolve_encoder_onnx_path(
+    checkpoint_path: Path, device=None, image_size: Optional[int] = None
+) -> Optional[Path]:
+    """查找与权重配套的 ONNX 图像编码器（sampro/tools/export_onnx_encoder.py 导出）。
+
+    查找规则与 `resolve_decoder_onnx_path` 相同：配置项 encoder_onnx_path 优先，
+    否则依次查找 <原文件名>.encoder.int8.onnx 与 <原文件名>.encoder.onnx。
+    """
+    return _resolve_onnx_path(
+        checkpoint_path, device, "encoder", CONFIG_KEY_ENCODER_ONNX_PATH, image_size
+    )
+
+
+def _parse_image_size(setting) -> Optional[int]:
+    try:
+        image_size = int(setting)
+    except (TypeError, ValueError):
+        image_size = 0
+    if image_size <= 0 or image_size % 32 != 0:
+        print(f"无效的模型输入分辨率 {setting}（应为 32 的倍数），已忽略")
+        return None
+    return image_size
+
+
+def resolve_image_size() -> Optional[int]:
+    """返回配置的模型输入分辨率（也可用环境变量 SAM2_IMAGE_SIZE 指定），未配置或无效时返回 None。"""
+    setting = load_config().get(CONFIG_KEY_SAM_IMAGE_SIZE) or os.getenv("SAM2_IMAGE_SIZE")
+    if not setting:
+        return None
+    return _parse_image_size(setting)
+
+
+def resolve_preview_image_size(device=None) -> Optional[int]:
+    """返回由粗到精交互时预览编码的分辨率（也可用环境变量 SAM2_PREVIEW_IMAGE_SIZE 指定），关闭时返回 None。"""
+    setting = load_config().get(CONFIG_KEY_SAM_PREVIEW_IMAGE_SIZE)
+    if setting is None:
+        setting = os.getenv("SAM2_PREVIEW_IMAGE_SIZE", "auto")
+    if setting is False or str(setting).lower() in ("", "0", "false", "off", "none"):
+        return None
+    if setting == "auto":
+        # GPU 上完整分辨率的编码已经足够快
+        if device is not None and str(device).startswith("cpu"):
+            return DEFAULT_PREVIEW_IMAGE_SIZE
+        return None
+    return _parse_image_size(setting)
+
+
+def resolve_snapshot_dir() -> Optional[Path]:
+    """返回模型快照缓存目录；未配置、配置为 false 或空字符串时返回 None（不使用快照）。"""
+    configured = load_config().get(CONFIG_KEY_MODEL_SNAPSHOT_DIR)
+    if configured is True:
+        return DEFAULT_MODEL_SNAPSHOT_DIR
+    if not configured:
+        return None
+    return Path(configured).expanduser()
@@ -4,8 +4,15 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import contextlib
+import copy
+import hashlib
+import json
 import logging
 import os
+import shutil
+import tempfile
+import warnings
 
 import torch
 from hydra import compose
@@ -75,26 +82,70 @@ def build_sam2(
     mode="eval",
     hydra_overrides_extra=[],
     apply_postprocessing=True,
+    snapshot_dir=None,
+    image_size=None,
     **kwargs,
 ):
-
+    """
+    Build a SAM 2 model for image prediction. `image_size` runs the model at another
+    input resolution than the config's (1024 for all released checkpoints), e.g. 512
+    or 768 for faster previews on CPU; see `image_size_overrides`.
+    """
+    hydra_overrides_extra = hydra_overrides_extra + image_size_overrides(image_size)
     if apply_postprocessing:
-        hydra_overrides_extra = hydra_overrides_extra.copy()
         hydra_overrides_extra += [
             # dynamically fall back to multi-mask if the single mask is not stable
             "++model.sam_mask_decoder_extra_args.dynamic_multimask_via_stability=true",
             "++model.sam_mask_decoder_extra_args.dynamic_multimask_stability_delta=0.05",
             "++model.sam_mask_decoder_extra_args.dynamic_multimask_stability_thresh=0.98",
         ]
-    # Read config and init model
-    cfg = compose(config_name=config_file, overrides=hydra_overrides_extra)
-    OmegaConf.resolve(cfg)
-    model = instantiate(cfg.model, _recursive_=True)
-    _load_checkpoint(model, ckpt_path)
-    model = model.to(device)
-    if mode == "eval":
-        model.eval()
-    return model
+    return _build_model(
+        config_file, ckpt_path, device, mode, hydra_overrides_extra, snapshot_dir
+    )
+
+
+def image_size_overrides(image_size=None):
+    """
+    Hydra overrides running the model at the input resolution `image_size` (no
+    overrides for None). The checkpoints need no change: Hiera interpolates its
+    background position embedding to the patch grid and tiles the window position
+    embedding over it, the prompt encoder and the SAM2Transforms of the predictors
+    follow `model.image_size`, and the low-res masks shrink to image_size // 4.
+    The patch grid (image_size // 4) must be a multiple of the first window size (8),
+    so image_size must be a multiple of 32.
+    """
+    if image_size is None:
+        return []
+    image_size = int(image_size)
+    if image_size <= 0 or image_size % 32 != 0:
+        raise ValueError(
+            f"image_size must be a positive multiple of 32, got {image_size}"
+        )
+    return [f"++model.image_size={image_size}"]
+
+
+def resize_sam2_model(model, image_size):
+    """
+    A view of a built SAM 2 `model` that runs at the input resolution `image_size`
+    and shares all parameters and buffers with it (no extra memory for the weights),
+    e.g. for a fast low-resolution preview next to the full-resolution model. Only
+    the SAM2Base and prompt encoder attributes that depend on the input size differ
+    from `model`; it is equivalent to `build_sam2(..., image_size=image_size)`.
+    """
+    image_size_overrides(image_size)  # validate
+    embed_size = image_size // model.backbone_stride
+    prompt_encoder = copy.copy(model.sam_prompt_encoder)
+    prompt_encoder.input_image_size = (image_size, image_size)
+    prompt_encoder.image_embedding_size = (embed_size, embed_size)
+    prompt_encoder.mask_input_size = (4 * embed_size, 4 * embed_size)
+
+    view = copy.copy(model)
+    # copy the submodule dict so that replacing the prompt encoder leaves `model` as is
+    view._modules = dict(model._modules)
+    view.sam_prompt_encoder = prompt_encoder
+    view.image_size = image_size
+    view.sam_image_embedding_size = embed_size
+    return view
 
 
 def build_sam2_video_predictor(
@@ -105,6 +156,7 @@ def build_sam2_video_predictor(
     hydra_overrides_extra=[],
     apply_postprocessing=True,
     vos_optimized=False,
+    snapshot_dir=None,
     **kwargs,
 ):
     hydra_overrides = [
@@ -129,12 +181,43 @@ def build_sam2_video_predictor(
             "++model.fill_hole_area=8",
         ]
     hydra_overrides.extend(hydra_overrides_extra)
+    return _build_model(
+        config_file, ckpt_path, device, mode, hydra_overrides, snapshot_dir
+    )
+
 
-    # Read config and init model
-    cfg = compose(config_name=config_file, overrides=hydra_overrides)
-    OmegaConf.resolve(cfg)
-    model = instantiate(cfg.model, _recursive_=True)
-    _load_checkpoint(model, ckpt_path)
+def _build_model(config_file, ckpt_path, device, mode, hydra_overrides, snapshot_dir):
+    """
+    Build a model from its config and checkpoint. With a `snapshot_dir`, the resolved
+    config and the loaded weights are cached there on the first build (see
+    `_save_snapshot`), and later builds with the same config, overrides, checkpoint
+    and code materialize the model from the snapshot without Hydra compose, random
+    init or copying the weights (see `_load_snapshot`).
+    """
+    model, snapshot_path = None, None
+    if snapshot_dir is not None and ckpt_path is not None:
+        snapshot_path = _snapshot_path(
+            snapshot_dir, config_file, ckpt_path, hydra_overrides
+        )
+        model = _load_snapshot(snapshot_path)
+    if model is None:
+        # Read config and init model
+        cfg = compose(config_name=config_file, overrides=hydra_overrides)
+        OmegaConf.resolve(cfg)
+        model = instantiate(cfg.model, _recursive_=True)
+        _load_checkpoint(model, ckpt_path)
+        if snapshot_path is not None:
+            _save_snapshot(
+                snapshot_path,
+                cfg.model,
+                model,
+                snapshot_key=_snapshot_key(config_file, hydra_overrides),
+            )
+    if torch.device(device).type != "cpu" and _has_dynamic_int8(model):
+        raise RuntimeError(
+            f"{ckpt_path} is an int8 checkpoint, which can only run on CPU "
+            f"(requested device: {device})"
+        )
     model = model.to(device)
     if mode == "eval":
         model.eval()
@@ -162,8 +245,19 @@ def build_sam2_video_predictor_hf(model_id, **kwargs):
 
 
 def _load_checkpoint(model, ckpt_path):
+    """
+    Load a checkpoint into `model`. Besides the original fp32 checkpoints, this loads
+    the variants written by `tools/convert_checkpoint.py`: fp16/bf16-stored weights
+    are upcast to the dtype of the model parameters when copied into them, and
+    int8 variants first get the same submodules quantized (`quantize_dynamic_int8`)
+    so that their quantized state dict matches the model.
+    """
     if ckpt_path is not None:
-        sd = torch.load(ckpt_path, map_location="cpu", weights_only=True)["model"]
+        ckpt = _torch_load_weights(ckpt_path)
+        quantized_modules = ckpt.get("quantized_modules", [])
+        if quantized_modules:
+            quantize_dynamic_int8(model, quantized_modules)
+        sd = ckpt["model"]
         missing_keys, unexpected_keys = model.load_state_dict(sd)
         if missing_keys:
             logging.error(missing_keys)
@@ -172,3 +266,197 @@ def _load_checkpoint(model, ckpt_path):
             logging.error(unexpected_keys)
             raise RuntimeError()
         logging.info("Loaded checkpoint sucessfully")
+
+
+def _torch_load_weights(ckpt_path):
+    """
+    Load a checkpoint with its tensors memory-mapped (only the pages that are copied
+    into the model are read, and they are not kept as a second copy in RAM), falling
+    back to a regular load for checkpoints in the legacy (non-zip) format.
+    """
+    try:
+        return torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError:
+        return torch.load(ckpt_path, map_location="cpu", weights_only=True)
+
+
+def quantize_dynamic_int8(model, module_names=("image_encoder",)):
+    """
+    Replace the `nn.Linear` layers of the given submodules of `model` (in place) with
+    dynamically quantized ones: int8 weights, with the activations quantized on the
+    fly. These layers only run on CPU.
+    """
+    with warnings.catch_warnings():
+        # eager-mode quantization is deprecated in favor of torchao, which is not a
+        # dependency here
+        warnings.simplefilter("ignore")
+        for name in module_names:
+            torch.ao.quantization.quantize_dynamic(
+                model.get_submodule(name),
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+                inplace=True,
+            )
+    return model
+
+
+def _has_dynamic_int8(model):
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+    return any(isinstance(m, DynamicQuantizedLinear) for m in model.modules())
+
+
+# bump when the snapshot layout changes, so that old snapshots are not picked up
+SNAPSHOT_VERSION = 2
+SNAPSHOT_CONFIG_FILE = "config.yaml"
+SNAPSHOT_WEIGHTS_FILE = "weights.pt"
+SNAPSHOT_KEY_FILE = "key.json"
+
+
+def _source_fingerprint():
+    """Sizes and mtimes of the package sources, so that code changes invalidate snapshots."""
+    root = sampro.sam2.__path__[0]
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                stat = os.stat(os.path.join(dirpath, filename))
+                rel_path = os.path.relpath(os.path.join(dirpath, filename), root)
+                entries.append((rel_path, stat.st_size, stat.st_mtime_ns))
+    return entries
+
+
+def _snapshot_key(config_file, hydra_overrides):
+    """What identifies snapshots that supersede each other (see `_prune_snapshots`)."""
+    return {"config_file": config_file, "hydra_overrides": list(hydra_overrides)}
+
+
+def _snapshot_path(snapshot_dir, config_file, ckpt_path, hydra_overrides):
+    """The snapshot directory for a config, its overrides and a checkpoint file."""
+    stat = os.stat(ckpt_path)
+    key = json.dumps(
+        {
+            "version": SNAPSHOT_VERSION,
+            "config_file": config_file,
+            "hydra_overrides": list(hydra_overrides),
+            "ckpt_path": os.path.abspath(ckpt_path),
+            "ckpt_size": stat.st_size,
+            "ckpt_mtime_ns": stat.st_mtime_ns,
+            "torch": torch.__version__,
+            "sources": _source_fingerprint(),
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(ckpt_path))[0]
+    return os.path.join(snapshot_dir, f"{name}-{digest}")
+
+
+def _save_snapshot(snapshot_path, model_cfg, model, snapshot_key=None):
+    """
+    Save the resolved model config and the state dict of the loaded model (in the zip
+    format that `torch.load` can memory-map) to `snapshot_path`, in the layout of
+    the checkpoints: {"model": state dict, "quantized_modules": [...]}. It is written
+    to a temporary directory first, so a partial snapshot is never used. With a
+    `snapshot_key`, older snapshots it supersedes are removed afterwards.
+    """
+    parent = os.path.dirname(snapshot_path)
+    tmp_path = None
+    try:
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+        OmegaConf.save(model_cfg, os.path.join(tmp_path, SNAPSHOT_CONFIG_FILE))
+        if snapshot_key is not None:
+            with open(os.path.join(tmp_path, SNAPSHOT_KEY_FILE), "w") as f:
+                json.dump(snapshot_key, f, sort_keys=True)
+        quantized_modules = [
+            name for name, module in model.named_children() if _has_dynamic_int8(module)
+        ]
+        torch.save(
+            {"model": model.state_dict(), "quantized_modules": quantized_modules},
+            os.path.join(tmp_path, SNAPSHOT_WEIGHTS_FILE),
+        )
+        if os.path.isdir(snapshot_path):
+            shutil.rmtree(snapshot_path)
+        os.replace(tmp_path, snapshot_path)
+        logging.info(f"Saved model snapshot to {snapshot_path}")
+    except Exception as e:
+        # e.g. a full disk
+        logging.warning(f"Could not save model snapshot to {snapshot_path}: {e}")
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+    if snapshot_key is not None:
+        _prune_snapshots(snapshot_path, snapshot_key)
+
+
+def _prune_snapshots(snapshot_path, snapshot_key):
+    """
+    Remove the other snapshots of the same checkpoint name, config and overrides in the
+    directory of `snapshot_path`. They were made stale by a changed checkpoint file,
+    torch version or source tree, and each holds a full copy of the weights.
+    """
+    parent, current = os.path.split(snapshot_path)
+    prefix = current[: current.rindex("-") + 1]
+    for entry in os.listdir(parent):
+        digest = entry[len(prefix):]
+        # the digest has no dashes, so e.g. "<name>-fp16-<digest>" is not a match
+        if entry == current or not entry.startswith(prefix) or "-" in digest:
+            continue
+        path = os.path.join(parent, entry)
+        try:
+            with open(os.path.join(path, SNAPSHOT_KEY_FILE)) as f:
+                if json.load(f) != snapshot_key:
+                    continue
+        except (OSError, ValueError):
+            continue  # not a snapshot, or one saved without a key
+        shutil.rmtree(path, ignore_errors=True)
+        logging.info(f"Removed stale model snapshot {path}")
+
+
+@contextlib.contextmanager
+def _skip_weight_init():
+    """
+    Turn the in-place `torch.nn.init` functions into no-ops, so that layers created in
+    this context allocate their parameters without filling them with random values
+    that the loaded weights replace anyway. Tensors that `__init__` computes (e.g. the
+    RoPE `freqs_cis` of the memory attention) are still built as usual.
+    """
+    names = [
+        name for name in dir(torch.nn.init) if name.endswith("_") and not name.startswith("_")
+    ]
+    originals = {name: getattr(torch.nn.init, name) for name in names}
+    try:
+        for name in names:
+            setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(torch.nn.init, name, fn)
+
+
+def _load_snapshot(snapshot_path):
+    """
+    Materialize a model from a snapshot saved by `_save_snapshot`, or return None if
+    there is no usable snapshot. The model is instantiated from the resolved config
+    (no Hydra compose) without random init, and the weights are loaded with
+    `weights_only=True` and memory-mapped from the snapshot, then assigned to the
+    parameters instead of being copied into them.
+    """
+    config_path = os.path.join(snapshot_path, SNAPSHOT_CONFIG_FILE)
+    weights_path = os.path.join(snapshot_path, SNAPSHOT_WEIGHTS_FILE)
+    if not (os.path.isfile(config_path) and os.path.isfile(weights_path)):
+        return None
+    try:
+        state = torch.load(weights_path, map_location="cpu", mmap=True, weights_only=True)
+        with _skip_weight_init():
+            model = instantiate(OmegaConf.load(config_path), _recursive_=True)
+        if state["quantized_modules"]:
+            quantize_dynamic_int8(model, state["quantized_modules"])
+        model.load_state_dict(state["model"], strict=True, assign=True)
+    except Exception as e:
+        logging.warning(f"Ignoring model snapshot {snapshot_path}: {e}")
+        return None
+    logging.info(f"Loaded model snapshot from {snapshot_path}")
+    return model
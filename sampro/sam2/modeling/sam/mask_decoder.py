@@ -143,14 +143,7 @@ class MaskDecoder(nn.Module):
         )
 
         # Select the correct mask or masks for output
-        if multimask_output:
-            masks = masks[:, 1:, :, :]
-            iou_pred = iou_pred[:, 1:]
-        elif self.dynamic_multimask_via_stability and not self.training:
-            masks, iou_pred = self._dynamic_multimask_via_stability(masks, iou_pred)
-        else:
-            masks = masks[:, 0:1, :, :]
-            iou_pred = iou_pred[:, 0:1]
+        masks, iou_pred = self.select_mask_outputs(masks, iou_pred, multimask_output)
 
         if multimask_output and self.use_multimask_token_for_obj_ptr:
             sam_tokens_out = mask_tokens_out[:, 1:]  # [b, 3, c] shape
@@ -165,6 +158,25 @@ class MaskDecoder(nn.Module):
         # Prepare output
         return masks, iou_pred, sam_tokens_out, object_score_logits
 
+    def select_mask_outputs(
+        self, masks: torch.Tensor, iou_pred: torch.Tensor, multimask_output: bool
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Select the output masks (and their predicted IoUs) from the outputs of all the
+        mask tokens returned by `predict_masks`: the three multimask outputs, or the
+        single-mask output (falling back to the best multimask output when it is not
+        stable, with `dynamic_multimask_via_stability`).
+        """
+        if multimask_output:
+            masks = masks[:, 1:, :, :]
+            iou_pred = iou_pred[:, 1:]
+        elif self.dynamic_multimask_via_stability and not self.training:
+            masks, iou_pred = self._dynamic_multimask_via_stability(masks, iou_pred)
+        else:
+            masks = masks[:, 0:1, :, :]
+            iou_pred = iou_pred[:, 0:1]
+        return masks, iou_pred
+
     def predict_masks(
         self,
         image_embeddings: torch.Tensor,
@@ -504,6 +504,12 @@ class SAM2Base(torch.nn.Module):
         output_dict,
         num_frames,
         track_in_reverse=False,  # tracking in reverse time order (for demo usage)
+        # distance between consecutively tracked frames (e.g. k when only every k-th
+        # frame is tracked); memory frames and object pointers are looked up in this unit
+        frame_step=1,
+        # an optional `MemoryTokenBank` of this object, updated in place instead of
+        # concatenating all the memories on every frame (used in inference only)
+        memory_bank=None,
     ):
         """Fuse the current frame's visual feature map with previous memory."""
         B = current_vision_feats[-1].size(1)  # batch size on this frame
@@ -518,6 +524,13 @@ class SAM2Base(torch.nn.Module):
 
         num_obj_ptr_tokens = 0
         tpos_sign_mul = -1 if track_in_reverse else 1
+        # the bank writes its buffers in place, which autograd cannot track
+        use_memory_bank = (
+            memory_bank is not None
+            and not self.training
+            and not torch.is_grad_enabled()
+        )
+        memory_bank_entries = []
         # Step 1: condition the visual features of the current frame on previous memories
         if not is_init_cond_frame:
             # Retrieve the memories encoded with the maskmem backbone
@@ -536,30 +549,34 @@ class SAM2Base(torch.nn.Module):
             # We also allow taking the memory frame non-consecutively (with stride>1), in which case
             # we take (self.num_maskmem - 2) frames among every stride-th frames plus the last frame.
             stride = 1 if self.training else self.memory_temporal_stride_for_eval
+            # work on the grid of tracked frames (the identity for frame_step=1)
+            step_offset = frame_idx % frame_step
+            step_idx = frame_idx // frame_step
             for t_pos in range(1, self.num_maskmem):
                 t_rel = self.num_maskmem - t_pos  # how many frames before current frame
                 if t_rel == 1:
                     # for t_rel == 1, we take the last frame (regardless of r)
                     if not track_in_reverse:
                         # the frame immediately before this frame (i.e. frame_idx - 1)
-                        prev_frame_idx = frame_idx - t_rel
+                        prev_step_idx = step_idx - t_rel
                     else:
                         # the frame immediately after this frame (i.e. frame_idx + 1)
-                        prev_frame_idx = frame_idx + t_rel
+                        prev_step_idx = step_idx + t_rel
                 else:
                     # for t_rel >= 2, we take the memory frame from every r-th frames
                     if not track_in_reverse:
                         # first find the nearest frame among every r-th frames before this frame
                         # for r=1, this would be (frame_idx - 2)
-                        prev_frame_idx = ((frame_idx - 2) // stride) * stride
+                        prev_step_idx = ((step_idx - 2) // stride) * stride
                         # then seek further among every r-th frames
-                        prev_frame_idx = prev_frame_idx - (t_rel - 2) * stride
+                        prev_step_idx = prev_step_idx - (t_rel - 2) * stride
                     else:
                         # first find the nearest frame among every r-th frames after this frame
                         # for r=1, this would be (frame_idx + 2)
-                        prev_frame_idx = -(-(frame_idx + 2) // stride) * stride
+                        prev_step_idx = -(-(step_idx + 2) // stride) * stride
                         # then seek further among every r-th frames
-                        prev_frame_idx = prev_frame_idx + (t_rel - 2) * stride
+                        prev_step_idx = prev_step_idx + (t_rel - 2) * stride
+                prev_frame_idx = prev_step_idx * frame_step + step_offset
                 out = output_dict["non_cond_frame_outputs"].get(prev_frame_idx, None)
                 if out is None:
                     # If an unselected conditioning frame is among the last (self.num_maskmem - 1)
@@ -570,6 +587,16 @@ class SAM2Base(torch.nn.Module):
             for t_pos, prev in t_pos_and_prevs:
                 if prev is None:
                     continue  # skip padding frames
+                if use_memory_bank:
+                    # the bank only copies the memories it does not hold yet
+                    memory_bank_entries.append(
+                        (
+                            self.num_maskmem - t_pos - 1,
+                            prev["maskmem_features"],
+                            prev["maskmem_pos_enc"][-1],
+                        )
+                    )
+                    continue
                 # "maskmem_features" might have been offloaded to CPU in demo use cases,
                 # so we load it back to GPU (it's a no-op if it's already on GPU).
                 feats = prev["maskmem_features"].to(device, non_blocking=True)
@@ -600,9 +627,9 @@ class SAM2Base(torch.nn.Module):
                     # Temporal pos encoding contains how far away each pointer is from current frame
                     (
                         (
-                            (frame_idx - t) * tpos_sign_mul
+                            round((frame_idx - t) / frame_step) * tpos_sign_mul
                             if self.use_signed_tpos_enc_to_obj_ptrs
-                            else abs(frame_idx - t)
+                            else abs(round((frame_idx - t) / frame_step))
                         ),
                         out["obj_ptr"],
                     )
@@ -610,7 +637,8 @@ class SAM2Base(torch.nn.Module):
                 ]
                 # Add up to (max_obj_ptrs_in_encoder - 1) non-conditioning frames before current frame
                 for t_diff in range(1, max_obj_ptrs_in_encoder):
-                    t = frame_idx + t_diff if track_in_reverse else frame_idx - t_diff
+                    t_frames = t_diff * frame_step
+                    t = frame_idx + t_frames if track_in_reverse else frame_idx - t_frames
                     if t < 0 or (num_frames is not None and t >= num_frames):
                         break
                     out = output_dict["non_cond_frame_outputs"].get(
@@ -661,8 +689,17 @@ class SAM2Base(torch.nn.Module):
             to_cat_memory_pos_embed = [self.no_mem_pos_enc.expand(1, B, self.mem_dim)]
 
         # Step 2: Concatenate the memories and forward through the transformer encoder
-        memory = torch.cat(to_cat_memory, dim=0)
-        memory_pos_embed = torch.cat(to_cat_memory_pos_embed, dim=0)
+        if len(memory_bank_entries) > 0:
+            # only the object pointers (if any) are left in `to_cat_memory`
+            memory, memory_pos_embed = memory_bank.update(
+                memory_bank_entries,
+                self.maskmem_tpos_enc,
+                extra_tokens=to_cat_memory[0] if to_cat_memory else None,
+                extra_pos=to_cat_memory_pos_embed[0] if to_cat_memory else None,
+            )
+        else:
+            memory = torch.cat(to_cat_memory, dim=0)
+            memory_pos_embed = torch.cat(to_cat_memory_pos_embed, dim=0)
 
         pix_feat_with_mem = self.memory_attention(
             curr=current_vision_feats,
@@ -738,6 +775,8 @@ class SAM2Base(torch.nn.Module):
         num_frames,
         track_in_reverse,
         prev_sam_mask_logits,
+        frame_step=1,
+        memory_bank=None,
     ):
         current_out = {"point_inputs": point_inputs, "mask_inputs": mask_inputs}
         # High-resolution feature maps for the SAM head, reshape (HW)BC => BCHW
@@ -767,6 +806,8 @@ class SAM2Base(torch.nn.Module):
                 output_dict=output_dict,
                 num_frames=num_frames,
                 track_in_reverse=track_in_reverse,
+                frame_step=frame_step,
+                memory_bank=memory_bank,
             )
             # apply SAM-style segmentation head
             # here we might feed previously predicted low-res SAM mask logits into the SAM mask decoder,
@@ -831,6 +872,10 @@ class SAM2Base(torch.nn.Module):
         run_mem_encoder=True,
         # The previously predicted SAM mask logits (which can be fed together with new clicks in demo).
         prev_sam_mask_logits=None,
+        # distance between consecutively tracked frames (see `_prepare_memory_conditioned_features`)
+        frame_step=1,
+        # per-object `MemoryTokenBank` (see `_prepare_memory_conditioned_features`)
+        memory_bank=None,
     ):
         current_out, sam_outputs, _, _ = self._track_step(
             frame_idx,
@@ -844,6 +889,8 @@ class SAM2Base(torch.nn.Module):
             num_frames,
             track_in_reverse,
             prev_sam_mask_logits,
+            frame_step,
+            memory_bank,
         )
 
         (
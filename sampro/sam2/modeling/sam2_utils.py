@@ -61,6 +61,134 @@ def select_closest_cond_frames(frame_idx, cond_frame_outputs, max_cond_frame_num
     return selected_outputs, unselected_outputs
 
 
+class MemoryTokenBank:
+    """
+    Preallocated buffers with the flattened memory tokens and positional encodings
+    that `SAM2Base._prepare_memory_conditioned_features` attends to, kept for one
+    object across the frames of a tracking run.
+
+    Each spatial memory occupies a fixed slot of HW tokens. On a new frame, only the
+    memories that are not in the bank yet are copied into a slot (taking the slot of
+    a memory that is no longer selected), and the temporal positional encoding of a
+    slot is re-added only when its temporal position changed. The object pointer
+    tokens, which are small and re-selected on every frame, are copied after the
+    slots. Slots are not kept in temporal order; this does not change the memory
+    attention output, as all memory frames share the same spatial RoPE frequencies
+    and the attention does not depend on the order of the keys.
+
+    The buffers are written in place, so the bank is only for inference (no autograd).
+    """
+
+    def __init__(self, max_extra_tokens=0):
+        # number of extra (object pointer) tokens to reserve room for
+        self.max_extra_tokens = max_extra_tokens
+        # statistics (for benchmarking)
+        self.num_reallocs = 0
+        self.num_slot_writes = 0
+        self.reset()
+
+    def reset(self):
+        """Drop the buffers and the references to the memories they hold."""
+        self.memory = None
+        self.memory_pos = None
+        self._spatial_pos = None
+        self._layout = None
+        self._num_extra = 0
+        self._slot_feats = []
+        self._slot_pos = []
+        self._slot_tpos = []
+
+    def update(self, entries, tpos_enc, extra_tokens=None, extra_pos=None):
+        """
+        Bring the bank up to date with the memories of the current frame and return
+        `(memory, memory_pos)` of shape [num_entries * HW + num_extra_tokens, B, C]
+        (views into the bank, valid until the next update).
+
+        - entries: list of `(tpos_idx, maskmem_features, maskmem_pos_enc)`, where the
+          features and spatial encodings are the [B, C, H, W] tensors kept in the output
+          dict (they may be offloaded to another device or stored in another dtype) and
+          `tpos_idx` is the index into `tpos_enc`. Memories are matched to slots by the
+          identity of their `maskmem_features` tensor.
+        - tpos_enc: temporal positional encodings of shape [num_maskmem, 1, 1, C].
+        - extra_tokens, extra_pos: optional [P, B, C] tokens (and their positional
+          encodings) placed after the spatial memories.
+        """
+        num_entries = len(entries)
+        B, C, H, W = entries[0][1].shape
+        HW = H * W
+        num_extra = 0 if extra_tokens is None else extra_tokens.size(0)
+        # same dtypes as concatenating the memories and pointers with `torch.cat`
+        dtype = entries[0][1].dtype
+        pos_dtype = torch.promote_types(entries[0][2].dtype, tpos_enc.dtype)
+        if extra_tokens is not None:
+            dtype = torch.promote_types(dtype, extra_tokens.dtype)
+            pos_dtype = torch.promote_types(pos_dtype, extra_pos.dtype)
+        device = tpos_enc.device
+        layout = (
+            num_entries,
+            HW,
+            B,
+            C,
+            dtype,
+            pos_dtype,
+            device,
+            torch.is_inference_mode_enabled(),
+        )
+        if layout != self._layout or num_extra > self._num_extra:
+            self._allocate(layout, max(num_extra, self.max_extra_tokens))
+
+        # find the memories already held in a slot, and the slots that can be reused
+        slot_of = {
+            id(feats): i for i, feats in enumerate(self._slot_feats) if feats is not None
+        }
+        entry_slots = [slot_of.pop(id(feats), None) for _, feats, _ in entries]
+        used_slots = set(i for i in entry_slots if i is not None)
+        free_slots = iter(i for i in range(num_entries) if i not in used_slots)
+        for (tpos_idx, feats, pos), i in zip(entries, entry_slots):
+            new_memory = i is None
+            if new_memory:
+                i = next(free_slots)
+            rows = slice(i * HW, (i + 1) * HW)
+            if new_memory:
+                self.memory[rows].copy_(
+                    feats.flatten(2).permute(2, 0, 1), non_blocking=True
+                )
+                self._slot_feats[i] = feats
+                self.num_slot_writes += 1
+            if self._slot_pos[i] is not pos:
+                self._spatial_pos[rows].copy_(pos.flatten(2).permute(2, 0, 1))
+                self._slot_pos[i] = pos
+                self._slot_tpos[i] = None
+            if self._slot_tpos[i] != tpos_idx:
+                torch.add(
+                    self._spatial_pos[rows], tpos_enc[tpos_idx], out=self.memory_pos[rows]
+                )
+                self._slot_tpos[i] = tpos_idx
+
+        num_tokens = num_entries * HW
+        if num_extra > 0:
+            self.memory[num_tokens : num_tokens + num_extra].copy_(extra_tokens)
+            self.memory_pos[num_tokens : num_tokens + num_extra].copy_(extra_pos)
+            num_tokens += num_extra
+        return self.memory[:num_tokens], self.memory_pos[:num_tokens]
+
+    def _allocate(self, layout, num_extra):
+        num_entries, HW, B, C, dtype, pos_dtype, device, _ = layout
+        num_tokens = num_entries * HW + num_extra
+        self.memory = torch.empty(num_tokens, B, C, dtype=dtype, device=device)
+        self.memory_pos = torch.empty(num_tokens, B, C, dtype=pos_dtype, device=device)
+        self._spatial_pos = torch.empty(
+            num_entries * HW, B, C, dtype=pos_dtype, device=device
+        )
+        self._layout = layout
+        self._num_extra = num_extra
+        # all slots are filled on the first update after (re)allocation
+        self._slot_feats = [None] * num_entries
+        self._slot_pos = [None] * num_entries
+        self._slot_tpos = [None] * num_entries
+        self.num_reallocs += 1
+
+
 def get_1d_sine_pe(pos_inds, dim, temperature=10000):
     """
     Get 1D sine positional embedding as in the original Transformer paper.
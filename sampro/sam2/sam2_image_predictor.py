@@ -24,6 +24,7 @@ class SAM2ImagePredictor:
         mask_threshold=0.0,
         max_hole_area=0.0,
         max_sprinkle_area=0.0,
+        image_encoder=None,
         **kwargs,
     ) -> None:
         """
@@ -38,6 +39,10 @@ class SAM2ImagePredictor:
             the maximum area of max_hole_area in low_res_masks.
           max_sprinkle_area (int): If max_sprinkle_area > 0, we remove small sprinkles up to
             the maximum area of max_sprinkle_area in low_res_masks.
+          image_encoder (callable or None): If set, replaces the PyTorch image encoder
+            in set_image and set_image_batch (e.g. `sam2.utils.onnx.OnnxImageEncoder`).
+            It maps a transformed Bx3xHxW image batch to the list of image features
+            computed by `_compute_image_features`.
         """
         super().__init__()
         self.model = sam_model
@@ -57,12 +62,15 @@ class SAM2ImagePredictor:
 
         # Predictor config
         self.mask_threshold = mask_threshold
+        self.image_encoder = image_encoder
 
-        # Spatial dim for backbone feature maps
+        # Spatial dim for backbone feature maps (strides 4, 8 and 16 of the input size,
+        # which can be reduced from 1024, see `build_sam2`)
+        embed_size = self.model.image_size // self.model.backbone_stride
         self._bb_feat_sizes = [
-            (256, 256),
-            (128, 128),
-            (64, 64),
+            (4 * embed_size, 4 * embed_size),
+            (2 * embed_size, 2 * embed_size),
+            (embed_size, embed_size),
         ]
 
     @classmethod
@@ -114,19 +122,38 @@ class SAM2ImagePredictor:
             len(input_image.shape) == 4 and input_image.shape[1] == 3
         ), f"input_image must be of size 1x3xHxW, got {input_image.shape}"
         logging.info("Computing image embeddings for the provided image...")
-        backbone_out = self.model.forward_image(input_image)
-        _, vision_feats, _, _ = self.model._prepare_backbone_features(backbone_out)
+        feats = self._embed_images(input_image)
+        self._features = {"image_embed": feats[-1], "high_res_feats": feats[:-1]}
+        self._is_image_set = True
+        logging.info("Image embeddings computed.")
+
+    def _embed_images(self, img_batch: torch.Tensor) -> List[torch.Tensor]:
+        """Image features of a transformed image batch, with `image_encoder` if set."""
+        if self.image_encoder is not None:
+            return [feat.to(self.device) for feat in self.image_encoder(img_batch)]
+        return self._compute_image_features(self.model, img_batch, self._bb_feat_sizes)
+
+    @staticmethod
+    def _compute_image_features(
+        model: SAM2Base, img_batch: torch.Tensor, bb_feat_sizes: List[Tuple[int, int]]
+    ) -> List[torch.Tensor]:
+        """
+        Run the image encoder of `model` on a transformed Bx3xHxW image batch. Returns
+        the feature maps from the highest to the lowest resolution, in BxCxHxW format:
+        the two high-res features used by the SAM decoder, then the image embedding.
+        """
+        batch_size = img_batch.shape[0]
+        backbone_out = model.forward_image(img_batch)
+        _, vision_feats, _, _ = model._prepare_backbone_features(backbone_out)
         # Add no_mem_embed, which is added to the lowest rest feat. map during training on videos
-        if self.model.directly_add_no_mem_embed:
-            vision_feats[-1] = vision_feats[-1] + self.model.no_mem_embed
+        if model.directly_add_no_mem_embed:
+            vision_feats[-1] = vision_feats[-1] + model.no_mem_embed
 
         feats = [
-            feat.permute(1, 2, 0).view(1, -1, *feat_size)
-            for feat, feat_size in zip(vision_feats[::-1], self._bb_feat_sizes[::-1])
+            feat.permute(1, 2, 0).view(batch_size, -1, *feat_size)
+            for feat, feat_size in zip(vision_feats[::-1], bb_feat_sizes[::-1])
         ][::-1]
-        self._features = {"image_embed": feats[-1], "high_res_feats": feats[:-1]}
-        self._is_image_set = True
-        logging.info("Image embeddings computed.")
+        return feats
 
     @torch.no_grad()
     def set_image_batch(
@@ -152,21 +179,11 @@ class SAM2ImagePredictor:
         # Transform the image to the form expected by the model
         img_batch = self._transforms.forward_batch(image_list)
         img_batch = img_batch.to(self.device)
-        batch_size = img_batch.shape[0]
         assert (
             len(img_batch.shape) == 4 and img_batch.shape[1] == 3
         ), f"img_batch must be of size Bx3xHxW, got {img_batch.shape}"
         logging.info("Computing image embeddings for the provided images...")
-        backbone_out = self.model.forward_image(img_batch)
-        _, vision_feats, _, _ = self.model._prepare_backbone_features(backbone_out)
-        # Add no_mem_embed, which is added to the lowest rest feat. map during training on videos
-        if self.model.directly_add_no_mem_embed:
-            vision_feats[-1] = vision_feats[-1] + self.model.no_mem_embed
-
-        feats = [
-            feat.permute(1, 2, 0).view(batch_size, -1, *feat_size)
-            for feat, feat_size in zip(vision_feats[::-1], self._bb_feat_sizes[::-1])
-        ][::-1]
+        feats = self._embed_images(img_batch)
         self._features = {"image_embed": feats[-1], "high_res_feats": feats[:-1]}
         self._is_image_set = True
         self._is_batch = True
@@ -181,9 +198,18 @@ class SAM2ImagePredictor:
         multimask_output: bool = True,
         return_logits: bool = False,
         normalize_coords=True,
+        pad_points: bool = False,
     ) -> Tuple[List[np.ndarray], List[np.ndarray], List[np.ndarray]]:
         """This function is very similar to predict(...), however it is used for batched mode, when the model is expected to generate predictions on multiple images.
         It returns a tuple of lists of masks, ious, and low_res_masks_logits.
+
+        The prompts of all images are decoded together: prompts with the same number of
+        point (and box) tokens go through the prompt encoder and mask decoder in a single
+        call, and the masks of all images with the same original size are upscaled
+        together. With pad_points=True, shorter point prompts are padded with "not a
+        point" tokens (label -1) so that all images are decoded in one call; this is
+        faster when the images have different numbers of clicks, but the masks may
+        change slightly as the padding tokens take part in the decoder attention.
         """
         assert self._is_batch, "This function should only be used when in batched mode"
         if not self._is_image_set:
@@ -191,9 +217,7 @@ class SAM2ImagePredictor:
                 "An image must be set with .set_image_batch(...) before mask prediction."
             )
         num_images = len(self._features["image_embed"])
-        all_masks = []
-        all_ious = []
-        all_low_res_masks = []
+        prompts = []
         for img_idx in range(num_images):
             # Transform input prompts
             point_coords = (
@@ -214,24 +238,20 @@ class SAM2ImagePredictor:
                 normalize_coords,
                 img_idx=img_idx,
             )
-            masks, iou_predictions, low_res_masks = self._predict(
-                unnorm_coords,
-                labels,
-                unnorm_box,
-                mask_input,
-                multimask_output,
-                return_logits=return_logits,
-                img_idx=img_idx,
-            )
-            masks_np = masks.squeeze(0).float().detach().cpu().numpy()
-            iou_predictions_np = (
-                iou_predictions.squeeze(0).float().detach().cpu().numpy()
-            )
-            low_res_masks_np = low_res_masks.squeeze(0).float().detach().cpu().numpy()
-            all_masks.append(masks_np)
-            all_ious.append(iou_predictions_np)
-            all_low_res_masks.append(low_res_masks_np)
+            concat_points = self._concat_box_and_points(unnorm_coords, labels, unnorm_box)
+            prompts.append((concat_points, mask_input))
 
+        all_masks, all_ious, all_low_res_masks = self._predict_multi_image(
+            prompts,
+            multimask_output,
+            return_logits=return_logits,
+            pad_points=pad_points,
+        )
+        all_masks = [m.squeeze(0).float().detach().cpu().numpy() for m in all_masks]
+        all_ious = [iou.squeeze(0).float().detach().cpu().numpy() for iou in all_ious]
+        all_low_res_masks = [
+            m.squeeze(0).float().detach().cpu().numpy() for m in all_low_res_masks
+        ]
         return all_masks, all_ious, all_low_res_masks
 
     def predict(
@@ -333,6 +353,30 @@ class SAM2ImagePredictor:
                 mask_input = mask_input[None, :, :, :]
         return mask_input, unnorm_coords, labels, unnorm_box
 
+    @staticmethod
+    def _concat_box_and_points(point_coords, point_labels, boxes):
+        """
+        Merge the "boxes" and "points" prompts into a single "concat_points" input
+        to sam_prompt_encoder (where boxes are added at the beginning), or None if
+        there is neither.
+        """
+        if point_coords is not None:
+            concat_points = (point_coords, point_labels)
+        else:
+            concat_points = None
+
+        if boxes is not None:
+            box_coords = boxes.reshape(-1, 2, 2)
+            box_labels = torch.tensor([[2, 3]], dtype=torch.int, device=boxes.device)
+            box_labels = box_labels.repeat(boxes.size(0), 1)
+            if concat_points is not None:
+                concat_coords = torch.cat([box_coords, concat_points[0]], dim=1)
+                concat_labels = torch.cat([box_labels, concat_points[1]], dim=1)
+                concat_points = (concat_coords, concat_labels)
+            else:
+                concat_points = (box_coords, box_labels)
+        return concat_points
+
     @torch.no_grad()
     def _predict(
         self,
@@ -384,25 +428,8 @@ class SAM2ImagePredictor:
                 "An image must be set with .set_image(...) before mask prediction."
             )
 
-        if point_coords is not None:
-            concat_points = (point_coords, point_labels)
-        else:
-            concat_points = None
-
         # Embed prompts
-        if boxes is not None:
-            box_coords = boxes.reshape(-1, 2, 2)
-            box_labels = torch.tensor([[2, 3]], dtype=torch.int, device=boxes.device)
-            box_labels = box_labels.repeat(boxes.size(0), 1)
-            # we merge "boxes" and "points" into a single "concat_points" input (where
-            # boxes are added at the beginning) to sam_prompt_encoder
-            if concat_points is not None:
-                concat_coords = torch.cat([box_coords, concat_points[0]], dim=1)
-                concat_labels = torch.cat([box_labels, concat_points[1]], dim=1)
-                concat_points = (concat_coords, concat_labels)
-            else:
-                concat_points = (box_coords, box_labels)
-
+        concat_points = self._concat_box_and_points(point_coords, point_labels, boxes)
         sparse_embeddings, dense_embeddings = self.model.sam_prompt_encoder(
             points=concat_points,
             boxes=None,
@@ -437,6 +464,150 @@ class SAM2ImagePredictor:
 
         return masks, iou_predictions, low_res_masks
 
+    @torch.no_grad()
+    def _predict_low_res(
+        self,
+        point_coords: Optional[torch.Tensor],
+        point_labels: Optional[torch.Tensor],
+        img_idx: torch.Tensor,
+        multimask_output: bool = True,
+        mask_input: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Like _predict, but for a batch set with set_image_batch where each
+        prompt may refer to a different image: `img_idx` is a length-B tensor
+        giving the image of each of the B prompts. The masks are not upscaled,
+        since the images may have different original sizes.
+
+        Returns:
+          (torch.Tensor): The low res mask logits in BxCxHxW format (H=W=256).
+          (torch.Tensor): An array of shape BxC with the predicted mask quality.
+        """
+        if not self._is_image_set:
+            raise RuntimeError(
+                "An image must be set with .set_image_batch(...) before mask prediction."
+            )
+        sparse_embeddings, dense_embeddings = self.model.sam_prompt_encoder(
+            points=(point_coords, point_labels) if point_coords is not None else None,
+            boxes=None,
+            masks=mask_input,
+        )
+        # without points or masks, the prompt encoder returns a batch of one
+        num_prompts = img_idx.size(0)
+        sparse_embeddings = sparse_embeddings.expand(num_prompts, -1, -1)
+        dense_embeddings = dense_embeddings.expand(num_prompts, -1, -1, -1)
+        high_res_features = [
+            feat_level[img_idx] for feat_level in self._features["high_res_feats"]
+        ]
+        low_res_masks, iou_predictions, _, _ = self.model.sam_mask_decoder(
+            image_embeddings=self._features["image_embed"][img_idx],
+            image_pe=self.model.sam_prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embeddings,
+            dense_prompt_embeddings=dense_embeddings,
+            multimask_output=multimask_output,
+            repeat_image=False,
+            high_res_features=high_res_features,
+        )
+        return low_res_masks, iou_predictions
+
+    @torch.no_grad()
+    def _predict_multi_image(
+        self,
+        prompts: List[Tuple[Optional[Tuple[torch.Tensor, torch.Tensor]], Optional[torch.Tensor]]],
+        multimask_output: bool = True,
+        return_logits: bool = False,
+        pad_points: bool = False,
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor], List[torch.Tensor]]:
+        """
+        Decode the prompts of all images of a batch set with set_image_batch.
+        `prompts` holds, for each image, its transformed `(concat_points, mask_input)`
+        (see `_concat_box_and_points`). The prompts are grouped by their number of
+        point tokens (after padding them with "not a point" tokens if pad_points=True)
+        and whether they have a mask input, and each group is decoded in one call.
+
+        Returns lists (one entry per image) of the masks in BxCxHxW format at the
+        original image size, the BxC mask qualities and the BxCx256x256 low res logits.
+        """
+        num_images = len(prompts)
+        num_rows = []
+        for concat_points, mask_input in prompts:
+            if concat_points is not None:
+                num_rows.append(concat_points[0].size(0))
+            elif mask_input is not None:
+                num_rows.append(mask_input.size(0))
+            else:
+                num_rows.append(1)
+
+        if pad_points:
+            max_tokens = max(
+                (p[0].size(1) for p, _ in prompts if p is not None), default=0
+            )
+            padded = []
+            for (concat_points, mask_input), rows in zip(prompts, num_rows):
+                num_tokens = 0 if concat_points is None else concat_points[0].size(1)
+                if num_tokens < max_tokens:
+                    pad_coords = torch.zeros(
+                        rows, max_tokens - num_tokens, 2, device=self.device
+                    )
+                    pad_labels = -torch.ones(
+                        rows, max_tokens - num_tokens, dtype=torch.int, device=self.device
+                    )
+                    if concat_points is not None:
+                        pad_coords = torch.cat([concat_points[0], pad_coords], dim=1)
+                        pad_labels = torch.cat([concat_points[1], pad_labels], dim=1)
+                    concat_points = (pad_coords, pad_labels)
+                padded.append((concat_points, mask_input))
+            prompts = padded
+
+        groups = {}
+        for i, (concat_points, mask_input) in enumerate(prompts):
+            num_tokens = 0 if concat_points is None else concat_points[0].size(1)
+            groups.setdefault((num_tokens, mask_input is not None), []).append(i)
+
+        all_low_res_masks = [None] * num_images
+        all_ious = [None] * num_images
+        for (num_tokens, has_mask_input), inds in groups.items():
+            img_idx = torch.cat(
+                [torch.full((num_rows[i],), i, dtype=torch.long) for i in inds]
+            ).to(self.device)
+            point_coords, point_labels, mask_input = None, None, None
+            if num_tokens > 0:
+                point_coords = torch.cat([prompts[i][0][0] for i in inds], dim=0)
+                point_labels = torch.cat([prompts[i][0][1] for i in inds], dim=0)
+            if has_mask_input:
+                mask_input = torch.cat([prompts[i][1] for i in inds], dim=0)
+            low_res_masks, iou_predictions = self._predict_low_res(
+                point_coords,
+                point_labels,
+                img_idx,
+                multimask_output,
+                mask_input=mask_input,
+            )
+            split_rows = [num_rows[i] for i in inds]
+            for i, low_res, iou in zip(
+                inds,
+                low_res_masks.split(split_rows),
+                iou_predictions.split(split_rows),
+            ):
+                all_low_res_masks[i] = low_res
+                all_ious[i] = iou
+
+        # Upscale the masks of the images with the same original size together
+        all_masks = [None] * num_images
+        sizes = {}
+        for i in range(num_images):
+            sizes.setdefault(tuple(self._orig_hw[i]), []).append(i)
+        for orig_hw, inds in sizes.items():
+            masks = self._transforms.postprocess_masks(
+                torch.cat([all_low_res_masks[i] for i in inds], dim=0), orig_hw
+            )
+            if not return_logits:
+                masks = masks > self.mask_threshold
+            for i, m in zip(inds, masks.split([num_rows[i] for i in inds])):
+                all_masks[i] = m
+        all_low_res_masks = [torch.clamp(m, -32.0, 32.0) for m in all_low_res_masks]
+        return all_masks, all_ious, all_low_res_masks
+
     def get_image_embedding(self) -> torch.Tensor:
         """
         Returns the image embeddings for the currently set image, with
@@ -4,6 +4,8 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import json
+import os
 import warnings
 from collections import OrderedDict
 
@@ -13,8 +15,18 @@ import torch.nn.functional as F
 from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
+from sam2.modeling.sam2_utils import MemoryTokenBank
 from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
 
+# retention policies for non-conditioning frame outputs outside the memory window
+MEMORY_RETENTION_POLICIES = ("all", "evict", "offload")
+
+# on-disk layout of a saved inference session (see `save_inference_state`)
+SESSION_VERSION = 1
+SESSION_META_FILE = "session.json"
+SESSION_TENSOR_FILE = "tensors.pt"
+SESSION_OUTPUT_KEYS = ("maskmem_features", "pred_masks", "obj_ptr", "object_score_logits")
+
 
 class SAM2VideoPredictor(SAM2Base):
     """The predictor class to handle user interactions and manage inference states."""
@@ -45,8 +57,15 @@ class SAM2VideoPredictor(SAM2Base):
         offload_video_to_cpu=False,
         offload_state_to_cpu=False,
         async_loading_frames=False,
+        memory_retention="all",
+        lazy_loading_frames=False,
     ):
         """Initialize an inference state."""
+        if memory_retention not in MEMORY_RETENTION_POLICIES:
+            raise ValueError(
+                f"memory_retention must be one of {MEMORY_RETENTION_POLICIES}, "
+                f"got {memory_retention!r}"
+            )
         compute_device = self.device  # device of the model
         images, video_height, video_width = load_video_frames(
             video_path=video_path,
@@ -54,7 +73,33 @@ class SAM2VideoPredictor(SAM2Base):
             offload_video_to_cpu=offload_video_to_cpu,
             async_loading_frames=async_loading_frames,
             compute_device=compute_device,
+            lazy_loading_frames=lazy_loading_frames,
         )
+        inference_state = self._new_inference_state(
+            images=images,
+            video_height=video_height,
+            video_width=video_width,
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=offload_state_to_cpu,
+            memory_retention=memory_retention,
+        )
+        # reference to the frame store, so that a saved session can reload the frames
+        inference_state["video_path"] = video_path if isinstance(video_path, str) else None
+        # Warm up the visual backbone and cache the image feature on frame 0
+        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+        return inference_state
+
+    def _new_inference_state(
+        self,
+        images,
+        video_height,
+        video_width,
+        offload_video_to_cpu,
+        offload_state_to_cpu,
+        memory_retention,
+    ):
+        """Create an empty inference state around already loaded video frames."""
+        compute_device = self.device  # device of the model
         inference_state = {}
         inference_state["images"] = images
         inference_state["num_frames"] = len(images)
@@ -74,6 +119,10 @@ class SAM2VideoPredictor(SAM2Base):
             inference_state["storage_device"] = torch.device("cpu")
         else:
             inference_state["storage_device"] = compute_device
+        # how to handle non-conditioning outputs that fall outside the memory window
+        # during propagation: "all" keeps every tracked frame, "evict" drops them and
+        # "offload" moves their heavy tensors to CPU memory (see `_apply_memory_retention`)
+        inference_state["memory_retention"] = memory_retention
         # inputs on each frame
         inference_state["point_inputs_per_obj"] = {}
         inference_state["mask_inputs_per_obj"] = {}
@@ -94,8 +143,9 @@ class SAM2VideoPredictor(SAM2Base):
         # (we directly use their consolidated outputs during tracking)
         # metadata for each tracking frame (e.g. which direction it's tracked)
         inference_state["frames_tracked_per_obj"] = {}
-        # Warm up the visual backbone and cache the image feature on frame 0
-        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+        # Per-object buffers of flattened memory tokens reused across frames during
+        # propagation (see `MemoryTokenBank`); they are rebuilt on demand and not saved
+        inference_state["memory_banks"] = {}
         return inference_state
 
     @classmethod
@@ -257,7 +307,7 @@ class SAM2VideoPredictor(SAM2Base):
 
         if prev_out is not None and prev_out["pred_masks"] is not None:
             device = inference_state["device"]
-            prev_sam_mask_logits = prev_out["pred_masks"].to(device, non_blocking=True)
+            prev_sam_mask_logits = prev_out["pred_masks"].to(device, non_blocking=True).float()
             # Clamp the scale of prev_sam_mask_logits to avoid rare numerical issues.
             prev_sam_mask_logits = torch.clamp(prev_sam_mask_logits, -32.0, 32.0)
         current_out, _ = self._run_single_frame_inference(
@@ -460,7 +510,7 @@ class SAM2VideoPredictor(SAM2Base):
             if out is None:
                 continue
             # Add the temporary object output mask to consolidated output mask
-            obj_mask = out["pred_masks"]
+            obj_mask = out["pred_masks"].float()
             consolidated_pred_masks = consolidated_out[consolidated_mask_key]
             if obj_mask.shape[-2:] == consolidated_pred_masks.shape[-2:]:
                 consolidated_pred_masks[obj_idx : obj_idx + 1] = obj_mask
@@ -503,7 +553,7 @@ class SAM2VideoPredictor(SAM2Base):
                     # Run memory encoder on the temporary outputs (if the memory feature is missing)
                     if out["maskmem_features"] is None:
                         high_res_masks = torch.nn.functional.interpolate(
-                            out["pred_masks"].to(inference_state["device"]),
+                            out["pred_masks"].to(inference_state["device"]).float(),
                             size=(self.image_size, self.image_size),
                             mode="bilinear",
                             align_corners=False,
@@ -549,13 +599,57 @@ class SAM2VideoPredictor(SAM2Base):
         start_frame_idx=None,
         max_frame_num_to_track=None,
         reverse=False,
+        obj_ids=None,
+        absent_patience=None,
+        absent_recheck_interval=10,
+        frame_stride=1,
+        memory_retention=None,
     ):
-        """Propagate the input points across frames to track in the entire video."""
+        """
+        Propagate the input points across frames to track in the entire video.
+
+        If `obj_ids` is provided, only those objects are tracked and returned (e.g. to
+        re-propagate a single object after a correction click); otherwise all objects are.
+
+        If `absent_patience` is set, an object is suspended after it has been predicted as
+        absent (non-positive object score) on that many consecutive frames. A suspended
+        object only runs the tracker on every `absent_recheck_interval`-th frame to check
+        whether it re-appears; on the other frames it outputs an empty mask (filled with
+        NO_OBJ_SCORE) and nothing is stored in its memory. Frames with input clicks or
+        masks are always used and resume a suspended object.
+
+        If `frame_stride` is larger than 1, only every `frame_stride`-th frame from
+        `start_frame_idx` is tracked (and `max_frame_num_to_track` counts frames, not
+        tracked frames); the tracked frames serve as consecutive memory frames for each
+        other. `memory_retention` overrides the state's retention policy for this call.
+        """
+        if frame_stride < 1:
+            raise ValueError("frame_stride must be a positive integer")
+        if memory_retention is not None and memory_retention not in MEMORY_RETENTION_POLICIES:
+            raise ValueError(
+                f"memory_retention must be one of {MEMORY_RETENTION_POLICIES}, "
+                f"got {memory_retention!r}"
+            )
+        if absent_patience is not None and absent_recheck_interval < 1:
+            raise ValueError("absent_recheck_interval must be a positive integer")
         self.propagate_in_video_preflight(inference_state)
 
-        obj_ids = inference_state["obj_ids"]
         num_frames = inference_state["num_frames"]
-        batch_size = self._get_obj_num(inference_state)
+        if obj_ids is None:
+            obj_ids = inference_state["obj_ids"]
+            obj_inds = list(range(self._get_obj_num(inference_state)))
+        else:
+            obj_ids = list(obj_ids)
+            obj_inds = []
+            for obj_id in obj_ids:
+                obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
+                if obj_idx is None:
+                    raise RuntimeError(
+                        f"Cannot propagate object id {obj_id} as it doesn't exist. "
+                        f"All existing object ids: {inference_state['obj_ids']}."
+                    )
+                obj_inds.append(obj_idx)
+        batch_size = len(obj_inds)
 
         # set start index, end index, and processing order
         if start_frame_idx is None:
@@ -571,19 +665,39 @@ class SAM2VideoPredictor(SAM2Base):
         if reverse:
             end_frame_idx = max(start_frame_idx - max_frame_num_to_track, 0)
             if start_frame_idx > 0:
-                processing_order = range(start_frame_idx, end_frame_idx - 1, -1)
+                processing_order = range(start_frame_idx, end_frame_idx - 1, -frame_stride)
             else:
                 processing_order = []  # skip reverse tracking if starting from frame 0
         else:
             end_frame_idx = min(
                 start_frame_idx + max_frame_num_to_track, num_frames - 1
             )
-            processing_order = range(start_frame_idx, end_frame_idx + 1)
+            processing_order = range(start_frame_idx, end_frame_idx + 1, frame_stride)
 
+        # consecutive absent frames and frames skipped since the last re-check, per object
+        num_absent_frames = [0] * batch_size
+        num_skipped_frames = [0] * batch_size
+        low_res_mask_size = self.image_size // 4
         for frame_idx in tqdm(processing_order, desc="propagate in video"):
             pred_masks_per_obj = [None] * batch_size
-            for obj_idx in range(batch_size):
+            for i, obj_idx in enumerate(obj_inds):
                 obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
+                is_suspended = (
+                    absent_patience is not None
+                    and num_absent_frames[i] >= absent_patience
+                    and frame_idx not in obj_output_dict["cond_frame_outputs"]
+                )
+                if is_suspended and num_skipped_frames[i] + 1 < absent_recheck_interval:
+                    # the object is lost; emit an empty mask without running the tracker
+                    num_skipped_frames[i] += 1
+                    pred_masks_per_obj[i] = torch.full(
+                        (1, 1, low_res_mask_size, low_res_mask_size),
+                        NO_OBJ_SCORE,
+                        dtype=torch.float32,
+                        device=inference_state["device"],
+                    )
+                    continue
+                num_skipped_frames[i] = 0
                 # We skip those frames already in consolidated outputs (these are frames
                 # that received input clicks or mask). Note that we cannot directly run
                 # batched forward on them via `_run_single_frame_inference` because the
@@ -593,6 +707,8 @@ class SAM2VideoPredictor(SAM2Base):
                     current_out = obj_output_dict[storage_key][frame_idx]
                     device = inference_state["device"]
                     pred_masks = current_out["pred_masks"].to(device, non_blocking=True)
+                    # saved sessions may store the mask logits in float16
+                    pred_masks = pred_masks.float()
                     if self.clear_non_cond_mem_around_input:
                         # clear non-conditioning memory of the surrounding frames
                         self._clear_obj_non_cond_mem_around_input(
@@ -610,13 +726,24 @@ class SAM2VideoPredictor(SAM2Base):
                         mask_inputs=None,
                         reverse=reverse,
                         run_mem_encoder=True,
+                        frame_step=frame_stride,
+                        memory_bank=self._get_memory_bank(inference_state, obj_idx),
                     )
                     obj_output_dict[storage_key][frame_idx] = current_out
 
                 inference_state["frames_tracked_per_obj"][obj_idx][frame_idx] = {
                     "reverse": reverse
                 }
-                pred_masks_per_obj[obj_idx] = pred_masks
+                pred_masks_per_obj[i] = pred_masks
+                if absent_patience is not None:
+                    if current_out["object_score_logits"].max().item() > 0:
+                        num_absent_frames[i] = 0
+                    else:
+                        num_absent_frames[i] += 1
+
+            self._apply_memory_retention(
+                inference_state, frame_idx, reverse, frame_stride, memory_retention
+            )
 
             # Resize the output mask to the original video resolution (we directly use
             # the mask scores on GPU for output to avoid any CPU conversion in between)
@@ -629,6 +756,368 @@ class SAM2VideoPredictor(SAM2Base):
             )
             yield frame_idx, obj_ids, video_res_masks
 
+    def _get_memory_retention_horizon(self):
+        """
+        The number of frames (in the tracking direction) that memory attention can
+        look back to, either through spatial memories or through object pointers.
+        """
+        horizon = self.memory_temporal_stride_for_eval * self.num_maskmem
+        if self.use_obj_ptrs_in_encoder:
+            horizon = max(horizon, self.max_obj_ptrs_in_encoder)
+        return horizon
+
+    def _apply_memory_retention(
+        self, inference_state, frame_idx, reverse, frame_step=1, policy=None
+    ):
+        """
+        Evict or offload the non-conditioning outputs that just left the memory window
+        after tracking `frame_idx`, so that the memory bank stays bounded on long videos.
+        When only every `frame_step`-th frame is tracked, the window is measured in
+        tracked frames, and all the frames that fell out of it since the previous tracked
+        frame are handled.
+
+        Frames within the horizon of a conditioning frame are always kept, since they
+        are needed when tracking restarts from that frame (e.g. for reverse tracking).
+        """
+        if policy is None:
+            policy = inference_state.get("memory_retention", "all")
+        if policy == "all":
+            return
+        horizon = self._get_memory_retention_horizon() * frame_step
+        if reverse:
+            stale_frame_inds = range(
+                frame_idx + horizon + frame_step, frame_idx + horizon, -1
+            )
+        else:
+            stale_frame_inds = range(
+                frame_idx - horizon - frame_step, frame_idx - horizon
+            )
+        num_frames = inference_state["num_frames"]
+        stale_frame_inds = [t for t in stale_frame_inds if 0 <= t < num_frames]
+
+        for obj_output_dict in inference_state["output_dict_per_obj"].values():
+            non_cond_frame_outputs = obj_output_dict["non_cond_frame_outputs"]
+            for stale_frame_idx in stale_frame_inds:
+                if any(
+                    abs(stale_frame_idx - t) <= horizon
+                    for t in obj_output_dict["cond_frame_outputs"]
+                ):
+                    continue
+                if policy == "evict":
+                    non_cond_frame_outputs.pop(stale_frame_idx, None)
+                    continue
+                out = non_cond_frame_outputs.get(stale_frame_idx, None)
+                if out is None:
+                    continue
+                # object pointers and scores are small and always read from the compute
+                # device, so we only move the spatial memory and the mask logits
+                for key in ("maskmem_features", "pred_masks"):
+                    if out[key] is not None:
+                        out[key] = out[key].to("cpu")
+
+    def restore_frame_context(self, inference_state, frame_idx, obj_id):
+        """
+        Re-track what `evict` retention dropped and new inputs on the already tracked
+        `frame_idx` of `obj_id` depend on: the output of `frame_idx` (its mask logits
+        are the decoder's mask input for new clicks) and the memory frames before it in
+        its tracking direction. Tracking restarts from the latest frame whose own memory
+        window is still complete (at worst the conditioning frame it was tracked from,
+        whose window is never evicted), so the restored outputs are the same as in the
+        original propagation. Returns the re-tracked frame indices.
+        """
+        obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
+        if obj_idx is None:
+            return []
+        frames_tracked = inference_state["frames_tracked_per_obj"][obj_idx]
+        if frame_idx not in frames_tracked:
+            return []
+        reverse = frames_tracked[frame_idx]["reverse"]
+        obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
+        cond_outputs = obj_output_dict["cond_frame_outputs"]
+        non_cond_outputs = obj_output_dict["non_cond_frame_outputs"]
+        horizon = self._get_memory_retention_horizon()
+        # towards the frames tracked before `frame_idx`
+        step = 1 if reverse else -1
+
+        def is_available(t):
+            return t not in frames_tracked or t in cond_outputs or t in non_cond_outputs
+
+        def has_memory_window(t):
+            return all(is_available(t + step * i) for i in range(1, horizon + 1))
+
+        start_frame_idx = frame_idx
+        while start_frame_idx not in cond_outputs and not has_memory_window(start_frame_idx):
+            if start_frame_idx + step not in frames_tracked:
+                break
+            start_frame_idx += step
+        if start_frame_idx == frame_idx and is_available(frame_idx):
+            return []
+
+        # keep every re-tracked output, they are about to be used as memory again
+        return [
+            out_frame_idx
+            for out_frame_idx, _, _ in self.propagate_in_video(
+                inference_state,
+                start_frame_idx=start_frame_idx,
+                max_frame_num_to_track=abs(frame_idx - start_frame_idx),
+                reverse=reverse,
+                obj_ids=[obj_id],
+                memory_retention="all",
+            )
+        ]
+
+    def get_memory_retention_stats(self, inference_state):
+        """
+        Report the number of frames and bytes held in the memory bank of each object.
+
+        Returns:
+          (dict): mapping from object id to a dict with the number of conditioning and
+          non-conditioning frames, the total retained bytes and the bytes offloaded to CPU.
+        """
+        compute_on_cpu = torch.device(inference_state["device"]).type == "cpu"
+        stats = {}
+        for obj_idx, obj_output_dict in inference_state["output_dict_per_obj"].items():
+            obj_stats = {
+                "num_cond_frames": len(obj_output_dict["cond_frame_outputs"]),
+                "num_non_cond_frames": len(obj_output_dict["non_cond_frame_outputs"]),
+                "retained_bytes": 0,
+                "offloaded_bytes": 0,
+            }
+            for storage_key in ("cond_frame_outputs", "non_cond_frame_outputs"):
+                for out in obj_output_dict[storage_key].values():
+                    for key in (
+                        "maskmem_features",
+                        "pred_masks",
+                        "obj_ptr",
+                        "object_score_logits",
+                    ):
+                        x = out.get(key, None)
+                        if x is None:
+                            continue
+                        num_bytes = x.numel() * x.element_size()
+                        obj_stats["retained_bytes"] += num_bytes
+                        if x.device.type == "cpu" and not compute_on_cpu:
+                            obj_stats["offloaded_bytes"] += num_bytes
+            stats[self._obj_idx_to_id(inference_state, obj_idx)] = obj_stats
+        return stats
+
+    @torch.inference_mode()
+    def save_inference_state(
+        self, inference_state, session_dir, half_precision=False, extra_meta=None
+    ):
+        """
+        Save an inference state to `session_dir`, so that it can be resumed with
+        `load_inference_state` without re-running `init_state` and propagation.
+
+        The session consists of a JSON metadata file (frame-store reference, object ids
+        and tracked-frame metadata) and a tensor file holding the prompts and per-object
+        outputs, which is memory-mapped when the session is loaded. If `half_precision`
+        is True, the memory features and mask logits are stored in float16.
+        """
+        if inference_state.get("video_path") is None:
+            raise RuntimeError(
+                "Only inference states initialized from a video path can be saved."
+            )
+        os.makedirs(session_dir, exist_ok=True)
+
+        def _pack_out(out):
+            packed = {}
+            for key in SESSION_OUTPUT_KEYS:
+                x = out.get(key)
+                if x is not None:
+                    x = x.detach().to("cpu")
+                    if half_precision and key in ("maskmem_features", "pred_masks"):
+                        x = x.to(torch.float16)
+                packed[key] = x
+            return packed
+
+        def _pack_outputs(output_dict_per_obj):
+            return {
+                obj_idx: {
+                    storage_key: {
+                        frame_idx: _pack_out(out)
+                        for frame_idx, out in obj_output_dict[storage_key].items()
+                    }
+                    for storage_key in ("cond_frame_outputs", "non_cond_frame_outputs")
+                }
+                for obj_idx, obj_output_dict in output_dict_per_obj.items()
+            }
+
+        maskmem_pos_enc = inference_state["constants"].get("maskmem_pos_enc")
+        tensors = {
+            "point_inputs_per_obj": {
+                obj_idx: {
+                    frame_idx: {k: v.to("cpu") for k, v in point_inputs.items()}
+                    for frame_idx, point_inputs in per_frame.items()
+                }
+                for obj_idx, per_frame in inference_state["point_inputs_per_obj"].items()
+            },
+            "mask_inputs_per_obj": {
+                obj_idx: {
+                    frame_idx: mask_inputs.to("cpu")
+                    for frame_idx, mask_inputs in per_frame.items()
+                }
+                for obj_idx, per_frame in inference_state["mask_inputs_per_obj"].items()
+            },
+            "output_dict_per_obj": _pack_outputs(inference_state["output_dict_per_obj"]),
+            "temp_output_dict_per_obj": _pack_outputs(
+                inference_state["temp_output_dict_per_obj"]
+            ),
+            "maskmem_pos_enc": (
+                None
+                if maskmem_pos_enc is None
+                else [x.to("cpu") for x in maskmem_pos_enc]
+            ),
+        }
+        # write to temporary files first, so that an interrupted save never leaves a
+        # half-written session behind
+        tensor_path = os.path.join(session_dir, SESSION_TENSOR_FILE)
+        torch.save(tensors, tensor_path + ".tmp")
+        meta = {
+            "version": SESSION_VERSION,
+            "video_path": os.path.abspath(inference_state["video_path"]),
+            "num_frames": inference_state["num_frames"],
+            "video_height": inference_state["video_height"],
+            "video_width": inference_state["video_width"],
+            "image_size": self.image_size,
+            "memory_retention": inference_state["memory_retention"],
+            "half_precision": bool(half_precision),
+            "obj_ids": list(inference_state["obj_ids"]),
+            # tracked frames of each object as [frame_idx, reverse] pairs
+            "frames_tracked_per_obj": {
+                str(obj_idx): [
+                    [frame_idx, bool(info["reverse"])]
+                    for frame_idx, info in sorted(frames_tracked.items())
+                ]
+                for obj_idx, frames_tracked in inference_state[
+                    "frames_tracked_per_obj"
+                ].items()
+            },
+            "extra": extra_meta or {},
+        }
+        meta_path = os.path.join(session_dir, SESSION_META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tensor_path + ".tmp", tensor_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @torch.inference_mode()
+    def load_inference_state(
+        self,
+        session_dir,
+        video_path=None,
+        offload_video_to_cpu=False,
+        async_loading_frames=False,
+        lazy_loading_frames=True,
+    ):
+        """
+        Resume an inference state saved by `save_inference_state`.
+
+        The saved tensors are memory-mapped, so resuming does not read the memory
+        features of every tracked frame up front; they are paged in when tracking or
+        corrections actually use them. For the same reason the resumed state keeps its
+        outputs in CPU memory (as with `offload_state_to_cpu=True`). The video frames are
+        reloaded from the saved frame-store reference (or `video_path` if given), lazily
+        by default.
+        """
+        with open(os.path.join(session_dir, SESSION_META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != SESSION_VERSION:
+            raise ValueError(
+                f"Unsupported session version {meta.get('version')!r} in {session_dir}"
+            )
+        if meta["image_size"] != self.image_size:
+            raise ValueError(
+                f"Session was saved with image_size={meta['image_size']}, "
+                f"but the model uses image_size={self.image_size}"
+            )
+        if lazy_loading_frames:
+            async_loading_frames = False
+        images, video_height, video_width = load_video_frames(
+            video_path=video_path or meta["video_path"],
+            image_size=self.image_size,
+            offload_video_to_cpu=offload_video_to_cpu,
+            async_loading_frames=async_loading_frames,
+            compute_device=self.device,
+            lazy_loading_frames=lazy_loading_frames,
+        )
+        if len(images) != meta["num_frames"]:
+            raise RuntimeError(
+                f"Session has {meta['num_frames']} frames, but the frame store "
+                f"now contains {len(images)} frames"
+            )
+        inference_state = self._new_inference_state(
+            images=images,
+            video_height=video_height,
+            video_width=video_width,
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=True,
+            memory_retention=meta["memory_retention"],
+        )
+        inference_state["video_path"] = video_path or meta["video_path"]
+        inference_state["session_meta"] = meta["extra"]
+
+        tensors = torch.load(
+            os.path.join(session_dir, SESSION_TENSOR_FILE),
+            map_location="cpu",
+            mmap=True,
+            weights_only=True,
+        )
+        device = inference_state["device"]
+        if tensors["maskmem_pos_enc"] is not None:
+            inference_state["constants"]["maskmem_pos_enc"] = [
+                x.to(device) for x in tensors["maskmem_pos_enc"]
+            ]
+
+        def _unpack_out(out):
+            # object pointers and scores are small and always kept on the compute device;
+            # the memory features and mask logits stay memory-mapped
+            out["obj_ptr"] = out["obj_ptr"].to(device)
+            out["object_score_logits"] = out["object_score_logits"].to(device)
+            out["maskmem_pos_enc"] = self._get_maskmem_pos_enc(
+                inference_state,
+                {
+                    "maskmem_pos_enc": (
+                        None
+                        if out["maskmem_features"] is None
+                        else inference_state["constants"]["maskmem_pos_enc"]
+                    )
+                },
+            )
+            return out
+
+        for obj_idx, obj_id in enumerate(meta["obj_ids"]):
+            inference_state["obj_id_to_idx"][obj_id] = obj_idx
+            inference_state["obj_idx_to_id"][obj_idx] = obj_id
+            inference_state["obj_ids"].append(obj_id)
+            inference_state["point_inputs_per_obj"][obj_idx] = {
+                frame_idx: {k: v.to(device) for k, v in point_inputs.items()}
+                for frame_idx, point_inputs in tensors["point_inputs_per_obj"][
+                    obj_idx
+                ].items()
+            }
+            inference_state["mask_inputs_per_obj"][obj_idx] = {
+                frame_idx: mask_inputs.to(device)
+                for frame_idx, mask_inputs in tensors["mask_inputs_per_obj"][
+                    obj_idx
+                ].items()
+            }
+            for key in ("output_dict_per_obj", "temp_output_dict_per_obj"):
+                inference_state[key][obj_idx] = {
+                    storage_key: {
+                        frame_idx: _unpack_out(out)
+                        for frame_idx, out in per_frame.items()
+                    }
+                    for storage_key, per_frame in tensors[key][obj_idx].items()
+                }
+            inference_state["frames_tracked_per_obj"][obj_idx] = {
+                frame_idx: {"reverse": reverse}
+                for frame_idx, reverse in meta["frames_tracked_per_obj"].get(
+                    str(obj_idx), []
+                )
+            }
+        return inference_state
+
     @torch.inference_mode()
     def clear_all_prompts_in_frame(
         self, inference_state, frame_idx, obj_id, need_output=True
@@ -686,6 +1175,20 @@ class SAM2VideoPredictor(SAM2Base):
         inference_state["temp_output_dict_per_obj"].clear()
         inference_state["frames_tracked_per_obj"].clear()
 
+    def _get_memory_bank(self, inference_state, obj_idx):
+        """Get (or create) the memory token bank of an object."""
+        memory_banks = inference_state.setdefault("memory_banks", {})
+        memory_bank = memory_banks.get(obj_idx, None)
+        if memory_bank is None:
+            max_obj_ptr_tokens = 0
+            if self.use_obj_ptrs_in_encoder:
+                max_obj_ptr_tokens = self.max_obj_ptrs_in_encoder * (
+                    self.hidden_dim // self.mem_dim
+                )
+            memory_bank = MemoryTokenBank(max_extra_tokens=max_obj_ptr_tokens)
+            memory_banks[obj_idx] = memory_bank
+        return memory_bank
+
     def _reset_tracking_results(self, inference_state):
         """Reset all tracking inputs and results across the videos."""
         for v in inference_state["point_inputs_per_obj"].values():
@@ -700,6 +1203,7 @@ class SAM2VideoPredictor(SAM2Base):
             v["non_cond_frame_outputs"].clear()
         for v in inference_state["frames_tracked_per_obj"].values():
             v.clear()
+        inference_state.get("memory_banks", {}).clear()
 
     def _get_image_feature(self, inference_state, frame_idx, batch_size):
         """Compute the image features on a given frame."""
@@ -746,6 +1250,8 @@ class SAM2VideoPredictor(SAM2Base):
         reverse,
         run_mem_encoder,
         prev_sam_mask_logits=None,
+        frame_step=1,
+        memory_bank=None,
     ):
         """Run tracking on a single frame based on current inputs and previous memory."""
         # Retrieve correct image features
@@ -772,6 +1278,8 @@ class SAM2VideoPredictor(SAM2Base):
             track_in_reverse=reverse,
             run_mem_encoder=run_mem_encoder,
             prev_sam_mask_logits=prev_sam_mask_logits,
+            frame_step=frame_step,
+            memory_bank=memory_bank,
         )
 
         # optionally offload the output to CPU memory to save GPU space
@@ -927,6 +1435,8 @@ class SAM2VideoPredictor(SAM2Base):
 
         _map_keys(inference_state["point_inputs_per_obj"])
         _map_keys(inference_state["mask_inputs_per_obj"])
+        # the memory banks are cheap to rebuild, so drop them instead of remapping
+        inference_state.get("memory_banks", {}).clear()
         _map_keys(inference_state["output_dict_per_obj"])
         _map_keys(inference_state["temp_output_dict_per_obj"])
         _map_keys(inference_state["frames_tracked_per_obj"])
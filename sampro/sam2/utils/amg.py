@@ -7,7 +7,7 @@
 import math
 from copy import deepcopy
 from itertools import product
-from typing import Any, Dict, Generator, ItemsView, List, Tuple
+from typing import Any, Dict, Generator, ItemsView, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -106,53 +106,148 @@ def batch_iterator(batch_size: int, *args) -> Generator[List[Any], None, None]:
         yield [arg[b * batch_size : (b + 1) * batch_size] for arg in args]
 
 
-def mask_to_rle_pytorch(tensor: torch.Tensor) -> List[Dict[str, Any]]:
+def mask_to_rle_counts_pytorch(tensor: torch.Tensor) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Encodes masks to an uncompressed RLE, in the format expected by
-    pycoco tools.
+    Encodes a batch of masks to uncompressed RLEs in a compact form: a flat array of
+    run lengths for all masks and an array of B+1 offsets, such that the counts of
+    mask i are `counts[offsets[i] : offsets[i + 1]]` (pycoco tools layout, i.e. the
+    first run counts zeros). The encoding is fully vectorized and transfers the
+    result to the host once.
     """
     # Put in fortran order and flatten h,w
     b, h, w = tensor.shape
     tensor = tensor.permute(0, 2, 1).flatten(1)
+    num_pixels = h * w
+    device = tensor.device
 
-    # Compute change indices
+    # Compute change indices; nonzero() returns them sorted by mask, then position
     diff = tensor[:, 1:] ^ tensor[:, :-1]
     change_indices = diff.nonzero()
+    mask_inds = change_indices[:, 0]
+    boundaries = change_indices[:, 1] + 1
+    num_changes = torch.bincount(mask_inds, minlength=b)
+    first_change = torch.cumsum(num_changes, dim=0) - num_changes
+
+    # Each mask has an optional leading 0 (if it starts with foreground), one run
+    # ending at each change index and a final run ending at h*w
+    leading_zero = tensor[:, 0].long() if num_pixels > 0 else num_changes.new_zeros(b)
+    lengths = leading_zero + num_changes + 1
+    offsets = torch.zeros(b + 1, dtype=torch.long, device=device)
+    offsets[1:] = torch.cumsum(lengths, dim=0)
+    counts = torch.zeros(int(offsets[-1]), dtype=torch.long, device=device)
+
+    # Runs ending at a change index start at the previous change of the same mask
+    run_starts = torch.zeros_like(boundaries)
+    run_starts[1:] = boundaries[:-1]
+    rank = torch.arange(len(boundaries), device=device) - first_change[mask_inds]
+    run_starts[rank == 0] = 0
+    counts[offsets[:-1][mask_inds] + leading_zero[mask_inds] + rank] = (
+        boundaries - run_starts
+    )
+    # Final run of each mask
+    last_boundary = torch.zeros(b, dtype=torch.long, device=device)
+    has_changes = num_changes > 0
+    last_boundary[has_changes] = boundaries[first_change[has_changes] + num_changes[has_changes] - 1]
+    counts[offsets[1:] - 1] = num_pixels - last_boundary
 
-    # Encode run length
-    out = []
-    for i in range(b):
-        cur_idxs = change_indices[change_indices[:, 0] == i, 1]
-        cur_idxs = torch.cat(
-            [
-                torch.tensor([0], dtype=cur_idxs.dtype, device=cur_idxs.device),
-                cur_idxs + 1,
-                torch.tensor([h * w], dtype=cur_idxs.dtype, device=cur_idxs.device),
-            ]
-        )
-        btw_idxs = cur_idxs[1:] - cur_idxs[:-1]
-        counts = [] if tensor[i, 0] == 0 else [0]
-        counts.extend(btw_idxs.detach().cpu().tolist())
-        out.append({"size": [h, w], "counts": counts})
-    return out
+    # Single device-to-host transfer for both arrays
+    packed = torch.cat([offsets, counts]).cpu().numpy()
+    return packed[b + 1 :], packed[: b + 1]
+
+
+def rle_counts_to_dicts(
+    counts: np.ndarray, offsets: np.ndarray, size: Tuple[int, int]
+) -> List[Dict[str, Any]]:
+    """Converts the compact RLE form of `mask_to_rle_counts_pytorch` to RLE dicts."""
+    h, w = size
+    return [
+        {"size": [h, w], "counts": counts[offsets[i] : offsets[i + 1]].tolist()}
+        for i in range(len(offsets) - 1)
+    ]
+
+
+def mask_to_rle_pytorch(tensor: torch.Tensor) -> List[Dict[str, Any]]:
+    """
+    Encodes masks to an uncompressed RLE, in the format expected by
+    pycoco tools.
+    """
+    _, h, w = tensor.shape
+    counts, offsets = mask_to_rle_counts_pytorch(tensor)
+    return rle_counts_to_dicts(counts, offsets, (h, w))
 
 
 def rle_to_mask(rle: Dict[str, Any]) -> np.ndarray:
     """Compute a binary mask from an uncompressed RLE."""
     h, w = rle["size"]
-    mask = np.empty(h * w, dtype=bool)
-    idx = 0
-    parity = False
-    for count in rle["counts"]:
-        mask[idx : idx + count] = parity
-        idx += count
-        parity ^= True
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    # runs alternate between background and foreground, starting with background
+    parity = np.arange(len(counts)) % 2 == 1
+    mask = np.repeat(parity, counts)
     mask = mask.reshape(w, h)
     return mask.transpose()  # Put in C order
 
 
+def rle_counts_to_masks(
+    counts: np.ndarray,
+    offsets: np.ndarray,
+    size: Tuple[int, int],
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Decodes the compact RLE form of `mask_to_rle_counts_pytorch` into a (B, H, W)
+    boolean array with a single `np.repeat`. If `out` is given (e.g. a preallocated
+    buffer reused across images), the masks are written into it.
+    """
+    h, w = size
+    b = len(offsets) - 1
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    # parity of each run within its own mask (every mask starts with background)
+    run_inds = np.arange(len(counts)) - np.repeat(offsets[:-1], np.diff(offsets))
+    masks = np.repeat(run_inds % 2 == 1, counts)
+    # Put in C order (as a view, like `rle_to_mask`, unless writing into `out`)
+    masks = masks.reshape(b, w, h).transpose(0, 2, 1)
+    if out is None:
+        return masks
+    out[...] = masks
+    return out
+
+
+def rles_to_masks(
+    rles: List[Dict[str, Any]], out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Decodes a list of same-sized uncompressed RLEs into a (B, H, W) boolean array."""
+    if len(rles) == 0:
+        if out is None:
+            raise ValueError("Cannot infer the mask size from an empty list of RLEs.")
+        return out
+    h, w = rles[0]["size"]
+    lengths = [len(rle["counts"]) for rle in rles]
+    offsets = np.zeros(len(rles) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    counts = np.concatenate([np.asarray(rle["counts"], dtype=np.int64) for rle in rles])
+    return rle_counts_to_masks(counts, offsets, (h, w), out=out)
+
+
 def area_from_rle(rle: Dict[str, Any]) -> int:
-    return sum(rle["counts"][1::2])
+    counts = rle["counts"]
+    if isinstance(counts, np.ndarray):
+        return int(counts[1::2].sum())
+    # for Python lists, the builtin sum is faster than converting to an array first
+    return sum(counts[1::2])
+
+
+def areas_from_rle_counts(counts: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Computes the areas of all masks in the compact RLE form at once."""
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    mask_inds = np.repeat(np.arange(len(lengths)), lengths)
+    run_inds = np.arange(len(counts)) - offsets[:-1][mask_inds]
+    foreground = np.where(run_inds % 2 == 1, counts, 0)
+    return np.bincount(mask_inds, weights=foreground, minlength=len(lengths)).astype(
+        np.int64
+    )
 
 
 def calculate_stability_score(
@@ -188,6 +283,54 @@ def build_point_grid(n_per_side: int) -> np.ndarray:
     return points
 
 
+def coarse_grid_mask(num_points: int, stride: int) -> Optional[np.ndarray]:
+    """
+    Selects every `stride`-th row and column of a square grid built by
+    build_point_grid, as a boolean mask over its points. Returns None if the
+    grid is not square or stride is less than 2.
+    """
+    n_per_side = int(round(math.sqrt(num_points)))
+    if stride < 2 or n_per_side * n_per_side != num_points:
+        return None
+    rows, cols = np.divmod(np.arange(num_points), n_per_side)
+    # centre the coarse grid within the fine one
+    return (rows % stride == stride // 2) & (cols % stride == stride // 2)
+
+
+def rle_contains_points(rle: Dict[str, Any], xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """
+    Looks up mask values at integer pixel coordinates directly in an
+    uncompressed RLE, without decoding the mask.
+    """
+    h, _ = rle["size"]
+    ends = np.cumsum(np.asarray(rle["counts"], dtype=np.int64))
+    # RLE counts run in column-major order and start with background
+    runs = np.searchsorted(ends, xs * h + ys, side="right")
+    return runs % 2 == 1
+
+
+def points_in_rle_interiors(
+    rles: List[Dict[str, Any]], points: np.ndarray, radius: float
+) -> np.ndarray:
+    """
+    For each (x, y) point, returns whether some mask contains both the point
+    and the four points at distance `radius` around it, i.e. whether the point
+    lies well inside an existing mask rather than near its boundary.
+    """
+    covered = np.zeros(len(points), dtype=bool)
+    if len(rles) == 0 or len(points) == 0:
+        return covered
+    h, w = rles[0]["size"]
+    offsets = np.array([[0, 0], [radius, 0], [-radius, 0], [0, radius], [0, -radius]])
+    samples = points[None, :, :] + offsets[:, None, :]
+    xs = np.clip(np.round(samples[..., 0]).astype(np.int64), 0, w - 1).reshape(-1)
+    ys = np.clip(np.round(samples[..., 1]).astype(np.int64), 0, h - 1).reshape(-1)
+    for rle in rles:
+        inside = rle_contains_points(rle, xs, ys).reshape(len(offsets), len(points))
+        covered |= inside.all(axis=0)
+    return covered
+
+
 def build_all_layer_point_grids(
     n_per_side: int, n_layers: int, scale_per_layer: int
 ) -> List[np.ndarray]:
@@ -293,6 +436,80 @@ def remove_small_regions(
     return mask, True
 
 
+def remove_small_regions_in_box(
+    mask: np.ndarray, area_thresh: float
+) -> Tuple[np.ndarray, bool, List[int]]:
+    """
+    Equivalent to `remove_small_regions` with mode="holes" followed by mode="islands",
+    but only runs connected components on the crop bounded by the mask's box (plus a
+    one-pixel margin). Returns the mask, whether it was modified and its new XYXY box
+    (in the format of `batched_mask_to_box`). The original mask is not modified.
+    """
+    import cv2  # type: ignore
+
+    h, w = mask.shape
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    # Background regions touching the margin connect to the background outside of the
+    # crop. That is only guaranteed to be a large region if every strip of the image
+    # outside of the crop is large, so fall back to the full mask otherwise.
+    crop_ok = len(rows) > 0
+    if crop_ok:
+        x0, x1 = max(int(cols[0]) - 1, 0), min(int(cols[-1]) + 2, w)
+        y0, y1 = max(int(rows[0]) - 1, 0), min(int(rows[-1]) + 2, h)
+        strips = [y0 * w, (h - y1) * w, x0 * h, (w - x1) * h]
+        crop_ok = all(area == 0 or area >= area_thresh for area in strips)
+    if not crop_ok:
+        new_mask, changed_holes = remove_small_regions(mask, area_thresh, mode="holes")
+        new_mask, changed_islands = remove_small_regions(
+            new_mask, area_thresh, mode="islands"
+        )
+        new_box = batched_mask_to_box(torch.as_tensor(new_mask)).tolist()
+        return new_mask, changed_holes or changed_islands, new_box
+
+    crop = mask[y0:y1, x0:x1]
+    # Fill small holes, except for background regions connected to the outside
+    n_labels, regions, stats, _ = cv2.connectedComponentsWithStats(
+        (~crop).astype(np.uint8), 8
+    )
+    open_border = [
+        regions[0, :] if y0 > 0 else None,
+        regions[-1, :] if y1 < h else None,
+        regions[:, 0] if x0 > 0 else None,
+        regions[:, -1] if x1 < w else None,
+    ]
+    outside_labels = set()
+    for border in open_border:
+        if border is not None:
+            outside_labels.update(np.unique(border).tolist())
+    sizes = stats[:, -1]
+    small_holes = [
+        i for i in range(1, n_labels) if sizes[i] < area_thresh and i not in outside_labels
+    ]
+    changed = len(small_holes) > 0
+    if changed:
+        crop = np.isin(regions, [0] + small_holes)
+    # All foreground regions lie inside of the crop, so islands can be removed directly
+    crop, changed_islands = remove_small_regions(crop, area_thresh, mode="islands")
+    changed = changed or changed_islands
+    if not changed:
+        return mask, False, [int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1])]
+
+    new_mask = mask.copy()
+    new_mask[y0:y1, x0:x1] = crop
+    crop_rows = np.flatnonzero(crop.any(axis=1))
+    crop_cols = np.flatnonzero(crop.any(axis=0))
+    if len(crop_rows) == 0:
+        return new_mask, True, [0, 0, 0, 0]
+    new_box = [
+        x0 + int(crop_cols[0]),
+        y0 + int(crop_rows[0]),
+        x0 + int(crop_cols[-1]),
+        y0 + int(crop_rows[-1]),
+    ]
+    return new_mask, True, new_box
+
+
 def coco_encode_rle(uncompressed_rle: Dict[str, Any]) -> Dict[str, Any]:
     from pycocotools import mask as mask_utils  # type: ignore
 
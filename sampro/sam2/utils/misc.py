@@ -6,6 +6,8 @@
 
 import os
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 
 import numpy as np
@@ -57,10 +59,60 @@ def get_connected_components(mask):
               for foreground pixels and 0 for background pixels.
     - counts: A tensor of shape (N, 1, H, W) containing the area of the connected
               components for foreground pixels and 0 for background pixels.
+
+    CUDA tensors use the CUDA extension (sam2/csrc/connected_components.cu). CPU
+    tensors, or CUDA tensors when the extension is not built, use the OpenCV
+    implementation in `get_connected_components_cpu`.
+    """
+    if mask.is_cuda:
+        try:
+            from sam2 import _C
+        except ImportError:
+            pass
+        else:
+            return _C.get_connected_componnets(mask.to(torch.uint8).contiguous())
+
+    return get_connected_components_cpu(mask)
+
+
+def get_connected_components_cpu(mask, num_workers=None):
+    """
+    CPU version of `get_connected_components` with the same inputs and outputs
+    (the label values differ from the CUDA kernel, only their grouping matters).
+
+    Each mask is labeled with OpenCV's connectedComponentsWithStats on a thread pool
+    of `num_workers` threads (OpenCV releases the GIL). Results are returned on the
+    device of `mask`.
     """
-    from sam2 import _C
+    import cv2
+
+    mask_np = np.ascontiguousarray(mask.to(torch.uint8).cpu().numpy())
+    labels = np.zeros(mask_np.shape, dtype=np.int32)
+    counts = np.zeros(mask_np.shape, dtype=np.int32)
 
-    return _C.get_connected_componnets(mask.to(torch.uint8).contiguous())
+    def _process(i):
+        _, labels_i, stats, _ = cv2.connectedComponentsWithStats(
+            mask_np[i, 0], connectivity=8, ltype=cv2.CV_32S
+        )
+        areas = stats[:, cv2.CC_STAT_AREA].astype(np.int32)
+        areas[0] = 0  # background
+        labels[i, 0] = labels_i
+        counts[i, 0] = areas[labels_i]
+
+    num_masks = mask_np.shape[0]
+    if num_workers is None:
+        num_workers = min(num_masks, os.cpu_count() or 1)
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(_process, range(num_masks)))
+    else:
+        for i in range(num_masks):
+            _process(i)
+
+    return (
+        torch.from_numpy(labels).to(mask.device),
+        torch.from_numpy(counts).to(mask.device),
+    )
 
 
 def mask_to_box(masks: torch.Tensor):
@@ -169,6 +221,61 @@ class AsyncVideoFrameLoader:
         return len(self.images)
 
 
+class LazyVideoFrameLoader:
+    """
+    A list of video frames that are loaded on demand, keeping only the most recently
+    used `max_cached_frames` frames in memory (for videos too long to be held in memory).
+    """
+
+    def __init__(
+        self,
+        img_paths,
+        image_size,
+        offload_video_to_cpu,
+        img_mean,
+        img_std,
+        compute_device,
+        max_cached_frames=16,
+    ):
+        self.img_paths = img_paths
+        self.image_size = image_size
+        self.offload_video_to_cpu = offload_video_to_cpu
+        self.img_mean = img_mean
+        self.img_std = img_std
+        self.compute_device = compute_device
+        self.max_cached_frames = max_cached_frames
+        self.cache = OrderedDict()
+        # video_height and video_width be filled when loading the first image
+        self.video_height = None
+        self.video_width = None
+        self.__getitem__(0)
+
+    def __getitem__(self, index):
+        img = self.cache.get(index, None)
+        if img is not None:
+            self.cache.move_to_end(index)
+            return img
+
+        img, video_height, video_width = _load_img_as_tensor(
+            self.img_paths[index], self.image_size
+        )
+        self.video_height = video_height
+        self.video_width = video_width
+        # normalize by mean and std
+        img = img.float()
+        img -= self.img_mean
+        img /= self.img_std
+        if not self.offload_video_to_cpu:
+            img = img.to(self.compute_device, non_blocking=True)
+        self.cache[index] = img
+        while len(self.cache) > self.max_cached_frames:
+            self.cache.popitem(last=False)
+        return img
+
+    def __len__(self):
+        return len(self.img_paths)
+
+
 def load_video_frames(
     video_path,
     image_size,
@@ -177,6 +284,7 @@ def load_video_frames(
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
     compute_device=torch.device("cuda"),
+    lazy_loading_frames=False,
 ):
     """
     Load the video frames from video_path. The frames are resized to image_size as in
@@ -203,6 +311,7 @@ def load_video_frames(
             img_std=img_std,
             async_loading_frames=async_loading_frames,
             compute_device=compute_device,
+            lazy_loading_frames=lazy_loading_frames,
         )
     else:
         raise NotImplementedError(
@@ -218,6 +327,7 @@ def load_video_frames_from_jpg_images(
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
     compute_device=torch.device("cuda"),
+    lazy_loading_frames=False,
 ):
     """
     Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format).
@@ -225,7 +335,9 @@ def load_video_frames_from_jpg_images(
     The frames are resized to image_size x image_size and are loaded to GPU if
     `offload_video_to_cpu` is `False` and to CPU if `offload_video_to_cpu` is `True`.
 
-    You can load a frame asynchronously by setting `async_loading_frames` to `True`.
+    You can load a frame asynchronously by setting `async_loading_frames` to `True`,
+    or only on demand (with a small cache of recent frames) by setting
+    `lazy_loading_frames` to `True`.
     """
     if isinstance(video_path, str) and os.path.isdir(video_path):
         jpg_folder = video_path
@@ -253,6 +365,17 @@ def load_video_frames_from_jpg_images(
     img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
     img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
 
+    if lazy_loading_frames:
+        lazy_images = LazyVideoFrameLoader(
+            img_paths,
+            image_size,
+            offload_video_to_cpu,
+            img_mean,
+            img_std,
+            compute_device,
+        )
+        return lazy_images, lazy_images.video_height, lazy_images.video_width
+
     if async_loading_frames:
         lazy_images = AsyncVideoFrameLoader(
             img_paths,
@@ -324,7 +447,8 @@ def fill_holes_in_mask_scores(mask, max_area):
         # We fill holes with a small positive mask score (0.1) to change them to foreground.
         mask = torch.where(is_hole, 0.1, mask)
     except Exception as e:
-        # Skip the post-processing step on removing small holes if the CUDA kernel fails
+        # Skip the post-processing step on removing small holes if the connected
+        # components computation fails
         warnings.warn(
             f"{e}\n\nSkipping the post-processing step due to the error above. You can "
             "still use SAM 2 and it's OK to ignore the error above, although some post-processing "
@@ -0,0 +1,308 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+ONNX_INPUT_NAMES = [
+    "image_embed",
+    "high_res_feats_0",
+    "high_res_feats_1",
+    "point_coords",
+    "point_labels",
+    "mask_input",
+    "has_mask_input",
+]
+ONNX_OUTPUT_NAMES = ["masks", "iou_predictions"]
+ONNX_ENCODER_INPUT_NAMES = ["image"]
+ONNX_ENCODER_OUTPUT_NAMES = ["high_res_feats_0", "high_res_feats_1", "image_embed"]
+
+
+class SAM2OnnxImageEncoder(nn.Module):
+    """
+    This model should not be called directly, but is used in ONNX export.
+    It runs the image encoder of SAM 2 on a transformed Bx3xHxW image batch (H=W=
+    image_size) and returns the image features exactly as
+    `SAM2ImagePredictor.set_image` computes them (see `_compute_image_features`):
+    the two high-res features for the SAM decoder, then the image embedding.
+    """
+
+    def __init__(self, model, bb_feat_sizes: Sequence[Tuple[int, int]]) -> None:
+        super().__init__()
+        self.model = model
+        self.bb_feat_sizes = list(bb_feat_sizes)
+
+    @torch.no_grad()
+    def forward(self, image: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        from sampro.sam2.sam2_image_predictor import SAM2ImagePredictor
+
+        feats = SAM2ImagePredictor._compute_image_features(
+            self.model, image, self.bb_feat_sizes
+        )
+        return tuple(feats)
+
+
+class OnnxImageEncoder:
+    """
+    Runs an exported `SAM2OnnxImageEncoder` with ONNX Runtime. Pass it as the
+    `image_encoder` of a `SAM2ImagePredictor` to replace the PyTorch image encoder in
+    `set_image` and `set_image_batch`.
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        providers: Sequence[str] = ("CPUExecutionProvider",),
+        num_threads: Optional[int] = None,
+    ) -> None:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=list(providers)
+        )
+        self.image_size = self.session.get_inputs()[0].shape[-1]
+
+    def __call__(self, img_batch: torch.Tensor) -> List[torch.Tensor]:
+        if img_batch.shape[-1] != self.image_size:
+            raise ValueError(
+                f"the ONNX image encoder expects {self.image_size}x{self.image_size} "
+                f"images, got {tuple(img_batch.shape[-2:])}"
+            )
+        feats = self.session.run(
+            ONNX_ENCODER_OUTPUT_NAMES,
+            {"image": img_batch.float().cpu().numpy()},
+        )
+        return [torch.from_numpy(feat) for feat in feats]
+
+
+class SAM2OnnxModel(nn.Module):
+    """
+    This model should not be called directly, but is used in ONNX export.
+    It combines the prompt encoder and mask decoder of SAM 2 for one image, with the
+    prompt embedding rewritten without data-dependent control flow to enable model
+    tracing. It returns the low-res masks and IoU predictions of all the mask tokens;
+    selecting the output masks and upscaling them is left to `OnnxPromptDecoder`.
+    """
+
+    def __init__(self, model) -> None:
+        super().__init__()
+        self.prompt_encoder = model.sam_prompt_encoder
+        self.mask_decoder = model.sam_mask_decoder
+
+    def _embed_points(
+        self, point_coords: torch.Tensor, point_labels: torch.Tensor
+    ) -> torch.Tensor:
+        # points are expected to be padded already (see `OnnxPromptDecoder`)
+        h, w = self.prompt_encoder.input_image_size
+        point_coords = (point_coords + 0.5) / torch.tensor(
+            [w, h], dtype=torch.float32, device=point_coords.device
+        )
+        point_embedding = self.prompt_encoder.pe_layer._pe_encoding(point_coords)
+        point_labels = point_labels.unsqueeze(-1).expand_as(point_embedding)
+
+        point_embedding = point_embedding * (point_labels != -1)
+        point_embedding = (
+            point_embedding
+            + self.prompt_encoder.not_a_point_embed.weight * (point_labels == -1)
+        )
+        for i in range(self.prompt_encoder.num_point_embeddings):
+            point_embedding = point_embedding + self.prompt_encoder.point_embeddings[
+                i
+            ].weight * (point_labels == i)
+        return point_embedding
+
+    def _embed_masks(
+        self, mask_input: torch.Tensor, has_mask_input: torch.Tensor
+    ) -> torch.Tensor:
+        mask_embedding = has_mask_input * self.prompt_encoder.mask_downscaling(
+            mask_input
+        )
+        mask_embedding = mask_embedding + (
+            1 - has_mask_input
+        ) * self.prompt_encoder.no_mask_embed.weight.reshape(1, -1, 1, 1)
+        return mask_embedding
+
+    @torch.no_grad()
+    def forward(
+        self,
+        image_embed: torch.Tensor,
+        high_res_feats_0: torch.Tensor,
+        high_res_feats_1: torch.Tensor,
+        point_coords: torch.Tensor,
+        point_labels: torch.Tensor,
+        mask_input: torch.Tensor,
+        has_mask_input: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        sparse_embedding = self._embed_points(point_coords, point_labels)
+        dense_embedding = self._embed_masks(mask_input, has_mask_input)
+        masks, iou_predictions, _, _ = self.mask_decoder.predict_masks(
+            image_embeddings=image_embed,
+            image_pe=self.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embedding,
+            dense_prompt_embeddings=dense_embedding,
+            repeat_image=False,
+            high_res_features=[high_res_feats_0, high_res_feats_1],
+        )
+        return masks, iou_predictions
+
+    def dummy_inputs(self, num_points: int = 2) -> Tuple[torch.Tensor, ...]:
+        """Example inputs for `torch.onnx.export`, in the order of ONNX_INPUT_NAMES."""
+        embed_dim = self.prompt_encoder.embed_dim
+        h, w = self.prompt_encoder.image_embedding_size
+        mask_h, mask_w = self.prompt_encoder.mask_input_size
+        return (
+            torch.randn(1, embed_dim, h, w),
+            torch.randn(1, embed_dim // 8, 4 * h, 4 * w),
+            torch.randn(1, embed_dim // 4, 2 * h, 2 * w),
+            torch.randint(
+                0, self.prompt_encoder.input_image_size[0], (1, num_points, 2)
+            ).float(),
+            torch.randint(0, 4, (1, num_points)).float(),
+            torch.randn(1, 1, mask_h, mask_w),
+            torch.tensor([1.0]),
+        )
+
+
+class OnnxPromptDecoder:
+    """
+    Runs an exported `SAM2OnnxModel` with ONNX Runtime on the image currently set in
+    a `SAM2ImagePredictor`. `predict` takes the same prompts and returns the same
+    outputs as `SAM2ImagePredictor.predict`; only the prompt encoder and mask decoder
+    run in ONNX Runtime, the mask selection and upscaling reuse the PyTorch code.
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        providers: Sequence[str] = ("CPUExecutionProvider",),
+        num_threads: Optional[int] = None,
+    ) -> None:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=list(providers)
+        )
+        # the graph is exported for one model input size (see `build_sam2`)
+        self.image_embedding_size = self.session.get_inputs()[0].shape[-1]
+        self._features = None
+        self._image_inputs = None
+
+    def _get_image_inputs(self, predictor):
+        # the image features are converted once per image (set_image creates a new
+        # feature dict for every image)
+        features = predictor._features
+        if features is not self._features:
+            high_res_feats = features["high_res_feats"]
+            self._image_inputs = {
+                "image_embed": features["image_embed"][-1:].float().cpu().numpy(),
+                "high_res_feats_0": high_res_feats[0][-1:].float().cpu().numpy(),
+                "high_res_feats_1": high_res_feats[1][-1:].float().cpu().numpy(),
+            }
+            self._features = features
+        return self._image_inputs
+
+    def _decode(self, predictor, coords, labels, mask_input):
+        """Low-res masks and IoU predictions of all mask tokens, for one prompt."""
+        prompt_encoder = predictor.model.sam_prompt_encoder
+        if coords is None:
+            coords = np.zeros((1, 0, 2), dtype=np.float32)
+            labels = np.zeros((1, 0), dtype=np.float32)
+        else:
+            # same padding point as SAM2's prompt encoder (boxes are passed as points)
+            coords = np.concatenate(
+                [coords, np.zeros((1, 1, 2), dtype=np.float32)], axis=1
+            )
+            labels = np.concatenate(
+                [labels, -np.ones((1, 1), dtype=np.float32)], axis=1
+            )
+        if mask_input is None:
+            mask_input = np.zeros((1, 1, *prompt_encoder.mask_input_size), np.float32)
+            has_mask_input = np.zeros(1, dtype=np.float32)
+        else:
+            has_mask_input = np.ones(1, dtype=np.float32)
+        inputs = dict(self._get_image_inputs(predictor))
+        inputs.update(
+            point_coords=coords.astype(np.float32),
+            point_labels=labels.astype(np.float32),
+            mask_input=mask_input.astype(np.float32),
+            has_mask_input=has_mask_input,
+        )
+        masks, iou_predictions = self.session.run(ONNX_OUTPUT_NAMES, inputs)
+        return torch.from_numpy(masks), torch.from_numpy(iou_predictions)
+
+    @torch.no_grad()
+    def predict(
+        self,
+        predictor,
+        point_coords: Optional[np.ndarray] = None,
+        point_labels: Optional[np.ndarray] = None,
+        box: Optional[np.ndarray] = None,
+        mask_input: Optional[np.ndarray] = None,
+        multimask_output: bool = True,
+        return_logits: bool = False,
+        normalize_coords=True,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """See `SAM2ImagePredictor.predict`."""
+        if not predictor._is_image_set:
+            raise RuntimeError(
+                "An image must be set with .set_image(...) before mask prediction."
+            )
+        mask_input, unnorm_coords, labels, unnorm_box = predictor._prep_prompts(
+            point_coords, point_labels, box, mask_input, normalize_coords
+        )
+        concat_points = predictor._concat_box_and_points(
+            unnorm_coords, labels, unnorm_box
+        )
+        coords = labels = None
+        num_prompts = 1
+        if concat_points is not None:
+            coords = concat_points[0].float().cpu().numpy()
+            labels = concat_points[1].float().cpu().numpy()
+            num_prompts = coords.shape[0]
+        if mask_input is not None:
+            mask_input = mask_input.float().cpu().numpy()
+            num_prompts = max(num_prompts, mask_input.shape[0])
+
+        # the exported graph decodes one prompt at a time
+        all_masks, all_iou_predictions = [], []
+        for i in range(num_prompts):
+            masks, iou_predictions = self._decode(
+                predictor,
+                coords[i : i + 1] if coords is not None else None,
+                labels[i : i + 1] if labels is not None else None,
+                mask_input[min(i, len(mask_input) - 1)][None]
+                if mask_input is not None
+                else None,
+            )
+            all_masks.append(masks)
+            all_iou_predictions.append(iou_predictions)
+        low_res_masks, iou_predictions = (
+            predictor.model.sam_mask_decoder.select_mask_outputs(
+                torch.cat(all_masks), torch.cat(all_iou_predictions), multimask_output
+            )
+        )
+
+        # Upscale the masks to the original image resolution
+        masks = predictor._transforms.postprocess_masks(
+            low_res_masks, predictor._orig_hw[-1]
+        )
+        low_res_masks = torch.clamp(low_res_masks, -32.0, 32.0)
+        if not return_logits:
+            masks = masks > predictor.mask_threshold
+
+        masks_np = masks.squeeze(0).float().numpy()
+        iou_predictions_np = iou_predictions.squeeze(0).float().numpy()
+        low_res_masks_np = low_res_masks.squeeze(0).float().numpy()
+        return masks_np, iou_predictions_np, low_res_masks_np
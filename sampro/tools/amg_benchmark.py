@@ -0,0 +1,145 @@
+# Benchmark of the automatic mask generator: uniform vs adaptive point sampling.
+#
+# Runs SAM2AutomaticMaskGenerator with the uniform point grid and with
+# adaptive_sampling=True on the same images, and reports decoder points,
+# masks/sec and the recall of the adaptive masks against the uniform ones.
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+from sam2.build_sam import build_sam2
+from sam2.utils.amg import rles_to_masks
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _downsampled_masks(rles, factor):
+    if len(rles) == 0:
+        return np.zeros((0, 0), dtype=bool)
+    masks = rles_to_masks(rles)[:, ::factor, ::factor]
+    return masks.reshape(len(masks), -1)
+
+
+def mask_recall(reference_rles, candidate_rles, iou_thresh=0.5, factor=4):
+    """Fraction of reference masks matched by a candidate mask with IoU >= iou_thresh."""
+    if len(reference_rles) == 0:
+        return 1.0
+    if len(candidate_rles) == 0:
+        return 0.0
+    ref = torch.from_numpy(_downsampled_masks(reference_rles, factor)).float()
+    cand = torch.from_numpy(_downsampled_masks(candidate_rles, factor)).float()
+    inter = ref @ cand.T
+    union = ref.sum(1, keepdim=True) + cand.sum(1)[None, :] - inter
+    iou = inter / union.clamp(min=1)
+    return float((iou.max(dim=1).values >= iou_thresh).float().mean())
+
+
+def run_generator(generator, image, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        anns = generator.generate(image)
+        times.append(time.perf_counter() - start)
+    return anns, min(times)
+
+
+def main(args):
+    device = torch.device(args.device)
+    model = build_sam2(args.sam2_cfg, args.sam2_checkpoint, device=device)
+    common = dict(
+        points_per_side=args.points_per_side,
+        points_per_batch=args.points_per_batch,
+        crop_n_layers=args.crop_n_layers,
+        output_mode="uncompressed_rle",
+    )
+    generators = {
+        "uniform": SAM2AutomaticMaskGenerator(model, **common),
+        "adaptive": SAM2AutomaticMaskGenerator(
+            model,
+            adaptive_sampling=True,
+            adaptive_coarse_stride=args.coarse_stride,
+            **common,
+        ),
+    }
+
+    image_paths = sorted(glob.glob(os.path.join(args.image_dir, "*.jpg")))
+    results = []
+    for image_path in image_paths:
+        image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+        row = {"image": os.path.basename(image_path)}
+        anns = {}
+        for name, generator in generators.items():
+            anns[name], seconds = run_generator(generator, image, args.repeats)
+            row[name] = {
+                "seconds": seconds,
+                "num_masks": len(anns[name]),
+                "masks_per_sec": len(anns[name]) / seconds,
+                "points_decoded": generator.num_points_decoded,
+            }
+        row["recall"] = mask_recall(
+            [a["segmentation"] for a in anns["uniform"]],
+            [a["segmentation"] for a in anns["adaptive"]],
+            iou_thresh=args.recall_iou,
+        )
+        results.append(row)
+        print(
+            f"{row['image']}: uniform {row['uniform']['num_masks']} masks / "
+            f"{row['uniform']['points_decoded']} points in {row['uniform']['seconds']:.2f}s, "
+            f"adaptive {row['adaptive']['num_masks']} masks / "
+            f"{row['adaptive']['points_decoded']} points in {row['adaptive']['seconds']:.2f}s, "
+            f"recall@{args.recall_iou} {row['recall']:.3f}"
+        )
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="path to the SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--image_dir",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "notebooks", "images"),
+        help="directory of JPEG images to run on",
+    )
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--points_per_side", type=int, default=32)
+    parser.add_argument("--points_per_batch", type=int, default=64)
+    parser.add_argument("--crop_n_layers", type=int, default=0)
+    parser.add_argument(
+        "--coarse_stride",
+        type=int,
+        default=2,
+        help="the adaptive coarse pass uses every nth row and column of the grid",
+    )
+    parser.add_argument(
+        "--recall_iou",
+        type=float,
+        default=0.5,
+        help="mask IoU for an adaptive mask to count as recalling a uniform-grid mask",
+    )
+    parser.add_argument("--repeats", type=int, default=1, help="timing repeats per image (best is kept)")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    main(args)
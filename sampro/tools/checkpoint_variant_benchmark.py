@@ -0,0 +1,182 @@
+# Compare checkpoint variants (see tools/convert_checkpoint.py) with the original fp32
+# checkpoint: load time, peak memory, image encoder time and mask IoU.
+#
+# Each checkpoint is measured in a fresh Python process (so that the peak RSS only
+# covers that checkpoint), without model snapshots. Every image of --image_dir (a
+# held-out set, not used for anything else) is encoded once and prompted with a grid
+# of single points; the masks of each variant are compared with the fp32 masks.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 2**20
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def list_images(image_dir, max_images):
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(image_dir, n) for n in names[:max_images]]
+
+
+def grid_points(height, width, points_per_side):
+    offsets = (np.arange(points_per_side) + 0.5) / points_per_side
+    xs, ys = np.meshgrid(offsets * width, offsets * height)
+    return np.stack([xs.ravel(), ys.ravel()], axis=-1)
+
+
+def child(args):
+    import cv2
+    import torch
+
+    from sam2.build_sam import build_sam2
+    from sam2.sam2_image_predictor import SAM2ImagePredictor
+
+    start = time.perf_counter()
+    model = build_sam2(args.sam2_cfg, args.checkpoint, device=args.device)
+    build_s = time.perf_counter() - start
+    build_peak_rss_mb = peak_rss_mb()
+    predictor = SAM2ImagePredictor(model)
+
+    encode_times, masks = [], {}
+    with torch.inference_mode():
+        for image_path in list_images(args.image_dir, args.max_images):
+            image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+            start = time.perf_counter()
+            predictor.set_image(image)
+            encode_times.append(time.perf_counter() - start)
+            points = grid_points(*image.shape[:2], args.points_per_side)
+            image_masks, _, _ = predictor.predict(
+                point_coords=points[:, None, :],
+                point_labels=np.ones((len(points), 1), dtype=np.int64),
+                multimask_output=False,
+            )
+            masks[os.path.basename(image_path)] = image_masks[:, 0] > 0
+    np.savez_compressed(args.masks_out, **masks)
+    print(
+        json.dumps(
+            {
+                "build_s": build_s,
+                "build_peak_rss_mb": build_peak_rss_mb,
+                "peak_rss_mb": peak_rss_mb(),
+                "encode_s": float(np.median(encode_times)),
+                "file_mb": os.path.getsize(args.checkpoint) / 2**20,
+            }
+        )
+    )
+
+
+def run_child(args, checkpoint, masks_out):
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        "--checkpoint",
+        checkpoint,
+        "--masks_out",
+        masks_out,
+        "--sam2_cfg",
+        args.sam2_cfg,
+        "--image_dir",
+        args.image_dir,
+        "--max_images",
+        str(args.max_images),
+        "--points_per_side",
+        str(args.points_per_side),
+        "--device",
+        args.device,
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def mask_ious(masks_a, masks_b):
+    """IoU of each pair of masks (two empty masks count as identical)."""
+    inter = np.logical_and(masks_a, masks_b).sum(axis=(-2, -1))
+    union = np.logical_or(masks_a, masks_b).sum(axis=(-2, -1))
+    return np.where(union > 0, inter / np.maximum(union, 1), 1.0)
+
+
+def main(args):
+    name, ext = os.path.splitext(args.sam2_checkpoint)
+    checkpoints = {"fp32": args.sam2_checkpoint}
+    for variant in args.variants:
+        path = f"{name}.{variant}{ext}"
+        if os.path.isfile(path):
+            checkpoints[variant] = path
+        else:
+            print(f"skipping {variant}: {path} not found (see tools/convert_checkpoint.py)")
+
+    results = {"config": args.sam2_cfg, "device": args.device, "images": args.image_dir}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        masks = {}
+        for variant, path in checkpoints.items():
+            masks_out = os.path.join(tmp_dir, f"{variant}.npz")
+            results[variant] = run_child(args, path, masks_out)
+            masks[variant] = np.load(masks_out)
+        for variant in checkpoints:
+            ious = np.concatenate(
+                [mask_ious(masks[variant][k], masks["fp32"][k]) for k in masks["fp32"].files]
+            )
+            results[variant]["mean_iou"] = float(ious.mean())
+            results[variant]["p5_iou"] = float(np.percentile(ious, 5))
+
+    for variant in checkpoints:
+        r = results[variant]
+        print(
+            f"{variant}: file {r['file_mb']:.0f} MB, build {r['build_s']:.2f}s, "
+            f"peak RSS {r['build_peak_rss_mb']:.0f} MB after build / {r['peak_rss_mb']:.0f} MB, "
+            f"encode {r['encode_s']:.2f}s, mask IoU vs fp32 mean {r['mean_iou']:.4f} "
+            f"(5th percentile {r['p5_iou']:.4f})"
+        )
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="original fp32 checkpoint; its variants are looked up next to it",
+    )
+    parser.add_argument("--variants", type=str, nargs="+", default=["fp16", "bf16", "int8"])
+    parser.add_argument("--image_dir", type=str, required=True, help="held-out images to compare masks on")
+    parser.add_argument("--max_images", type=int, default=20)
+    parser.add_argument("--points_per_side", type=int, default=4, help="point prompts per image side")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--checkpoint", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--masks_out", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
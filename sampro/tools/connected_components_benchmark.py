@@ -0,0 +1,89 @@
+# Benchmark of the connected components used by fill_holes_in_mask_scores.
+#
+# Times the CPU (OpenCV) connected components single-threaded and on a thread
+# pool, and `fill_holes_in_mask_scores` on CPU and, when available, on CUDA, on
+# random blob masks.
+
+import argparse
+import json
+import os
+import time
+
+import torch
+
+from sam2.utils.misc import fill_holes_in_mask_scores, get_connected_components_cpu
+
+
+def random_mask_scores(num_masks, size, seed=0):
+    """Mask logits with a few large blobs and many small holes, like SAM outputs."""
+    generator = torch.Generator().manual_seed(seed)
+    coarse = torch.randn(num_masks, 1, size // 32, size // 32, generator=generator)
+    scores = torch.nn.functional.interpolate(coarse, size=(size, size), mode="bilinear")
+    noise = torch.randn(num_masks, 1, size, size, generator=generator)
+    return scores + 0.5 * noise
+
+
+def time_fn(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(args):
+    results = []
+    for size in args.sizes:
+        for num_masks in args.num_masks:
+            scores = random_mask_scores(num_masks, size)
+            row = {"size": size, "num_masks": num_masks}
+            background = scores <= 0
+            # warm up OpenCV
+            get_connected_components_cpu(background)
+            row["cc_cpu_1_thread"] = time_fn(
+                lambda: get_connected_components_cpu(background, num_workers=1),
+                args.repeats,
+            )
+            row["cc_cpu_thread_pool"] = time_fn(
+                lambda: get_connected_components_cpu(background), args.repeats
+            )
+            row["fill_holes_cpu"] = time_fn(
+                lambda: fill_holes_in_mask_scores(scores, args.max_area), args.repeats
+            )
+            if torch.cuda.is_available():
+                scores_cuda = scores.cuda()
+                fill_holes_in_mask_scores(scores_cuda, args.max_area)
+                row["fill_holes_cuda"] = time_fn(
+                    lambda: fill_holes_in_mask_scores(scores_cuda, args.max_area),
+                    args.repeats,
+                )
+
+            # sanity check: holes were filled
+            filled = fill_holes_in_mask_scores(scores, args.max_area)
+            _, areas = get_connected_components_cpu(filled <= 0)
+            row["holes_left"] = int(((areas > 0) & (areas <= args.max_area)).sum())
+
+            results.append(row)
+            timings = ", ".join(
+                f"{k} {v * 1000:.1f} ms" for k, v in row.items() if isinstance(v, float)
+            )
+            print(f"{num_masks} x {size}x{size}: {timings}")
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--num_masks", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max_area", type=int, default=8, help="fill_hole_area to benchmark")
+    parser.add_argument("--repeats", type=int, default=3, help="timing repeats (best is kept)")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    print(f"CPU threads available: {os.cpu_count()}")
+    main(args)
@@ -0,0 +1,105 @@
+# Convert a SAM 2 checkpoint into variants that are faster to load and use less RAM.
+#
+# - "fp16" / "bf16": every floating point weight is stored in half precision; the
+#   weights are upcast to the model dtype (fp32) when loaded, so inference is unchanged
+#   apart from the rounding of the weights.
+# - "int8": the `nn.Linear` layers of the image encoder are dynamically quantized to
+#   int8 (CPU only), the remaining weights are stored in fp16.
+#
+# The variants are written next to the checkpoint (or to --output_dir) as
+# `<name>.<variant>.pt`, where the labeling tool discovers them automatically. Use
+# tools/checkpoint_variant_benchmark.py to compare their load time, memory and masks
+# with the original checkpoint.
+
+import argparse
+import os
+import time
+from collections import OrderedDict
+
+import torch
+
+from sam2.build_sam import build_sam2, quantize_dynamic_int8
+
+VARIANT_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "int8": torch.float16}
+
+
+def variant_path(ckpt_path, variant, output_dir=None):
+    name, ext = os.path.splitext(os.path.basename(ckpt_path))
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(ckpt_path)), f"{name}.{variant}{ext}")
+
+
+def _cast_weights(sd, dtype, keys):
+    """Cast the floating point tensors among `keys` of `sd` to `dtype`."""
+    out = OrderedDict(
+        (k, v.to(dtype) if k in keys and torch.is_tensor(v) and v.is_floating_point() else v)
+        for k, v in sd.items()
+    )
+    # the module versions in the metadata tell the quantized layers how to load their
+    # state
+    if hasattr(sd, "_metadata"):
+        out._metadata = sd._metadata
+    return out
+
+
+def convert(ckpt_path, variant, sam2_cfg=None, output_dir=None):
+    sd = torch.load(ckpt_path, map_location="cpu", weights_only=True)["model"]
+    dtype = VARIANT_DTYPES[variant]
+    ckpt = {"weights_dtype": str(dtype).replace("torch.", "")}
+    if variant == "int8":
+        if sam2_cfg is None:
+            raise ValueError("--sam2_cfg is required for the int8 variant")
+        model = build_sam2(sam2_cfg, ckpt_path, device="cpu", apply_postprocessing=False)
+        quantize_dynamic_int8(model, ["image_encoder"])
+        # only the original (non-quantized) weights are cast, the quantized layers
+        # keep their packed int8 weights and fp32 biases
+        ckpt["model"] = _cast_weights(model.state_dict(), dtype, set(sd))
+        ckpt["quantized_modules"] = ["image_encoder"]
+    else:
+        ckpt["model"] = _cast_weights(sd, dtype, set(sd))
+
+    out_path = variant_path(ckpt_path, variant, output_dir)
+    tmp_path = out_path + ".tmp"
+    torch.save(ckpt, tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def main(args):
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    src_size = os.path.getsize(args.sam2_checkpoint)
+    print(f"{args.sam2_checkpoint}: {src_size / 2**20:.1f} MB")
+    for variant in args.variants:
+        start = time.perf_counter()
+        out_path = convert(args.sam2_checkpoint, variant, args.sam2_cfg, args.output_dir)
+        size = os.path.getsize(out_path)
+        print(
+            f"{variant}: {out_path} ({size / 2**20:.1f} MB, {size / src_size:.0%} of the "
+            f"original) in {time.perf_counter() - start:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sam2_checkpoint", type=str, required=True, help="fp32 SAM 2 checkpoint to convert")
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="model configuration of the checkpoint (needed for the int8 variant)",
+    )
+    parser.add_argument(
+        "--variants",
+        type=str,
+        nargs="+",
+        default=["fp16", "int8"],
+        choices=sorted(VARIANT_DTYPES),
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="where to write the variants (next to the checkpoint by default)",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,407 @@
+# CPU benchmark of the labeling tool's hot paths, runnable offline.
+#
+# Unlike sam2/benchmark.py (CUDA only, a real checkpoint and a notebook video, video
+# propagation only), this builds a randomly initialized model from a config (the tiny
+# one by default, no checkpoint needed) and times on CPU, with synthetic data:
+# image decode, `set_image`, the first and a follow-up click (`predict`), `Draw_Mask`,
+# video frame loading, `propagate_in_video` for several numbers of objects, the
+# automatic mask generator, RLE encode/decode and YOLO/XML label write/read.
+# Random weights give meaningless masks but the same amount of compute, so the
+# timings are comparable between runs of the same config on the same machine.
+#
+# The results are written as JSON together with system information. With --baseline,
+# the median times are compared with a previous result file and the benchmarks slower
+# by more than --tolerance are reported as regressions (the exit code is 1 with
+# --fail_on_regression, e.g. in CI).
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+from sam2.build_sam import build_sam2, build_sam2_video_predictor, image_size_overrides
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from sam2.utils.amg import mask_to_rle_pytorch, rle_to_mask
+from sam2.utils.misc import load_video_frames
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(SAMPRO_ROOT)
+
+BENCHMARKS = [
+    "image_decode",
+    "set_image",
+    "predict",
+    "draw_mask",
+    "video_frame_loading",
+    "propagate_in_video",
+    "amg",
+    "rle",
+    "labels",
+]
+
+
+def measure(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {"median_ms": float(np.median(times)), "min_ms": float(times.min()), "repeats": repeats}
+
+
+def system_info(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "num_threads": args.num_threads,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "git_commit": commit,
+    }
+
+
+def synthetic_image(height, width, seed=0):
+    """A smooth image with a few shapes (random noise would make JPEG decode unusually slow)."""
+    rng = np.random.default_rng(seed)
+    image = cv2.resize(
+        rng.integers(0, 256, (height // 32, width // 32, 3), dtype=np.uint8),
+        (width, height),
+        interpolation=cv2.INTER_CUBIC,
+    )
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(20, width // 6)), int(rng.integers(20, height // 6)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.ellipse(image, center, axes, 0, 0, 360, color, -1)
+    return image
+
+
+def ellipse_masks(num_masks, height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    masks = np.zeros((num_masks, height, width), dtype=np.uint8)
+    for mask in masks:
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(10, width // 4)), int(rng.integers(10, height // 4)))
+        cv2.ellipse(mask, center, axes, int(rng.integers(0, 180)), 0, 360, 1, -1)
+    return masks.astype(bool)
+
+
+def grid_points(num_points, height, width):
+    side = int(np.ceil(np.sqrt(num_points)))
+    offsets = (np.arange(side) + 0.5) / side
+    xs, ys = np.meshgrid(offsets * width, offsets * height)
+    return np.stack([xs.ravel(), ys.ravel()], axis=-1)[:num_points].astype(np.float32)
+
+
+def bench_image_decode(ctx, args):
+    results = {}
+    for ext in (".jpg", ".png"):
+        path = os.path.join(ctx["tmp_dir"], f"decode{ext}")
+        cv2.imwrite(path, ctx["image_bgr"])
+        results[f"image_decode{ext.replace('.', '_')}"] = measure(
+            lambda: cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB), args.repeats
+        )
+    return results
+
+
+def bench_set_image(ctx, args):
+    predictor = ctx["predictor"]
+    return {"set_image": measure(lambda: predictor.set_image(ctx["image"]), args.model_repeats)}
+
+
+def bench_predict(ctx, args):
+    predictor = ctx["predictor"]
+    predictor.set_image(ctx["image"])
+    height, width = ctx["image"].shape[:2]
+    points = grid_points(3, height, width)
+    labels = np.array([1, 1, 0])
+    # the first click returns three masks; the following ones feed back the best low-res mask
+    _, scores, logits = predictor.predict(
+        point_coords=points[:1], point_labels=labels[:1], multimask_output=True
+    )
+    mask_input = logits[np.argmax(scores)][None]
+    return {
+        "predict_first_click": measure(
+            lambda: predictor.predict(
+                point_coords=points[:1], point_labels=labels[:1], multimask_output=True
+            ),
+            args.repeats,
+        ),
+        "predict_next_click": measure(
+            lambda: predictor.predict(
+                point_coords=points,
+                point_labels=labels,
+                mask_input=mask_input,
+                multimask_output=False,
+            ),
+            args.repeats,
+        ),
+    }
+
+
+def bench_draw_mask(ctx, args):
+    from sampro.LabelQuick_TW import Anything_TW
+
+    # only the drawing state is needed, not the models built by __init__
+    drawer = Anything_TW.__new__(Anything_TW)
+    drawer.clicked_x = None
+    drawer.method = 1
+    drawer.mask_box = None
+    height, width = ctx["image_bgr"].shape[:2]
+    mask = ellipse_masks(1, height, width)
+    return {
+        "draw_mask": measure(
+            lambda: drawer.Draw_Mask(mask, ctx["image_bgr"].copy()), args.repeats
+        )
+    }
+
+
+def bench_video_frame_loading(ctx, args):
+    image_size = ctx["video_predictor"].image_size
+    result = measure(
+        lambda: load_video_frames(
+            video_path=ctx["video_dir"],
+            image_size=image_size,
+            offload_video_to_cpu=True,
+            compute_device=torch.device("cpu"),
+        ),
+        args.repeats,
+    )
+    result["ms_per_frame"] = result["median_ms"] / args.num_frames
+    return {"video_frame_loading": result}
+
+
+def bench_propagate_in_video(ctx, args):
+    predictor = ctx["video_predictor"]
+    state = predictor.init_state(video_path=ctx["video_dir"], offload_video_to_cpu=True)
+    height, width = state["video_height"], state["video_width"]
+    results = {}
+    for num_objects in args.num_objects:
+        predictor.reset_state(state)
+        for obj_id, point in enumerate(grid_points(num_objects, height, width)):
+            predictor.add_new_points_or_box(
+                state, frame_idx=0, obj_id=obj_id, points=point[None], labels=np.array([1])
+            )
+
+        def propagate():
+            for _ in predictor.propagate_in_video(state):
+                pass
+
+        result = measure(propagate, args.video_repeats, warmup=0)
+        result["ms_per_frame"] = result["median_ms"] / args.num_frames
+        results[f"propagate_in_video_{num_objects}_objects"] = result
+    return results
+
+
+def bench_amg(ctx, args):
+    predictor = ctx["predictor"]
+    generator = SAM2AutomaticMaskGenerator(
+        predictor.model,
+        points_per_side=args.amg_points_per_side,
+        output_mode="uncompressed_rle",
+    )
+    predictor.set_image(ctx["image"])
+    # like the labeling tool, reuse the embedding of the interactive predictor
+    return {
+        "amg_generate": measure(
+            lambda: generator.generate(ctx["image"], image_predictor=predictor),
+            args.model_repeats,
+        )
+    }
+
+
+def bench_rle(ctx, args):
+    height, width = ctx["image"].shape[:2]
+    masks = torch.from_numpy(ellipse_masks(args.num_masks, height, width))
+    rles = mask_to_rle_pytorch(masks)
+    return {
+        "rle_encode": measure(lambda: mask_to_rle_pytorch(masks), args.repeats),
+        "rle_decode": measure(lambda: [rle_to_mask(rle) for rle in rles], args.repeats),
+    }
+
+
+def bench_labels(ctx, args):
+    from pathlib import Path
+
+    from util.xmlfile import load_yolo_labels, write_yolo_labels, xml
+
+    height, width = ctx["image"].shape[:2]
+    rng = np.random.default_rng(0)
+    labels = []
+    for i in range(args.num_labels):
+        x0, y0 = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 50))
+        labels.append(
+            {
+                "name": f"class_{i % 10}",
+                "pose": "Unspecified",
+                "truncated": 0,
+                "difficult": 0,
+                "bndbox": [x0, y0, x0 + int(rng.integers(10, 50)), y0 + int(rng.integers(10, 50))],
+            }
+        )
+    size = [width, height, 3]
+    base_path = Path(ctx["tmp_dir"]) / "labels" / "image"
+    xml_path = str(base_path.with_suffix(".xml"))
+    image_path = os.path.join(ctx["tmp_dir"], "image.jpg")
+    write_yolo_labels(base_path, size, labels)
+    results = {
+        "yolo_write": measure(lambda: write_yolo_labels(base_path, size, labels), args.repeats),
+        "yolo_read": measure(
+            lambda: load_yolo_labels(base_path.with_suffix(".txt"), width, height), args.repeats
+        ),
+        "xml_write": measure(lambda: xml(image_path, xml_path, size, labels), args.repeats),
+    }
+    try:
+        # the XML reader of the labeling tool lives next to its Qt helpers
+        from util.QtFunc import get_labels
+    except ImportError as exc:
+        print(f"skipping xml_read: {exc}")
+    else:
+        results["xml_read"] = measure(lambda: get_labels(xml_path), args.repeats)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline of each median time; return the regressed names."""
+    if baseline["system"].get("processor") != results["system"]["processor"] or baseline[
+        "system"
+    ].get("num_threads") != results["system"]["num_threads"]:
+        print("warning: the baseline was measured on another CPU or thread count")
+    if baseline.get("config") != results["config"]:
+        print("warning: the baseline was measured with other benchmark settings")
+    regressions = []
+    print(f"{'benchmark':<36} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for name, result in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        ratio = result["median_ms"] / reference["median_ms"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(
+            f"{name:<36} {reference['median_ms']:>9.2f}ms {result['median_ms']:>9.2f}ms "
+            f"{ratio:>6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main(args):
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    benchmarks = args.only or BENCHMARKS
+    overrides = image_size_overrides(args.image_size)
+
+    image_bgr = synthetic_image(args.image_height, args.image_width)
+    ctx = {"image_bgr": image_bgr, "image": cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)}
+    if {"set_image", "predict", "amg"} & set(benchmarks):
+        model = build_sam2(args.sam2_cfg, None, device="cpu", hydra_overrides_extra=overrides)
+        ctx["predictor"] = SAM2ImagePredictor(model)
+    if {"video_frame_loading", "propagate_in_video"} & set(benchmarks):
+        ctx["video_predictor"] = build_sam2_video_predictor(
+            args.sam2_cfg, None, device="cpu", hydra_overrides_extra=overrides
+        )
+
+    results = {
+        "system": system_info(args),
+        "config": {
+            "sam2_cfg": args.sam2_cfg,
+            "image_size": args.image_size,
+            "image_hw": [args.image_height, args.image_width],
+            "num_frames": args.num_frames,
+            "num_objects": args.num_objects,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir, torch.inference_mode():
+        ctx["tmp_dir"] = tmp_dir
+        ctx["video_dir"] = os.path.join(tmp_dir, "video")
+        os.makedirs(ctx["video_dir"])
+        for frame_idx in range(args.num_frames):
+            frame = np.roll(image_bgr, 8 * frame_idx, axis=1)
+            cv2.imwrite(os.path.join(ctx["video_dir"], f"{frame_idx:05d}.jpg"), frame)
+
+        for name in benchmarks:
+            for key, result in globals()[f"bench_{name}"](ctx, args).items():
+                results["results"][key] = result
+                extra = f", {result['ms_per_frame']:.1f} ms/frame" if "ms_per_frame" in result else ""
+                print(f"{key}: {result['median_ms']:.2f} ms (min {result['min_ms']:.2f}){extra}")
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_t.yaml",
+        help="SAM 2 model configuration file (randomly initialized)",
+    )
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=None,
+        help="model input size (the config's by default, see build_sam2)",
+    )
+    parser.add_argument("--only", type=str, nargs="+", choices=BENCHMARKS, default=None)
+    parser.add_argument("--image_height", type=int, default=1080)
+    parser.add_argument("--image_width", type=int, default=1920)
+    parser.add_argument("--repeats", type=int, default=20, help="runs of the fast benchmarks")
+    parser.add_argument("--model_repeats", type=int, default=3, help="runs of set_image and AMG")
+    parser.add_argument("--num_frames", type=int, default=8, help="frames of the synthetic video")
+    parser.add_argument("--num_objects", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--video_repeats", type=int, default=1, help="runs of propagate_in_video")
+    parser.add_argument("--amg_points_per_side", type=int, default=16)
+    parser.add_argument("--num_masks", type=int, default=32, help="masks of the RLE benchmark")
+    parser.add_argument("--num_labels", type=int, default=100, help="labels of the YOLO/XML benchmark")
+    parser.add_argument("--num_threads", type=int, default=os.cpu_count(), help="CPU threads")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    parser.add_argument("--baseline", type=str, default=None, help="result file to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative slowdown over the baseline reported as a regression",
+    )
+    parser.add_argument("--fail_on_regression", action="store_true")
+    args = parser.parse_args()
+    main(args)
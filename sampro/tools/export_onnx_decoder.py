@@ -0,0 +1,146 @@
+# Export the SAM 2 prompt encoder and mask decoder to an ONNX model.
+#
+# The exported model (`sam2.utils.onnx.SAM2OnnxModel`) takes the image features of
+# one image (image embedding and the two high-res feature maps computed by
+# `SAM2ImagePredictor.set_image`), the point prompts and an optional low-res mask
+# input, and returns the low-res masks and IoU predictions of all mask tokens. It
+# is run with `sam2.utils.onnx.OnnxPromptDecoder`, which the labeling tool uses for
+# per-click decoding on CPU. The image encoder stays in PyTorch.
+#
+# By default the model is written next to the checkpoint as `<name>.decoder.onnx`
+# and, with --quantize, a dynamically int8-quantized copy as `<name>.decoder.int8.onnx`,
+# where the labeling tool discovers them.
+
+import argparse
+import os
+import re
+import warnings
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.utils.onnx import ONNX_INPUT_NAMES, ONNX_OUTPUT_NAMES, SAM2OnnxModel
+
+
+def default_output_path(ckpt_path, quantized=False, image_size=None):
+    # checkpoint variants (see convert_checkpoint.py) share the decoder of the original;
+    # models for a reduced input size are named <name>.decoder.<image_size>[.int8].onnx
+    name = re.sub(r"\.(fp16|bf16|int8)$", "", os.path.splitext(ckpt_path)[0])
+    name = f"{name}.decoder" if image_size is None else f"{name}.decoder.{image_size}"
+    return f"{name}.int8.onnx" if quantized else f"{name}.onnx"
+
+
+def export(model, output, opset):
+    onnx_model = SAM2OnnxModel(model).eval()
+    dummy_inputs = onnx_model.dummy_inputs()
+    dynamic_axes = {
+        "point_coords": {1: "num_points"},
+        "point_labels": {1: "num_points"},
+    }
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+        warnings.filterwarnings("ignore", category=UserWarning)
+        # the TorchScript-based exporter handles this model without torch.export
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        torch.onnx.export(
+            onnx_model,
+            dummy_inputs,
+            output,
+            export_params=True,
+            verbose=False,
+            opset_version=opset,
+            do_constant_folding=True,
+            input_names=ONNX_INPUT_NAMES,
+            output_names=ONNX_OUTPUT_NAMES,
+            dynamic_axes=dynamic_axes,
+            dynamo=False,
+        )
+    return onnx_model, dummy_inputs
+
+
+def check(onnx_model, dummy_inputs, path):
+    """Compare the ONNX Runtime outputs with PyTorch on the dummy inputs."""
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    inputs = {name: t.numpy() for name, t in zip(ONNX_INPUT_NAMES, dummy_inputs)}
+    ort_masks, ort_iou = session.run(ONNX_OUTPUT_NAMES, inputs)
+    masks, iou = onnx_model(*dummy_inputs)
+    return float(np.abs(ort_masks - masks.numpy()).max()), float(
+        np.abs(ort_iou - iou.numpy()).max()
+    )
+
+
+def main(args):
+    model = build_sam2(
+        args.sam2_cfg, args.sam2_checkpoint, device="cpu", image_size=args.image_size
+    )
+    output = args.output or default_output_path(
+        args.sam2_checkpoint, image_size=args.image_size
+    )
+    print(f"Exporting the prompt encoder and mask decoder to {output}...")
+    onnx_model, dummy_inputs = export(model, output, args.opset)
+    outputs = [output]
+
+    if args.quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_out = args.quantize_out or default_output_path(
+            args.sam2_checkpoint, quantized=True, image_size=args.image_size
+        )
+        print(f"Quantizing the model and writing it to {quantize_out}...")
+        quantize_dynamic(
+            model_input=output,
+            model_output=quantize_out,
+            per_channel=False,
+            reduce_range=False,
+            weight_type=QuantType.QUInt8,
+        )
+        outputs.append(quantize_out)
+
+    for path in outputs:
+        masks_diff, iou_diff = check(onnx_model, dummy_inputs, path)
+        print(
+            f"{path}: {os.path.getsize(path) / 2**20:.1f} MB, max abs diff vs PyTorch: "
+            f"masks {masks_diff:.2e}, IoU predictions {iou_diff:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the SAM 2 prompt encoder and mask decoder to an ONNX model."
+    )
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument("--sam2_checkpoint", type=str, required=True, help="SAM 2 model checkpoint")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="ONNX file to write (<checkpoint name>.decoder.onnx by default)",
+    )
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=None,
+        help="export for a reduced model input size (e.g. 512 or 768, see build_sam2)",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="also write a copy quantized with onnxruntime's quantize_dynamic",
+    )
+    parser.add_argument(
+        "--quantize_out",
+        type=str,
+        default=None,
+        help="quantized ONNX file to write (<checkpoint name>.decoder.int8.onnx by default)",
+    )
+    args = parser.parse_args()
+    main(args)
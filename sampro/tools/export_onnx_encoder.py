@@ -0,0 +1,153 @@
+# Export the SAM 2 image encoder to an ONNX model for CPU deployment.
+#
+# The exported model (`sam2.utils.onnx.SAM2OnnxImageEncoder`) takes a transformed
+# image batch of fixed size (model.image_size, i.e. 1024x1024; the batch size is
+# dynamic) and returns the image features computed by `SAM2ImagePredictor.set_image`:
+# the image encoder, the projection of the high-res features for the SAM decoder
+# (`SAM2Base.forward_image`) and `_prepare_backbone_features`. Pass
+# `sam2.utils.onnx.OnnxImageEncoder` as the `image_encoder` of a `SAM2ImagePredictor`
+# to use it.
+#
+# By default the model is written next to the checkpoint as `<name>.encoder.onnx`
+# and, with --quantize, a dynamically int8-quantized copy as `<name>.encoder.int8.onnx`,
+# where the labeling tool discovers them. Use tools/onnx_encoder_benchmark.py to check
+# the parity with PyTorch and compare the throughput.
+
+import argparse
+import os
+import re
+import warnings
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from sam2.utils.onnx import (
+    ONNX_ENCODER_INPUT_NAMES,
+    ONNX_ENCODER_OUTPUT_NAMES,
+    SAM2OnnxImageEncoder,
+)
+
+
+def default_output_path(ckpt_path, quantized=False, image_size=None):
+    # checkpoint variants (see convert_checkpoint.py) share the encoder of the original;
+    # models for a reduced input size are named <name>.encoder.<image_size>[.int8].onnx
+    name = re.sub(r"\.(fp16|bf16|int8)$", "", os.path.splitext(ckpt_path)[0])
+    name = f"{name}.encoder" if image_size is None else f"{name}.encoder.{image_size}"
+    return f"{name}.int8.onnx" if quantized else f"{name}.onnx"
+
+
+def export(model, output, opset):
+    predictor = SAM2ImagePredictor(model)
+    onnx_model = SAM2OnnxImageEncoder(model, predictor._bb_feat_sizes).eval()
+    dummy_image = torch.randn(1, 3, model.image_size, model.image_size)
+    dynamic_axes = {
+        name: {0: "batch_size"} for name in ONNX_ENCODER_INPUT_NAMES + ONNX_ENCODER_OUTPUT_NAMES
+    }
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+        warnings.filterwarnings("ignore", category=UserWarning)
+        # the TorchScript-based exporter handles this model without torch.export
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        torch.onnx.export(
+            onnx_model,
+            (dummy_image,),
+            output,
+            export_params=True,
+            verbose=False,
+            opset_version=opset,
+            do_constant_folding=True,
+            input_names=ONNX_ENCODER_INPUT_NAMES,
+            output_names=ONNX_ENCODER_OUTPUT_NAMES,
+            dynamic_axes=dynamic_axes,
+            dynamo=False,
+        )
+    return onnx_model, dummy_image
+
+
+def check(onnx_model, dummy_image, path):
+    """Max abs difference of each output between ONNX Runtime and PyTorch."""
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    ort_feats = session.run(ONNX_ENCODER_OUTPUT_NAMES, {"image": dummy_image.numpy()})
+    feats = onnx_model(dummy_image)
+    return {
+        name: float(np.abs(ort_feat - feat.numpy()).max())
+        for name, ort_feat, feat in zip(ONNX_ENCODER_OUTPUT_NAMES, ort_feats, feats)
+    }
+
+
+def main(args):
+    model = build_sam2(
+        args.sam2_cfg, args.sam2_checkpoint, device="cpu", image_size=args.image_size
+    )
+    output = args.output or default_output_path(
+        args.sam2_checkpoint, image_size=args.image_size
+    )
+    print(f"Exporting the image encoder to {output}...")
+    onnx_model, dummy_image = export(model, output, args.opset)
+    outputs = [output]
+
+    if args.quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_out = args.quantize_out or default_output_path(
+            args.sam2_checkpoint, quantized=True, image_size=args.image_size
+        )
+        print(f"Quantizing the model and writing it to {quantize_out}...")
+        quantize_dynamic(
+            model_input=output,
+            model_output=quantize_out,
+            per_channel=False,
+            reduce_range=False,
+            weight_type=QuantType.QUInt8,
+        )
+        outputs.append(quantize_out)
+
+    for path in outputs:
+        diffs = check(onnx_model, dummy_image, path)
+        print(
+            f"{path}: {os.path.getsize(path) / 2**20:.1f} MB, max abs diff vs PyTorch: "
+            + ", ".join(f"{name} {diff:.2e}" for name, diff in diffs.items())
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the SAM 2 image encoder to an ONNX model."
+    )
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument("--sam2_checkpoint", type=str, required=True, help="SAM 2 model checkpoint")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="ONNX file to write (<checkpoint name>.encoder.onnx by default)",
+    )
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=None,
+        help="export for a reduced model input size (e.g. 512 or 768, see build_sam2)",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="also write a copy quantized with onnxruntime's quantize_dynamic",
+    )
+    parser.add_argument(
+        "--quantize_out",
+        type=str,
+        default=None,
+        help="quantized ONNX file to write (<checkpoint name>.encoder.int8.onnx by default)",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,159 @@
+# Per-frame benchmark of the memory assembly in video tracking.
+#
+# Simulates tracking one object through a video with a randomly initialized SAM 2
+# model (no checkpoint needed) and times `_prepare_memory_conditioned_features` on
+# every frame, once concatenating all memories (the default) and once with a
+# `MemoryTokenBank` that keeps them in preallocated buffers updated in place.
+# With --skip_attention the memory attention is replaced by a no-op, so only the
+# memory gathering / concatenation cost is measured.
+
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.modeling.sam2_utils import MemoryTokenBank
+
+
+class _NoAttention(torch.nn.Module):
+    def forward(self, curr, curr_pos, memory, memory_pos, num_obj_ptr_tokens=0):
+        return curr[0]
+
+
+def _sync(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def _random_output(model, batch_size, feat_size, maskmem_pos_enc, device, storage_device):
+    """A compact frame output as stored by `SAM2VideoPredictor` (bfloat16 memory features)."""
+    H, W = feat_size
+    maskmem_features = torch.randn(batch_size, model.mem_dim, H, W, device=device)
+    return {
+        "maskmem_features": maskmem_features.to(torch.bfloat16).to(storage_device),
+        "maskmem_pos_enc": maskmem_pos_enc,
+        "obj_ptr": torch.randn(batch_size, model.hidden_dim, device=device),
+    }
+
+
+def run_tracking(model, args, device, memory_bank=None):
+    """Track `args.num_frames` frames and return the per-frame times (and the outputs)."""
+    # same random memories in every run
+    torch.manual_seed(0)
+    storage_device = torch.device("cpu") if args.offload_to_cpu else device
+    B, C = args.batch_size, model.hidden_dim
+    H = W = model.image_size // 16
+    maskmem_pos_enc = [torch.randn(B, model.mem_dim, H, W, device=device)]
+    output_dict = {
+        "cond_frame_outputs": {
+            0: _random_output(model, B, (H, W), maskmem_pos_enc, device, storage_device)
+        },
+        "non_cond_frame_outputs": {},
+    }
+    curr = [torch.randn(H * W, B, C, device=device)]
+    curr_pos = [torch.randn(H * W, B, C, device=device)]
+
+    times, outputs = [], []
+    for frame_idx in range(1, args.num_frames):
+        _sync(device)
+        start = time.perf_counter()
+        pix_feat = model._prepare_memory_conditioned_features(
+            frame_idx=frame_idx,
+            is_init_cond_frame=False,
+            current_vision_feats=curr,
+            current_vision_pos_embeds=curr_pos,
+            feat_sizes=[(H, W)],
+            output_dict=output_dict,
+            num_frames=args.num_frames,
+            memory_bank=memory_bank,
+        )
+        _sync(device)
+        times.append(time.perf_counter() - start)
+        if frame_idx == args.num_frames - 1:
+            outputs.append(pix_feat)
+        # the memory of the frame just tracked
+        output_dict["non_cond_frame_outputs"][frame_idx] = _random_output(
+            model, B, (H, W), maskmem_pos_enc, device, storage_device
+        )
+    return times, outputs
+
+
+def summarize(times, warmup):
+    steady = np.array(times[warmup:]) * 1000
+    return {
+        "mean_ms": float(steady.mean()),
+        "median_ms": float(np.median(steady)),
+        "p90_ms": float(np.percentile(steady, 90)),
+    }
+
+
+def main(args):
+    device = torch.device(args.device)
+    model = build_sam2(args.sam2_cfg, None, device=device)
+    if args.skip_attention:
+        model.memory_attention = _NoAttention()
+    # the memory window is full after num_maskmem frames (and the pointers after
+    # max_obj_ptrs_in_encoder frames), so only time the frames after that
+    warmup = max(model.num_maskmem, model.max_obj_ptrs_in_encoder)
+
+    results = {"config": args.sam2_cfg, "device": str(device), "frames": args.num_frames}
+    with torch.inference_mode(), torch.autocast(
+        device_type=device.type, dtype=torch.bfloat16, enabled=device.type == "cuda"
+    ):
+        concat_times, concat_out = run_tracking(model, args, device)
+        memory_bank = MemoryTokenBank(
+            max_extra_tokens=model.max_obj_ptrs_in_encoder
+            * (model.hidden_dim // model.mem_dim)
+        )
+        bank_times, bank_out = run_tracking(model, args, device, memory_bank)
+
+    results["concat"] = summarize(concat_times, warmup)
+    results["memory_bank"] = summarize(bank_times, warmup)
+    results["memory_bank"]["reallocs"] = memory_bank.num_reallocs
+    results["memory_bank"]["slot_writes"] = memory_bank.num_slot_writes
+    results["max_abs_diff"] = float(
+        (concat_out[0].float() - bank_out[0].float()).abs().max()
+    )
+    for name in ("concat", "memory_bank"):
+        print(
+            f"{name}: mean {results[name]['mean_ms']:.2f} ms, "
+            f"median {results[name]['median_ms']:.2f} ms, p90 {results[name]['p90_ms']:.2f} ms per frame"
+        )
+    print(
+        f"memory bank: {memory_bank.num_reallocs} reallocations, "
+        f"{memory_bank.num_slot_writes} slot writes over {args.num_frames - 1} frames; "
+        f"max abs diff of the conditioned features {results['max_abs_diff']:.2e}"
+    )
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_t.yaml",
+        help="SAM 2 model configuration file (weights are randomly initialized)",
+    )
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--num_frames", type=int, default=60)
+    parser.add_argument("--batch_size", type=int, default=1, help="objects tracked together")
+    parser.add_argument(
+        "--offload_to_cpu",
+        action="store_true",
+        help="keep the memory features in CPU memory (as with offload_state_to_cpu=True)",
+    )
+    parser.add_argument(
+        "--skip_attention",
+        action="store_true",
+        help="replace the memory attention with a no-op to time the memory assembly only",
+    )
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    main(args)
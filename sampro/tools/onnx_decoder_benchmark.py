@@ -0,0 +1,149 @@
+# Per-click latency of the prompt encoder + mask decoder: PyTorch eager vs ONNX Runtime.
+#
+# Simulates interactive clicking as in the labeling tool: on each image, a sequence
+# of clicks where the first click asks for three masks and every later click passes
+# the best previous low-res mask back as mask input and asks for one mask. Each
+# click is timed end to end (prompt transforms, decoding and upscaling to the image
+# size) for `SAM2ImagePredictor.predict` and for `OnnxPromptDecoder.predict` with
+# each ONNX model (see tools/export_onnx_decoder.py), and the ONNX masks are
+# compared with the eager masks.
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from sam2.utils.onnx import OnnxPromptDecoder
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_images(args):
+    if args.image_dir is None:
+        rng = np.random.default_rng(0)
+        return {"random": rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)}
+    import cv2
+
+    names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return {
+        name: cv2.cvtColor(cv2.imread(os.path.join(args.image_dir, name)), cv2.COLOR_BGR2RGB)
+        for name in names[: args.max_images]
+    }
+
+
+def click_sequence(image, num_clicks, seed):
+    rng = np.random.default_rng(seed)
+    h, w = image.shape[:2]
+    coords = rng.uniform([0.2 * w, 0.2 * h], [0.8 * w, 0.8 * h], (num_clicks, 2))
+    labels = np.ones(num_clicks, dtype=np.int64)
+    labels[2::3] = 0  # every third click is a background click
+    return coords, labels
+
+
+def run_clicks(predict, coords, labels):
+    """Run the click sequence with `predict`; return the per-click times and masks."""
+    times, masks_out = [], []
+    logits = scores = None
+    for i in range(1, len(coords) + 1):
+        kwargs = {"point_coords": coords[:i], "point_labels": labels[:i]}
+        if logits is None:
+            kwargs["multimask_output"] = True
+        else:
+            kwargs["mask_input"] = logits[np.argmax(scores)][None]
+            kwargs["multimask_output"] = False
+        start = time.perf_counter()
+        masks, scores, logits = predict(**kwargs)
+        times.append(time.perf_counter() - start)
+        masks_out.append(masks[np.argmax(scores)])
+    return times, masks_out
+
+
+def mask_iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def main(args):
+    torch.set_num_threads(args.num_threads)
+    model = build_sam2(args.sam2_cfg, args.sam2_checkpoint, device="cpu")
+    predictor = SAM2ImagePredictor(model)
+    name = os.path.splitext(args.sam2_checkpoint)[0]
+    onnx_paths = args.onnx or [
+        p for p in (f"{name}.decoder.onnx", f"{name}.decoder.int8.onnx") if os.path.isfile(p)
+    ]
+    backends = {"eager": predictor.predict}
+    for path in onnx_paths:
+        decoder = OnnxPromptDecoder(path, num_threads=args.num_threads)
+        backends[os.path.basename(path)] = (
+            lambda decoder=decoder, **kwargs: decoder.predict(predictor, **kwargs)
+        )
+
+    times = {backend: [] for backend in backends}
+    ious = {backend: [] for backend in backends}
+    with torch.inference_mode():
+        for image_idx, (image_name, image) in enumerate(load_images(args).items()):
+            predictor.set_image(image)
+            coords, labels = click_sequence(image, args.num_clicks, image_idx)
+            reference = None
+            for backend, predict in backends.items():
+                # warm up
+                run_clicks(predict, coords[:2], labels[:2])
+                backend_times, masks = run_clicks(predict, coords, labels)
+                times[backend] += backend_times
+                if reference is None:
+                    reference = masks
+                ious[backend] += [mask_iou(a, b) for a, b in zip(masks, reference)]
+
+    results = {"config": args.sam2_cfg, "num_threads": args.num_threads}
+    for backend in backends:
+        t = np.array(times[backend]) * 1000
+        results[backend] = {
+            "median_ms": float(np.median(t)),
+            "p90_ms": float(np.percentile(t, 90)),
+            "mean_iou_vs_eager": float(np.mean(ious[backend])),
+            "min_iou_vs_eager": float(np.min(ious[backend])),
+        }
+        r = results[backend]
+        print(
+            f"{backend}: median {r['median_ms']:.1f} ms, p90 {r['p90_ms']:.1f} ms per click, "
+            f"mask IoU vs eager mean {r['mean_iou_vs_eager']:.4f} (min {r['min_iou_vs_eager']:.4f})"
+        )
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--onnx",
+        type=str,
+        nargs="+",
+        default=None,
+        help="ONNX decoders to compare (by default the ones exported next to the checkpoint)",
+    )
+    parser.add_argument("--image_dir", type=str, default=None, help="images to click on (a random image by default)")
+    parser.add_argument("--max_images", type=int, default=10)
+    parser.add_argument("--num_clicks", type=int, default=8, help="clicks per image")
+    parser.add_argument("--num_threads", type=int, default=os.cpu_count(), help="CPU threads for both backends")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    main(args)
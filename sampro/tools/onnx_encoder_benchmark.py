@@ -0,0 +1,155 @@
+# Parity and throughput of the ONNX image encoder vs PyTorch eager on CPU.
+#
+# For each ONNX model exported with tools/export_onnx_encoder.py, and for each image
+# (of --image_dir, or random images), this compares the image features computed by
+# `SAM2ImagePredictor.set_image` with the PyTorch encoder (cosine similarity of the
+# image embedding and of the high-res features) and the masks predicted from a grid
+# of single-point prompts (mask IoU). It also reports the `set_image` latency and the
+# `set_image_batch` throughput (images/sec) of every backend.
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from sam2.utils.onnx import OnnxImageEncoder
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_images(args):
+    if args.image_dir is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(args.max_images)]
+    import cv2
+
+    names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [
+        cv2.cvtColor(cv2.imread(os.path.join(args.image_dir, name)), cv2.COLOR_BGR2RGB)
+        for name in names[: args.max_images]
+    ]
+
+
+def cosine_similarity(a, b):
+    a, b = a.flatten().double(), b.flatten().double()
+    return float(torch.dot(a, b) / (a.norm() * b.norm()))
+
+
+def grid_masks(predictor, image, points_per_side):
+    h, w = image.shape[:2]
+    offsets = (np.arange(points_per_side) + 0.5) / points_per_side
+    xs, ys = np.meshgrid(offsets * w, offsets * h)
+    points = np.stack([xs.ravel(), ys.ravel()], axis=-1)
+    masks, _, _ = predictor.predict(
+        point_coords=points[:, None, :],
+        point_labels=np.ones((len(points), 1), dtype=np.int64),
+        multimask_output=False,
+    )
+    return masks[:, 0] > 0
+
+
+def mask_ious(masks_a, masks_b):
+    inter = np.logical_and(masks_a, masks_b).sum(axis=(-2, -1))
+    union = np.logical_or(masks_a, masks_b).sum(axis=(-2, -1))
+    return np.where(union > 0, inter / np.maximum(union, 1), 1.0)
+
+
+def main(args):
+    torch.set_num_threads(args.num_threads)
+    model = build_sam2(args.sam2_cfg, args.sam2_checkpoint, device="cpu")
+    name = os.path.splitext(args.sam2_checkpoint)[0]
+    onnx_paths = args.onnx or [
+        p for p in (f"{name}.encoder.onnx", f"{name}.encoder.int8.onnx") if os.path.isfile(p)
+    ]
+    predictors = {"eager": SAM2ImagePredictor(model)}
+    for path in onnx_paths:
+        predictors[os.path.basename(path)] = SAM2ImagePredictor(
+            model, image_encoder=OnnxImageEncoder(path, num_threads=args.num_threads)
+        )
+    images = load_images(args)
+
+    results = {"config": args.sam2_cfg, "num_threads": args.num_threads, "images": len(images)}
+    stats = {backend: {"latency": [], "cos_embed": [], "cos_high_res": [], "iou": []} for backend in predictors}
+    with torch.inference_mode():
+        for image in images:
+            reference = None
+            for backend, predictor in predictors.items():
+                start = time.perf_counter()
+                predictor.set_image(image)
+                stats[backend]["latency"].append(time.perf_counter() - start)
+                feats = [*predictor._features["high_res_feats"], predictor._features["image_embed"]]
+                masks = grid_masks(predictor, image, args.points_per_side)
+                if reference is None:
+                    reference = (feats, masks)
+                stats[backend]["cos_embed"].append(cosine_similarity(feats[-1], reference[0][-1]))
+                stats[backend]["cos_high_res"].append(
+                    min(cosine_similarity(f, r) for f, r in zip(feats[:-1], reference[0][:-1]))
+                )
+                stats[backend]["iou"] += mask_ious(masks, reference[1]).tolist()
+
+        batch = [images[i % len(images)] for i in range(args.batch_size)]
+        for backend, predictor in predictors.items():
+            predictor.set_image_batch(batch[:1])  # warm up
+            start = time.perf_counter()
+            predictor.set_image_batch(batch)
+            stats[backend]["images_per_s"] = len(batch) / (time.perf_counter() - start)
+
+    for backend, s in stats.items():
+        # the first image includes the warm-up of each backend
+        latency = np.array(s["latency"][1:] or s["latency"]) * 1000
+        results[backend] = {
+            "set_image_ms": float(np.median(latency)),
+            "images_per_s": s["images_per_s"],
+            "min_cos_image_embed": float(np.min(s["cos_embed"])),
+            "min_cos_high_res_feats": float(np.min(s["cos_high_res"])),
+            "mean_mask_iou": float(np.mean(s["iou"])),
+            "p5_mask_iou": float(np.percentile(s["iou"], 5)),
+        }
+        r = results[backend]
+        print(
+            f"{backend}: set_image {r['set_image_ms']:.0f} ms, "
+            f"{r['images_per_s']:.2f} images/s (batch of {args.batch_size}), "
+            f"cosine vs eager: embedding {r['min_cos_image_embed']:.5f}, "
+            f"high-res {r['min_cos_high_res_feats']:.5f} (min over images), "
+            f"mask IoU mean {r['mean_mask_iou']:.4f} (5th percentile {r['p5_mask_iou']:.4f})"
+        )
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--onnx",
+        type=str,
+        nargs="+",
+        default=None,
+        help="ONNX encoders to compare (by default the ones exported next to the checkpoint)",
+    )
+    parser.add_argument("--image_dir", type=str, default=None, help="images to compare on (random images by default)")
+    parser.add_argument("--max_images", type=int, default=5)
+    parser.add_argument("--points_per_side", type=int, default=4, help="point prompts per image side")
+    parser.add_argument("--batch_size", type=int, default=4, help="batch size of the throughput run")
+    parser.add_argument("--num_threads", type=int, default=os.cpu_count(), help="CPU threads for all backends")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    main(args)
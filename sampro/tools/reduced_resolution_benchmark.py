@@ -0,0 +1,159 @@
+# Accuracy vs latency of SAM 2 at reduced input resolutions (see `build_sam2(image_size=...)`).
+#
+# Builds the model at each --image_sizes resolution (the first one is the reference,
+# 1024 by default) and, on each image, times `set_image` and a click, and compares
+# the masks with the reference resolution. The prompts are a grid of single clicks
+# (the best of the three masks is kept, like the first click in the labeling tool)
+# and, to cover box labeling, the bounding box of each reference mask. The report
+# gives, per resolution, the median latencies, the speedup and the mask IoU against
+# the reference (mean, and the 10th percentile to catch thin and small objects),
+# to choose the resolution per labeling station.
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from sam2.build_sam import build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_images(args):
+    if args.image_dir is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(args.max_images)]
+    import cv2
+
+    names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [
+        cv2.cvtColor(cv2.imread(os.path.join(args.image_dir, name)), cv2.COLOR_BGR2RGB)
+        for name in names[: args.max_images]
+    ]
+
+
+def grid_points(image, points_per_side):
+    h, w = image.shape[:2]
+    offsets = (np.arange(points_per_side) + 0.5) / points_per_side
+    xs, ys = np.meshgrid(offsets * w, offsets * h)
+    return np.stack([xs.ravel(), ys.ravel()], axis=-1)
+
+
+def click_masks(predictor, points):
+    """Best of the three masks for each single click, and the time of one click."""
+    start = time.perf_counter()
+    predictor.predict(point_coords=points[:1], point_labels=np.ones(1), multimask_output=True)
+    click_time = time.perf_counter() - start
+    masks, scores, _ = predictor.predict(
+        point_coords=points[:, None, :],
+        point_labels=np.ones((len(points), 1)),
+        multimask_output=True,
+    )
+    return masks[np.arange(len(points)), scores.argmax(axis=-1)] > 0, click_time
+
+
+def box_masks(predictor, boxes):
+    if len(boxes) == 0:
+        return np.zeros((0, *predictor._orig_hw[-1]), dtype=bool)
+    masks, _, _ = predictor.predict(box=boxes, multimask_output=False)
+    return masks.reshape(len(boxes), *masks.shape[-2:]) > 0
+
+
+def mask_boxes(masks):
+    boxes = []
+    for mask in masks:
+        ys, xs = np.nonzero(mask)
+        if len(xs) > 0:
+            boxes.append([xs.min(), ys.min(), xs.max(), ys.max()])
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def mask_ious(masks_a, masks_b):
+    inter = np.logical_and(masks_a, masks_b).sum(axis=(-2, -1))
+    union = np.logical_or(masks_a, masks_b).sum(axis=(-2, -1))
+    return np.where(union > 0, inter / np.maximum(union, 1), 1.0)
+
+
+def main(args):
+    torch.set_num_threads(args.num_threads)
+    images = load_images(args)
+    reference = []  # per image: (click masks, boxes, box masks)
+    results = {"config": args.sam2_cfg, "num_threads": args.num_threads, "images": len(images)}
+    with torch.inference_mode():
+        for image_size in args.image_sizes:
+            model = build_sam2(args.sam2_cfg, args.sam2_checkpoint, device="cpu", image_size=image_size)
+            predictor = SAM2ImagePredictor(model)
+            predictor.set_image(images[0])  # warm up
+            encode_times, click_times, click_ious, box_ious = [], [], [], []
+            for i, image in enumerate(images):
+                start = time.perf_counter()
+                predictor.set_image(image)
+                encode_times.append(time.perf_counter() - start)
+                clicks, click_time = click_masks(predictor, grid_points(image, args.points_per_side))
+                click_times.append(click_time)
+                if len(reference) <= i:
+                    boxes = mask_boxes(clicks)
+                    reference.append((clicks, boxes, box_masks(predictor, boxes)))
+                ref_clicks, ref_boxes, ref_box_masks = reference[i]
+                click_ious += mask_ious(clicks, ref_clicks).tolist()
+                box_ious += mask_ious(box_masks(predictor, ref_boxes), ref_box_masks).tolist()
+
+            results[str(image_size)] = {
+                "set_image_ms": float(np.median(encode_times) * 1000),
+                "click_ms": float(np.median(click_times) * 1000),
+                "mean_click_iou": float(np.mean(click_ious)),
+                "p10_click_iou": float(np.percentile(click_ious, 10)),
+                "mean_box_iou": float(np.mean(box_ious)) if box_ious else None,
+                "p10_box_iou": float(np.percentile(box_ious, 10)) if box_ious else None,
+            }
+            del model, predictor
+
+    reference_ms = results[str(args.image_sizes[0])]["set_image_ms"]
+    print(f"{'size':>6} {'set_image':>10} {'speedup':>8} {'click':>8} {'click IoU':>16} {'box IoU':>16}")
+    for image_size in args.image_sizes:
+        r = results[str(image_size)]
+        r["speedup"] = reference_ms / r["set_image_ms"]
+        box_iou = "-" if r["mean_box_iou"] is None else f"{r['mean_box_iou']:.3f} / {r['p10_box_iou']:.3f}"
+        print(
+            f"{image_size:>6} {r['set_image_ms']:>8.0f}ms {r['speedup']:>7.2f}x {r['click_ms']:>6.0f}ms "
+            f"{r['mean_click_iou']:>7.3f} / {r['p10_click_iou']:.3f} {box_iou:>16}"
+        )
+    print(f"IoU against {args.image_sizes[0]}: mean / 10th percentile")
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--image_sizes",
+        type=int,
+        nargs="+",
+        default=[1024, 768, 512],
+        help="model input sizes to compare; the first one is the reference",
+    )
+    parser.add_argument("--image_dir", type=str, default=None, help="sample images (random images by default)")
+    parser.add_argument("--max_images", type=int, default=10)
+    parser.add_argument("--points_per_side", type=int, default=4, help="click prompts per image side")
+    parser.add_argument("--num_threads", type=int, default=os.cpu_count(), help="CPU threads")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,148 @@
+# Startup benchmark of the model build: checkpoint vs model snapshot.
+#
+# Each measurement runs in a fresh Python process and reports the import time and
+# the time to build the model (image model with `build_sam2`, or the video predictor
+# with `build_sam2_video_predictor`):
+# - "checkpoint": Hydra compose + instantiate (random init) + loading the checkpoint;
+# - "snapshot_first": the same, plus writing the model snapshot to --snapshot_dir;
+# - "snapshot": materializing the model from the snapshot (memory-mapped weights).
+# The OS page cache is not dropped between runs, so disk reads of a truly cold start
+# are only included in the first run of each mode.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SAMPRO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(args):
+    start = time.perf_counter()
+    import torch
+
+    from sam2.build_sam import build_sam2, build_sam2_video_predictor
+
+    imported = time.perf_counter()
+    builder = build_sam2_video_predictor if args.video else build_sam2
+    model = builder(
+        args.sam2_cfg,
+        args.sam2_checkpoint,
+        device=args.device,
+        snapshot_dir=args.snapshot_dir,
+    )
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    built = time.perf_counter()
+    num_params = sum(p.numel() for p in model.parameters())
+    print(
+        json.dumps(
+            {
+                "import_s": imported - start,
+                "build_s": built - imported,
+                "num_params": num_params,
+            }
+        )
+    )
+
+
+def run_child(args, snapshot_dir):
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        "--sam2_cfg",
+        args.sam2_cfg,
+        "--sam2_checkpoint",
+        args.sam2_checkpoint,
+        "--device",
+        args.device,
+    ]
+    if args.video:
+        cmd.append("--video")
+    if snapshot_dir is not None:
+        cmd += ["--snapshot_dir", snapshot_dir]
+    start = time.perf_counter()
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    row = json.loads(out.strip().splitlines()[-1])
+    row["process_s"] = time.perf_counter() - start
+    return row
+
+
+def summarize(rows):
+    return {
+        key: float(np.median([row[key] for row in rows]))
+        for key in ("import_s", "build_s", "process_s")
+    }
+
+
+def main(args):
+    tmp_dir = None
+    snapshot_dir = args.snapshot_dir
+    if snapshot_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix="sam2_snapshots_")
+        snapshot_dir = tmp_dir
+    try:
+        results = {"config": args.sam2_cfg, "video": args.video, "device": args.device}
+        results["checkpoint"] = summarize(
+            [run_child(args, None) for _ in range(args.repeats)]
+        )
+        # start without a snapshot for this model, so the first build writes it
+        for name in os.listdir(snapshot_dir):
+            if name.startswith(os.path.splitext(os.path.basename(args.sam2_checkpoint))[0]):
+                shutil.rmtree(os.path.join(snapshot_dir, name))
+        results["snapshot_first"] = summarize([run_child(args, snapshot_dir)])
+        results["snapshot"] = summarize(
+            [run_child(args, snapshot_dir) for _ in range(args.repeats)]
+        )
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for mode in ("checkpoint", "snapshot_first", "snapshot"):
+        r = results[mode]
+        print(
+            f"{mode}: import {r['import_s']:.2f}s, build {r['build_s']:.2f}s, "
+            f"process {r['process_s']:.2f}s"
+        )
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/sam2.1/sam2.1_hiera_l.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default=os.path.join(SAMPRO_ROOT, "checkpoints", "sam2.1_hiera_large.pt"),
+        help="path to the SAM 2 model checkpoint",
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--video", action="store_true", help="build the video predictor")
+    parser.add_argument(
+        "--snapshot_dir",
+        type=str,
+        default=None,
+        help="snapshot directory (a temporary directory by default)",
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="runs per mode (median is reported)")
+    parser.add_argument("--output_json", type=str, default=None, help="optional file to write results to")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
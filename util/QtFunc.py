@@ -78,6 +78,17 @@ def list_label(label_path):
     return list_labels,list_box
 
 
+# 读取 XML 标注中记录的图像尺寸，缺失时返回 (0, 0)
+def label_size(label_path):
+    root = ET.parse(label_path).getroot()
+    try:
+        width = int(root.find('size/width').text)
+        height = int(root.find('size/height').text)
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0
+    return width, height
+
+
 def get_labels(label_path):
     with open(label_path, 'r') as file:
         content = file.read()
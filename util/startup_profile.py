@@ -0,0 +1,77 @@
+"""Optional startup profiling enabled with ``Run.py --profile-startup``.
+
+Records the time of each startup phase and the time spent in imports, and prints
+a breakdown once the models are loaded. All functions are no-ops unless
+:func:`enable` was called.
+"""
+from __future__ import annotations
+
+import builtins
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+_start: Optional[float] = None
+_phases: List[Tuple[str, float, str]] = []
+_import_times: Dict[str, float] = defaultdict(float)
+_import_state = threading.local()
+_total_import_time = [0.0]
+_reported = False
+
+
+def enabled() -> bool:
+    return _start is not None
+
+
+def enable() -> None:
+    """Start the clock and time every import made from now on."""
+    global _start
+    if _start is not None:
+        return
+    _start = time.perf_counter()
+    original_import = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        # Times are cumulative (a module includes the modules it imports); only the
+        # outermost imports are added to the total.
+        depth = getattr(_import_state, "depth", 0)
+        _import_state.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            _import_state.depth = depth
+            _import_times[name] += elapsed
+            if depth == 0:
+                _total_import_time[0] += elapsed
+
+    builtins.__import__ = timed_import
+
+
+def mark(phase: str) -> None:
+    """Record the end of a startup phase; phases are reported in the order they end."""
+    if _start is None:
+        return
+    _phases.append((phase, time.perf_counter(), threading.current_thread().name))
+
+
+def report(top_imports: int = 15) -> None:
+    """Print the phase and import-time breakdown (only once)."""
+    global _reported
+    if _start is None or _reported:
+        return
+    _reported = True
+    print("启动耗时分解（秒）：")
+    print(f"{'阶段':<20}{'结束时刻':>10}{'耗时':>10}  线程")
+    previous = _start
+    for phase, end, thread_name in sorted(_phases, key=lambda p: p[1]):
+        print(f"{phase:<20}{end - _start:>10.2f}{end - previous:>10.2f}  {thread_name}")
+        previous = end
+    print(f"导入模块共 {_total_import_time[0]:.2f}s，累计耗时最多的 {top_imports} 个：")
+    for name, seconds in sorted(_import_times.items(), key=lambda kv: -kv[1])[:top_imports]:
+        print(f"  {name:<40}{seconds:>8.2f}")
@@ -0,0 +1,282 @@
+"""Multi-resolution tile pyramid of a large image, cached on disk.
+
+Level 0 is the image at native resolution and every following level halves the
+previous one, down to a level that fits in a single tile. Each level is cut into
+``tile_size`` x ``tile_size`` tiles stored as separate files, so a viewer only
+has to decode the tiles that are visible at the current zoom. The pyramid is
+built once per image (the source file is decoded a single time) and reused while
+the file's path, size and modification time are unchanged.
+
+Images are read with Pillow rather than ``cv2.imread``: OpenCV refuses images
+above 2**30 pixels, and Pillow stores a decoded image in blocks instead of one
+contiguous buffer. The image size comes from the file header, so a viewer can
+lay out the whole image before any pixel is decoded.
+
+This module has no Qt dependency; the viewer lives in ``GUI/tiled_viewer.py``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from util.config import CONFIG_DIR
+
+DEFAULT_TILE_SIZE = 512
+DEFAULT_TILE_CACHE_DIR = CONFIG_DIR / "tile_cache"
+TILE_EXTENSION = ".jpg"
+TILE_JPEG_QUALITY = 95
+METADATA_FILENAME = "pyramid.json"
+
+
+def open_large_image(image_path: str) -> Image.Image:
+    """Open an image with Pillow's decompression bomb check lifted.
+
+    Only the header is read until the pixels are accessed. ``Image.MAX_IMAGE_PIXELS``
+    (about 179 megapixels) guards against untrusted files and would reject the
+    gigapixel images this module is for.
+    """
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(image_path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def read_image_size(image_path: str) -> Tuple[int, int]:
+    """(width, height) of an image, read from its header without decoding it."""
+    with open_large_image(image_path) as image:
+        return image.size
+
+
+class TilePyramid:
+    """Disk layout, construction and tile access of the pyramid of one image."""
+
+    def __init__(
+        self,
+        image_path: str,
+        cache_root: Optional[Path] = None,
+        tile_size: int = DEFAULT_TILE_SIZE,
+    ) -> None:
+        self.image_path = os.path.abspath(image_path)
+        self.tile_size = tile_size
+        stat = os.stat(self.image_path)
+        key = f"{self.image_path}|{stat.st_size}|{stat.st_mtime_ns}|{tile_size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        stem = Path(self.image_path).stem
+        self.directory = Path(cache_root or DEFAULT_TILE_CACHE_DIR) / f"{stem}-{digest}"
+
+        self.width = 0
+        self.height = 0
+        self.level_count = 0
+        # Levels whose tiles are all on disk; coarse levels are written first.
+        self.ready_levels: List[int] = []
+        self._read_metadata()
+        if not self.level_count:
+            self.width, self.height = read_image_size(self.image_path)
+            self.level_count = self.count_levels(self.width, self.height, tile_size)
+
+    # ------------------------------------------------------------------
+    # Geometry
+    # ------------------------------------------------------------------
+    @staticmethod
+    def count_levels(width: int, height: int, tile_size: int) -> int:
+        """Number of levels needed until the image fits in one tile."""
+        longest = max(width, height, 1)
+        levels = 1
+        while longest > tile_size:
+            longest = (longest + 1) // 2
+            levels += 1
+        return levels
+
+    def level_size(self, level: int) -> Tuple[int, int]:
+        """(width, height) of ``level``; sizes are rounded up like the halving resize."""
+        width, height = self.width, self.height
+        for _ in range(level):
+            width, height = max(1, (width + 1) // 2), max(1, (height + 1) // 2)
+        return width, height
+
+    def level_scale(self, level: int) -> Tuple[float, float]:
+        """Native pixels per pixel of ``level`` along x and y."""
+        width, height = self.level_size(level)
+        return self.width / width, self.height / height
+
+    def tile_grid(self, level: int) -> Tuple[int, int]:
+        """(columns, rows) of tiles in ``level``."""
+        width, height = self.level_size(level)
+        return (
+            int(math.ceil(width / self.tile_size)),
+            int(math.ceil(height / self.tile_size)),
+        )
+
+    def level_for_scale(self, scale: float) -> int:
+        """Coarsest level that still has at least one level pixel per screen pixel.
+
+        ``scale`` is the number of screen pixels per native pixel.
+        """
+        if scale <= 0:
+            return self.level_count - 1
+        level = int(math.floor(math.log2(1.0 / scale))) if scale < 1.0 else 0
+        return min(max(level, 0), self.level_count - 1)
+
+    def tile_rect(self, level: int, col: int, row: int) -> Tuple[float, float, float, float]:
+        """Native-resolution rectangle (x0, y0, x1, y1) covered by a tile."""
+        width, height = self.level_size(level)
+        scale_x, scale_y = self.level_scale(level)
+        x0, y0 = col * self.tile_size, row * self.tile_size
+        x1, y1 = min(x0 + self.tile_size, width), min(y0 + self.tile_size, height)
+        return x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y
+
+    def tiles_in_rect(
+        self, level: int, x0: float, y0: float, x1: float, y1: float
+    ) -> List[Tuple[int, int]]:
+        """(col, row) of the tiles of ``level`` intersecting a native-resolution rect."""
+        cols, rows = self.tile_grid(level)
+        scale_x, scale_y = self.level_scale(level)
+        span = self.tile_size
+        col0 = max(0, int(x0 / scale_x // span))
+        row0 = max(0, int(y0 / scale_y // span))
+        col1 = min(cols - 1, int(max(x1 - 1e-6, 0) / scale_x // span))
+        row1 = min(rows - 1, int(max(y1 - 1e-6, 0) / scale_y // span))
+        return [(col, row) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+
+    # ------------------------------------------------------------------
+    # Disk cache
+    # ------------------------------------------------------------------
+    def tile_path(self, level: int, col: int, row: int) -> Path:
+        return self.directory / str(level) / f"{col}_{row}{TILE_EXTENSION}"
+
+    def is_built(self) -> bool:
+        return self.level_count > 0 and len(self.ready_levels) == self.level_count
+
+    def read_tile(self, level: int, col: int, row: int) -> Optional[np.ndarray]:
+        """Decode one tile (BGR), or None when it is not on disk yet."""
+        path = self.tile_path(level, col, row)
+        if not path.exists():
+            return None
+        return cv2.imread(str(path), cv2.IMREAD_COLOR)
+
+    def _read_metadata(self) -> None:
+        try:
+            with (self.directory / METADATA_FILENAME).open("r", encoding="utf-8") as fh:
+                metadata = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.width = metadata["width"]
+        self.height = metadata["height"]
+        self.level_count = metadata["level_count"]
+        self.ready_levels = list(metadata.get("ready_levels", []))
+
+    def _write_metadata(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        metadata = {
+            "image_path": self.image_path,
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "level_count": self.level_count,
+            "ready_levels": self.ready_levels,
+        }
+        with (self.directory / METADATA_FILENAME).open("w", encoding="utf-8") as fh:
+            json.dump(metadata, fh, indent=2)
+
+    def build(self, level_ready: Optional[Callable[[int], None]] = None) -> None:
+        """Decode the source image once and write the tiles of all missing levels.
+
+        Levels are written from the coarsest to the finest so that a viewer can
+        show the whole image early; ``level_ready(level)`` is called after each one.
+        Each level is reduced directly from the source and freed once its tiles are
+        written, so at most the source and one level (a quarter of it) are in memory.
+        """
+        if self.is_built():
+            return
+        with open_large_image(self.image_path) as source:
+            source.load()
+            image = source if source.mode == "RGB" else source.convert("RGB")
+            self.width, self.height = image.size
+            self.level_count = self.count_levels(self.width, self.height, self.tile_size)
+            self.ready_levels = [level for level in self.ready_levels if level < self.level_count]
+            self._write_metadata()
+
+            for level in reversed(range(self.level_count)):
+                if level not in self.ready_levels:
+                    # A box filter over 2**level pixels; its size is rounded up like level_size.
+                    level_image = image.reduce(2 ** level) if level else image
+                    self._write_level(level, level_image)
+                    del level_image
+                    self.ready_levels.append(level)
+                    self._write_metadata()
+                if level_ready is not None:
+                    level_ready(level)
+
+    def _write_level(self, level: int, image: Image.Image) -> None:
+        level_dir = self.directory / str(level)
+        level_dir.mkdir(parents=True, exist_ok=True)
+        cols, rows = self.tile_grid(level)
+        width, height = image.size
+        span = self.tile_size
+        for row in range(rows):
+            for col in range(cols):
+                box = (col * span, row * span, min((col + 1) * span, width), min((row + 1) * span, height))
+                path = self.tile_path(level, col, row)
+                # Write to a temporary name first: a viewer may read tiles concurrently.
+                tmp_path = path.with_name(f".{path.name}")
+                image.crop(box).save(tmp_path, "JPEG", quality=TILE_JPEG_QUALITY)
+                os.replace(tmp_path, path)
+
+
+class TileCache:
+    """Thread-safe LRU cache of decoded tiles, bounded by a memory budget in bytes.
+
+    Values can be any object; ``size_of`` gives their size (``nbytes`` by default).
+    """
+
+    def __init__(self, budget_bytes: int, size_of: Optional[Callable[[object], int]] = None) -> None:
+        self.budget_bytes = budget_bytes
+        self.size_of = size_of or (lambda value: value.nbytes)
+        self.used_bytes = 0
+        self._entries: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value) -> None:
+        size = self.size_of(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.used_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.used_bytes += size
+            # Keep at least the newest tile even if it alone exceeds the budget.
+            while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.used_bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0